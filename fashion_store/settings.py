@@ -78,6 +78,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'shop.context_processors.cart',  # Custom context processor for cart
+                'shop.context_processors.fragment_cache',  # Currency and timeout for cached product cards
             ],
         },
     },
@@ -225,9 +226,70 @@ LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Cache
+# Local memory by default (per process). To share cached fragments between workers without
+# extra services, use a file-based cache:
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache CACHE_LOCATION=/var/tmp/fashion_store_cache
+# The catalog, shipping and currency versions are counted in the database (shop.versions), so
+# every worker sees changes whichever backend is used.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='fashion-store'),
+        'OPTIONS': {
+            # Room for product card fragments; the backend default (300) culls too eagerly
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    }
+}
+
+# Seconds a worker may keep using a cached catalog/shipping/currency version before re-reading it
+# from the database (a change made by another worker shows up within this time)
+VERSION_CHECK_INTERVAL = config('VERSION_CHECK_INTERVAL', default=2, cast=int)
+
+# Seconds a rendered product card stays cached (keys change whenever the product is saved)
+FRAGMENT_CACHE_TIMEOUT = config('FRAGMENT_CACHE_TIMEOUT', default=60 * 60, cast=int)
+
+# Seconds the home page sections stay cached (catalog changes refresh them immediately)
+HOME_SNAPSHOT_TIMEOUT = config('HOME_SNAPSHOT_TIMEOUT', default=15 * 60, cast=int)
+
+# Seconds listing counts and page-number boundaries stay cached (catalog changes refresh them immediately)
+PAGINATION_CACHE_TIMEOUT = config('PAGINATION_CACHE_TIMEOUT', default=60 * 60, cast=int)
+
+# Product image derivatives (resized WebP/JPEG copies built by shop.images)
+# Built on a background thread pool after each save; set IMAGE_DERIVATIVES_ASYNC=False to build inline
+IMAGE_DERIVATIVES_ASYNC = config('IMAGE_DERIVATIVES_ASYNC', default=True, cast=bool)
+IMAGE_DERIVATIVE_WORKERS = config('IMAGE_DERIVATIVE_WORKERS', default=2, cast=int)
+
 # Session configuration for cart
 SESSION_COOKIE_AGE = 86400 * 7  # 1 week
-SESSION_SAVE_EVERY_REQUEST = True
+# Only write the session when it changes, so read-only page views don't hit the session table
+SESSION_SAVE_EVERY_REQUEST = False
+
+# Cart storage
+# 'shop.cart.DatabaseCartStorage' keeps cart lines in the CartItem table (session only holds the cart id);
+# 'shop.cart.SessionCartStorage' keeps the whole cart in the session
+CART_STORAGE = config('CART_STORAGE', default='shop.cart.DatabaseCartStorage')
+
+# Seconds an unpaid order keeps its reserved stock before release_stock_reservations cancels it
+STOCK_RESERVATION_TTL = config('STOCK_RESERVATION_TTL', default=30 * 60, cast=int)
+
+# Most destinations one batch shipping quote request may price
+SHIPPING_QUOTE_BATCH_LIMIT = config('SHIPPING_QUOTE_BATCH_LIMIT', default=1000, cast=int)
+
+# Largest pincode/rate file (bytes) the admin imports during the request; larger files time out
+# there, so they are imported with `python manage.py import_shipping_data`
+SHIPPING_ADMIN_IMPORT_MAX_SIZE = config('SHIPPING_ADMIN_IMPORT_MAX_SIZE', default=512 * 1024, cast=int)
+
+# Product sitemap chunks: ids per precompressed .xml.gz file (capped at the protocol's 50,000 URLs)
+SITEMAP_CHUNK_SIZE = config('SITEMAP_CHUNK_SIZE', default=10000, cast=int)
+# Scheme and domain written into sitemap URLs, e.g. https://www.example.com (defaults to https:// + the current Site)
+SITEMAP_BASE_URL = config('SITEMAP_BASE_URL', default='')
+
+# Product search backend
+# 'shop.search.InvertedIndexBackend' keeps a BM25-ranked in-memory index per worker;
+# 'shop.search.DatabaseSearchBackend' falls back to plain icontains SQL queries
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='shop.search.InvertedIndexBackend')
 
 # Email configuration for password reset
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
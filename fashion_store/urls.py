@@ -28,7 +28,9 @@ urlpatterns = [
     path('accounts/', include('allauth.urls')),  # Social authentication URLs
     
     # SEO URLs
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', utility_views.sitemap_index, name='sitemap_index'),
+    path('sitemap-products-<int:number>.xml.gz', utility_views.sitemap_products, name='sitemap_products'),
+    path('sitemap-<section>.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
     
     # Utility endpoints
     path('.well-known/appspecific/com.chrome.devtools.json', utility_views.chrome_devtools_config, name='chrome_devtools'),
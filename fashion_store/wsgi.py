@@ -14,4 +14,8 @@ from django.core.wsgi import get_wsgi_application
 # Use production settings by default, fall back to development
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fashion_store.production_settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Build per-worker typeahead data before the first request arrives
+from shop.suggest import warm_suggestion_index  # noqa: E402
+warm_suggestion_index()
@@ -6,16 +6,29 @@ This module customizes the Django admin interface for managing:
 - Orders and Order Items
 - Users and User Profiles
 - Reviews and Wishlists
+- Shipping zones, pincodes and rates (with Excel/CSV import)
+- Currency rates (saving one recomputes converted product prices)
 """
 
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.http import HttpResponse, HttpResponseRedirect
+from django.shortcuts import render
+from django.template.defaultfilters import filesizeformat
+from django.urls import path, reverse
 from django.utils.html import format_html
+from django.db import transaction
 from django.db.models import Sum, Count
 from .models import (
     Category, Product, UserProfile, Order, OrderItem, 
-    Review, Wishlist
+    Review, Wishlist, CartItem, ShippingZone, ShippingRate, PincodeZone, PincodeRule, CurrencyRate
+)
+from .currency import rebuild_price_book
+from .shipping_import import (
+    PINCODE_SAMPLE, RATE_SAMPLE, SHIPPING_ADMIN_IMPORT_MAX_SIZE, PincodeImporter, ShippingRateImporter,
+    write_sample
 )
 
 
@@ -71,7 +84,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = (
         'available', 'category', 'size', 'color', 'brand', 'created_at'
     )
-    search_fields = ('name', 'description', 'brand', 'category__name')
+    search_fields = ('name', 'sku', 'description', 'brand', 'category__name')
     prepopulated_fields = {'slug': ('name',)}
     readonly_fields = ('created_at', 'updated_at', 'image_preview')
     list_editable = ('price', 'stock', 'available')
@@ -79,7 +92,7 @@ class ProductAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name', 'slug', 'category', 'description')
+            'fields': ('name', 'slug', 'sku', 'category', 'description')
         }),
         ('Pricing & Inventory', {
             'fields': ('price', 'stock', 'available')
@@ -238,6 +251,188 @@ class WishlistAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
 
 
+@admin.register(CartItem)
+class CartItemAdmin(admin.ModelAdmin):
+    """Admin interface for persistent cart lines"""
+    list_display = ('product', 'user', 'cart_id', 'quantity', 'price', 'updated_at')
+    list_filter = ('updated_at',)
+    search_fields = ('user__username', 'cart_id', 'product__name')
+    readonly_fields = ('created_at', 'updated_at')
+    raw_id_fields = ('user', 'product')
+
+
+class ShippingImportMixin:
+    """Adds 'Import from Excel' and 'Download sample' views to a changelist"""
+    importer_class = None
+    # The import_shipping_data type, suggested for files too large to import here
+    import_type = None
+    import_template = None
+    import_url_name = None
+    sample_url_name = None
+    sample_rows = ()
+    sample_filename = None
+    # Errors listed after an import; the rest are only counted
+    max_reported_errors = 20
+    
+    def get_urls(self):
+        urls = [
+            path('import-excel/', self.admin_site.admin_view(self.import_excel_view), name=self.import_url_name),
+            path('export-sample/', self.admin_site.admin_view(self.export_sample_view), name=self.sample_url_name),
+        ]
+        return urls + super().get_urls()
+    
+    def changelist_url(self):
+        opts = self.model._meta
+        return reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+    
+    def get_import_max_size(self):
+        return getattr(settings, 'SHIPPING_ADMIN_IMPORT_MAX_SIZE', SHIPPING_ADMIN_IMPORT_MAX_SIZE)
+    
+    def import_excel_view(self, request):
+        """Upload form; streams the uploaded sheet through the importer"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return HttpResponseRedirect(self.changelist_url())
+        upload = request.FILES.get('excel_file') if request.method == 'POST' else None
+        max_size = self.get_import_max_size()
+        if upload is None:
+            context = {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'title': f'Import {self.model._meta.verbose_name_plural}',
+                'max_size': max_size,
+                'import_type': self.import_type,
+            }
+            return render(request, self.import_template, context)
+        # The import runs inside the request, which gunicorn kills after 30 seconds
+        if upload.size > max_size:
+            self.message_user(
+                request,
+                f'{upload.name} is {filesizeformat(upload.size)}; files over {filesizeformat(max_size)} '
+                f'are imported on the server with: python manage.py import_shipping_data '
+                f'{self.import_type} {upload.name}',
+                messages.ERROR,
+            )
+            return HttpResponseRedirect(request.path)
+        
+        importer = self.importer_class()
+        try:
+            stats = importer.run(upload, upload.name)
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return HttpResponseRedirect(request.path)
+        
+        self.message_user(
+            request,
+            f'Imported {upload.name}: {stats.created} created, {stats.updated} updated, '
+            f'{stats.unchanged} unchanged, {stats.errors} errors.',
+            messages.WARNING if stats.errors else messages.SUCCESS,
+        )
+        for line, message in importer.errors[:self.max_reported_errors]:
+            self.message_user(request, f'Row {line}: {message}', messages.ERROR)
+        return HttpResponseRedirect(self.changelist_url())
+    
+    def export_sample_view(self, request):
+        """Download an .xlsx with the expected columns and example rows"""
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.sample_filename}"'
+        write_sample(response, self.sample_rows, self.model._meta.verbose_name_plural.title())
+        return response
+
+
+@admin.register(ShippingZone)
+class ShippingZoneAdmin(admin.ModelAdmin):
+    """Admin interface for Indian shipping zones"""
+    list_display = ('zone', 'cost_per_kg', 'free_shipping_threshold', 'delivery_days', 'is_active')
+    list_editable = ('cost_per_kg', 'free_shipping_threshold', 'is_active')
+
+
+@admin.register(ShippingRate)
+class ShippingRateAdmin(ShippingImportMixin, admin.ModelAdmin):
+    """Admin interface for country shipping rates"""
+    list_display = ('name', 'country', 'cost', 'min_shipping_charge', 'min_order_value',
+                    'max_order_value', 'priority', 'is_active')
+    list_filter = ('is_active', 'country')
+    search_fields = ('name', 'country')
+    change_list_template = 'admin/shippingrate_changelist.html'
+    importer_class = ShippingRateImporter
+    import_type = 'rates'
+    import_template = 'admin/import_shippingrate_excel.html'
+    import_url_name = 'shippingrate_import_excel'
+    sample_url_name = 'shippingrate_export_sample'
+    sample_rows = RATE_SAMPLE
+    sample_filename = 'shipping_rates_sample.xlsx'
+
+
+@admin.register(PincodeZone)
+class PincodeZoneAdmin(ShippingImportMixin, admin.ModelAdmin):
+    """Admin interface for pincode to zone mappings"""
+    list_display = ('pincode', 'zone', 'city', 'state', 'country')
+    list_filter = ('zone', 'country')
+    search_fields = ('pincode', 'city', 'state')
+    list_select_related = ('zone',)
+    list_per_page = 100
+    readonly_fields = ('created_at', 'updated_at')
+    change_list_template = 'admin/pincode_zone_changelist.html'
+    importer_class = PincodeImporter
+    import_type = 'pincodes'
+    import_template = 'admin/import_pincode_excel.html'
+    import_url_name = 'import_pincode_excel'
+    sample_url_name = 'export_pincode_sample'
+    sample_rows = PINCODE_SAMPLE
+    sample_filename = 'pincodes_sample.xlsx'
+
+
+@admin.register(PincodeRule)
+class PincodeRuleAdmin(admin.ModelAdmin):
+    """Admin interface for pincode prefix and range rules"""
+    list_display = ('__str__', 'zone', 'city', 'country')
+    list_filter = ('zone', 'country')
+    search_fields = ('prefix', 'range_start', 'city')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(CurrencyRate)
+class CurrencyRateAdmin(admin.ModelAdmin):
+    """Admin interface for display currencies"""
+    list_display = ('code', 'name', 'symbol', 'rate', 'decimal_places', 'rounding', 'grouping', 'is_active', 'updated_at')
+    list_editable = ('rate', 'is_active')
+    list_filter = ('is_active', 'rounding')
+    search_fields = ('code', 'name')
+    readonly_fields = ('updated_at',)
+    actions = ['rebuild_converted_prices']
+    
+    def schedule_rebuild(self, request):
+        """Recompute converted prices once, after this request's changes commit"""
+        if getattr(request, '_price_book_rebuild_scheduled', False):
+            return
+        request._price_book_rebuild_scheduled = True
+        
+        def rebuild():
+            updated = rebuild_price_book()
+            self.message_user(request, f'Converted prices recomputed for {updated} products.')
+        transaction.on_commit(rebuild)
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.schedule_rebuild(request)
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.schedule_rebuild(request)
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self.schedule_rebuild(request)
+    
+    def rebuild_converted_prices(self, request, queryset):
+        """Recompute every product's converted prices from the current rates"""
+        updated = rebuild_price_book()
+        self.message_user(request, f'Converted prices recomputed for {updated} products.')
+    rebuild_converted_prices.short_description = 'Recompute converted product prices'
+
+
 # Customize User admin to include profile
 class CustomUserAdmin(UserAdmin):
     """Custom User admin with profile inline"""
@@ -7,4 +7,5 @@ class ShopConfig(AppConfig):
     
     def ready(self):
         """Load any app initialization code here"""
+        import shop.checks
         import shop.signals
\ No newline at end of file
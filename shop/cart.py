@@ -1,27 +1,226 @@
 """
-Shopping cart functionality using Django sessions
+Shopping cart functionality
 
-This module provides a session-based shopping cart that allows users
-to add, update, and remove products without requiring authentication.
+This module provides a shopping cart that allows users to add, update,
+and remove products without requiring authentication. Cart lines are
+persisted by a pluggable storage class selected with the CART_STORAGE
+setting:
+- SessionCartStorage: the whole cart dict lives in the session
+- DatabaseCartStorage: lines live in the CartItem table; the session only
+  holds a short cart id, and logged-in users' carts follow them across devices
 """
 
+import uuid
+from datetime import timedelta
 from decimal import Decimal
+from importlib import import_module
 from django.conf import settings
-from .models import Product
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Product, CartItem
+from .shipping import get_shipping_tables
 
 
-class Cart:
-    """Session-based shopping cart"""
+DEFAULT_CART_STORAGE = 'shop.cart.SessionCartStorage'
+
+# Session key holding the cart id for anonymous database carts
+CART_ID_SESSION_KEY = 'cart_id'
+
+# Seconds an anonymous cart line is kept even if no session refers to it:
+# the request that wrote it may not have saved its session yet
+ABANDONED_CART_GRACE = 60 * 60
+ABANDONED_CART_BATCH_SIZE = 500
+
+
+class SessionCartStorage:
+    """Keep the cart dict in the session"""
+    
+    def __init__(self, request):
+        self.session = request.session
+        self.session_key = getattr(settings, 'CART_SESSION_ID', 'cart')
+    
+    def load(self):
+        """
+        Return the cart dict ({product_id: {'quantity', 'price', 'weight'}})
+
+        An empty cart is not written to the session until something is added,
+        so read-only visitors never cause a session write.
+        """
+        return self.session.get(self.session_key) or {}
+    
+    def save_item(self, product_id, item):
+        """Persist a changed cart line"""
+        self.session.setdefault(self.session_key, {})[product_id] = item
+        self.session.modified = True
+    
+    def remove_item(self, product_id):
+        """Persist a removed cart line"""
+        self.session.get(self.session_key, {}).pop(product_id, None)
+        self.session.modified = True
+    
+    def clear(self):
+        """Remove every line from the cart"""
+        if self.session.pop(self.session_key, None) is not None:
+            self.session.modified = True
+    
+    @classmethod
+    def merge_on_login(cls, request, user):
+        """Session carts survive login unchanged"""
+
+
+class DatabaseCartStorage:
+    """Keep cart lines in the CartItem table, keyed by user or session cart id"""
     
     def __init__(self, request):
-        """Initialize the cart with the current session"""
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID if hasattr(settings, 'CART_SESSION_ID') else 'cart')
+        user = getattr(request, 'user', None)
+        self.user = user if user is not None and user.is_authenticated else None
+    
+    def get_owner_filter(self, create=False):
+        """Return the CartItem filter for this cart, or None for a new anonymous cart"""
+        if self.user is not None:
+            return {'user': self.user}
+        cart_id = self.session.get(CART_ID_SESSION_KEY)
+        if not cart_id and create:
+            cart_id = self.session[CART_ID_SESSION_KEY] = uuid.uuid4().hex
+        if not cart_id:
+            return None
+        return {'cart_id': cart_id, 'user__isnull': True}
+    
+    def load(self):
+        owner = self.get_owner_filter()
+        if owner is None:
+            return {}
+        rows = CartItem.objects.filter(**owner).values_list(
+            'product_id', 'quantity', 'price', 'product__weight_kg'
+        )
+        return {
+            str(product_id): {'quantity': quantity, 'price': str(price), 'weight': str(weight)}
+            for product_id, quantity, price, weight in rows
+        }
+    
+    def save_item(self, product_id, item):
+        owner = self.get_owner_filter(create=True)
+        owner.pop('user__isnull', None)
+        CartItem.objects.update_or_create(
+            product_id=int(product_id),
+            **owner,
+            defaults={'quantity': item['quantity'], 'price': Decimal(item['price'])}
+        )
+    
+    def remove_item(self, product_id):
+        owner = self.get_owner_filter()
+        if owner is not None:
+            CartItem.objects.filter(product_id=int(product_id), **owner).delete()
+    
+    def clear(self):
+        owner = self.get_owner_filter()
+        if owner is not None:
+            CartItem.objects.filter(**owner).delete()
+    
+    @classmethod
+    def merge_on_login(cls, request, user):
+        """Move the anonymous cart's lines onto the user's cart"""
+        cart_id = request.session.get(CART_ID_SESSION_KEY)
+        if not cart_id:
+            return
         
-        if not cart:
-            # Save an empty cart in the session
-            cart = self.session['cart'] = {}
-        self.cart = cart
+        user_items = {item.product_id: item for item in CartItem.objects.filter(user=user)}
+        for item in CartItem.objects.filter(cart_id=cart_id, user__isnull=True):
+            existing = user_items.get(item.product_id)
+            if existing:
+                existing.quantity += item.quantity
+                existing.save(update_fields=['quantity', 'updated_at'])
+                item.delete()
+            else:
+                item.user = user
+                item.save(update_fields=['user', 'updated_at'])
+        del request.session[CART_ID_SESSION_KEY]
+
+
+def live_cart_ids():
+    """
+    Return the cart ids held by unexpired sessions
+
+    Needs a session engine that stores sessions in the database (db,
+    cached_db); raises ValueError for one whose sessions can't be listed.
+    """
+    store_class = import_module(settings.SESSION_ENGINE).SessionStore
+    if not hasattr(store_class, 'get_model_class'):
+        raise ValueError(
+            f'Sessions stored by {settings.SESSION_ENGINE} cannot be listed; '
+            'abandoned carts can only be found with a database-backed SESSION_ENGINE'
+        )
+    store = store_class()
+    sessions = store_class.get_model_class().objects.filter(
+        expire_date__gt=timezone.now()
+    ).values_list('session_data', flat=True)
+    cart_ids = set()
+    for data in sessions.iterator(chunk_size=2000):
+        cart_id = store.decode(data).get(CART_ID_SESSION_KEY)
+        if cart_id:
+            cart_ids.add(cart_id)
+    return cart_ids
+
+
+def clear_abandoned_carts(grace=ABANDONED_CART_GRACE):
+    """
+    Delete anonymous database carts nobody can reach any more
+
+    An anonymous cart is only reachable through the cart id in its
+    visitor's session, so a cart no unexpired session refers to is
+    abandoned, however recently the session or the cart was written.
+    Carts with a line changed in the last grace seconds are kept, as their
+    session may still be on its way to the store. Returns the number of
+    cart lines deleted.
+    """
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    live = live_cart_ids()
+    anonymous = CartItem.objects.filter(user__isnull=True)
+    recent = set(anonymous.filter(updated_at__gte=cutoff).values_list('cart_id', flat=True).distinct())
+    abandoned = sorted(
+        set(anonymous.values_list('cart_id', flat=True).distinct().iterator()) - live - recent
+    )
+    deleted = 0
+    for start in range(0, len(abandoned), ABANDONED_CART_BATCH_SIZE):
+        count, _ = anonymous.filter(cart_id__in=abandoned[start:start + ABANDONED_CART_BATCH_SIZE]).delete()
+        deleted += count
+    return deleted
+
+
+def get_cart_storage_class():
+    """Return the cart storage class configured in settings"""
+    return import_string(getattr(settings, 'CART_STORAGE', DEFAULT_CART_STORAGE))
+
+
+class Cart:
+    """
+    Shopping cart backed by the configured cart storage
+
+    Products are loaded once into a cached list of line items and totals
+    are memoized; both are invalidated whenever the cart changes. Each line
+    carries its product's unit weight, so the cart weight and shipping
+    quotes need no product lookup.
+    """
+    
+    def __init__(self, request):
+        """Initialize the cart from the configured storage"""
+        self.session = request.session
+        self.storage = get_cart_storage_class()(request)
+        self.cart = self.storage.load()
+        self._lines = None
+        self._totals = {}
+
+    def invalidate(self):
+        """Drop cached line items and totals after the cart changes"""
+        self._lines = None
+        self._totals = {}
+
+    def _memoize(self, name, compute):
+        """Return a cached total, computing it on first use"""
+        if name not in self._totals:
+            self._totals[name] = compute()
+        return self._totals[name]
 
     def add(self, product, quantity=1, override_quantity=False):
         """
@@ -37,26 +236,27 @@ class Cart:
         if product_id not in self.cart:
             self.cart[product_id] = {
                 'quantity': 0,
-                'price': str(product.price)
+                'price': str(product.price),
+                'weight': str(product.weight_kg)
             }
+        # Lines stored before weights were tracked pick it up on their next change
+        self.cart[product_id].setdefault('weight', str(product.weight_kg))
         
         if override_quantity:
             self.cart[product_id]['quantity'] = quantity
         else:
             self.cart[product_id]['quantity'] += quantity
             
-        self.save()
-
-    def save(self):
-        """Mark the session as modified to make sure it gets saved"""
-        self.session.modified = True
+        self.storage.save_item(product_id, self.cart[product_id])
+        self.invalidate()
 
     def remove(self, product):
         """Remove a product from the cart"""
         product_id = str(product.id)
         if product_id in self.cart:
             del self.cart[product_id]
-            self.save()
+            self.storage.remove_item(product_id)
+            self.invalidate()
 
     def update(self, product, quantity):
         """Update the quantity of a product in the cart"""
@@ -64,40 +264,52 @@ class Cart:
         if product_id in self.cart:
             if quantity > 0:
                 self.cart[product_id]['quantity'] = quantity
-                self.save()
+                self.storage.save_item(product_id, self.cart[product_id])
+                self.invalidate()
             else:
                 self.remove(product)
 
+    def get_lines(self):
+        """Return cart line items with their products, loading products in one query"""
+        if self._lines is None:
+            products = Product.objects.filter(
+                id__in=self.cart.keys()
+            ).select_related('category').in_bulk()
+            
+            self._lines = []
+            for product_id, item in self.cart.items():
+                product = products.get(int(product_id))
+                if product is not None:
+                    # Create a new dict without modifying session data
+                    price = Decimal(item['price'])
+                    self._lines.append({
+                        'product': product,
+                        'quantity': item['quantity'],
+                        'price': price,
+                        'total_price': price * item['quantity']
+                    })
+        return self._lines
+
     def __iter__(self):
-        """Iterate over the items in the cart and get the products from the database"""
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        
-        # Create a mapping of product IDs to products
-        product_map = {str(product.id): product for product in products}
-        
-        for product_id, item in self.cart.items():
-            if product_id in product_map:
-                # Create a new dict without modifying session data
-                yield {
-                    'product': product_map[product_id],
-                    'quantity': item['quantity'],
-                    'price': Decimal(item['price']),
-                    'total_price': Decimal(item['price']) * item['quantity']
-                }
+        """Iterate over the items in the cart with their products"""
+        return iter(self.get_lines())
 
     def __len__(self):
         """Count all items in the cart"""
-        return sum(item['quantity'] for item in self.cart.values())
+        return self.get_item_count()
 
     def get_total_price(self):
         """Calculate the total price of all items in the cart"""
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return self._memoize('total_price', lambda: sum(
+            (Decimal(item['price']) * item['quantity'] for item in self.cart.values()),
+            Decimal('0')
+        ))
 
     def clear(self):
         """Remove all items from the cart"""
-        del self.session['cart']
-        self.save()
+        self.storage.clear()
+        self.cart = self.storage.load()
+        self.invalidate()
 
     def get_cart_items(self):
         """Get all cart items with product details"""
@@ -117,23 +329,53 @@ class Cart:
 
     def get_item_count(self):
         """Get total number of items (sum of quantities)"""
-        return sum(item['quantity'] for item in self.cart.values())
+        return self._memoize('item_count', lambda: sum(
+            item['quantity'] for item in self.cart.values()
+        ))
 
-    def get_shipping_cost(self):
-        """Calculate shipping cost based on total price"""
-        total = self.get_total_price()
-        if total >= Decimal('500'):  # Free shipping over ₹500
-            return Decimal('0.00')
-        else:
-            return Decimal('50.00')  # ₹50 shipping fee
+    def get_total_weight(self):
+        """Total weight in kg of all items, from the unit weights stored on the lines"""
+        def compute():
+            weights = {product_id: item.get('weight') for product_id, item in self.cart.items()}
+            missing = [product_id for product_id, weight in weights.items() if weight is None]
+            if missing:
+                # Lines stored before weights were tracked: one query for all of them
+                weights.update(
+                    (str(product_id), weight) for product_id, weight in
+                    Product.objects.filter(id__in=missing).values_list('id', 'weight_kg')
+                )
+            return sum(
+                (Decimal(weights[product_id] or '0') * item['quantity']
+                 for product_id, item in self.cart.items()),
+                Decimal('0')
+            )
+        return self._memoize('total_weight', compute)
+
+    def get_shipping_cost(self, country='India', pincode=None):
+        """
+        Shipping cost to a destination for the cart's total and weight
+
+        Quoted from the in-memory shipping tables and memoized per
+        destination until the cart changes, so repeated checks of the same
+        address (and template calls) cost nothing.
+        """
+        country = country or 'India'
+        return self._memoize(
+            f'shipping_cost:{country}:{pincode or ""}',
+            lambda: get_shipping_tables().quote(
+                self.get_total_price(), country, pincode, self.get_total_weight()
+            )
+        )
 
     def get_tax_amount(self):
         """Calculate tax amount (18% GST)"""
-        return self.get_total_price() * Decimal('0.18')
+        return self._memoize('tax_amount', lambda: self.get_total_price() * Decimal('0.18'))
 
     def get_final_total(self):
         """Get final total including shipping and tax"""
-        return self.get_total_price() + self.get_shipping_cost() + self.get_tax_amount()
+        return self._memoize('final_total', lambda: (
+            self.get_total_price() + self.get_shipping_cost() + self.get_tax_amount()
+        ))
 
     def get_total_price_float(self):
         """Get total price as float for JSON serialization"""
@@ -149,4 +391,12 @@ class Cart:
     
     def get_final_total_float(self):
         """Get final total as float for JSON serialization"""
-        return float(self.get_final_total())
\ No newline at end of file
+        return float(self.get_final_total())
+
+
+def get_cart(request):
+    """Return the request's Cart, creating it on first use so it is loaded only once"""
+    cart = getattr(request, '_cart', None)
+    if cart is None:
+        cart = request._cart = Cart(request)
+    return cart
@@ -0,0 +1,40 @@
+"""
+Catalog version tracking for Sri Devi Fashion Jewellery
+
+Per-process catalog structures (the search index, the typeahead index)
+compare their own version against a shared counter (shop.versions). The
+counter is bumped by the Product/Category signals on every write, so
+each worker can tell when its in-memory copy is out of date. Cached
+catalog data (the category list, facet counts) embeds the version in its
+cache key instead.
+"""
+
+from django.core.cache import cache
+
+from .models import Category
+from .versions import bump_version, get_version
+
+
+CATALOG_VERSION = 'catalog'
+
+CATEGORY_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day; a catalog change switches keys anyway
+
+
+def get_catalog_version():
+    """Return the current catalog version (0 if never bumped)"""
+    return get_version(CATALOG_VERSION)
+
+
+def bump_catalog_version():
+    """Record a catalog change and return the new version"""
+    return bump_version(CATALOG_VERSION)
+
+
+def get_categories():
+    """Return all categories, cached until the next catalog change"""
+    key = f'shop:categories:{get_catalog_version()}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories, CATEGORY_CACHE_TIMEOUT)
+    return categories
@@ -0,0 +1,39 @@
+"""
+System checks for the shop's cache configuration
+
+Reported by `python manage.py check --deploy`, which start.sh runs before
+starting gunicorn. The catalog, shipping and currency versions are
+counted in the database (shop.versions), so quotes and prices stay
+correct with any backend, but the shared pieces built on top of the
+cache need every worker to use the same one.
+"""
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Warn when the default cache isn't shared between worker processes"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        Warning(
+            f'The default cache ({backend.rsplit(".", 1)[-1]}) is not shared between worker processes.',
+            hint=(
+                'Each gunicorn worker keeps its own cached fragments and listing counts, rebuilds '
+                'the sitemaps on its own, and sees shipping, currency and catalog changes made by '
+                'another worker only after VERSION_CHECK_INTERVAL seconds. Set CACHE_BACKEND to a '
+                'shared backend, e.g. django.core.cache.backends.filebased.FileBasedCache with '
+                'CACHE_LOCATION on a local disk.'
+            ),
+            id='shop.W001',
+        )
+    ]
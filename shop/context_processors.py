@@ -5,9 +5,37 @@ This module contains context processors that make data available
 to all templates throughout the application.
 """
 
-from .cart import Cart
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from .cart import get_cart
+from .currency import get_currency, get_currency_version
 
 
 def cart(request):
-    """Make cart available in all templates"""
-    return {'cart': Cart(request)}
\ No newline at end of file
+    """
+    Make cart available in all templates
+
+    Both values are lazy: the session and cart storage are only read when a
+    template actually uses them, so pages that don't show the cart cost nothing.
+    cart_count only needs the stored quantities, never a product lookup.
+    """
+    return {
+        'cart': SimpleLazyObject(lambda: get_cart(request)),
+        'cart_count': SimpleLazyObject(lambda: get_cart(request).get_item_count()),
+    }
+
+
+def fragment_cache(request):
+    """
+    Values used to key and expire cached template fragments
+
+    Product cards are cached with {% cache fragment_cache_timeout ... product.id
+    product.updated_at currency %}, so any product save or currency switch
+    renders a fresh card; cards showing converted prices add price_version,
+    so they are re-rendered when currency rates change too.
+    """
+    return {
+        'currency': SimpleLazyObject(lambda: get_currency(request)),
+        'price_version': SimpleLazyObject(get_currency_version),
+        'fragment_cache_timeout': getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60),
+    }
@@ -1,37 +1,286 @@
 """
-Currency conversion utility for Sri Devi Fashion Jewellery
-Handles INR to USD conversion
+Multi-currency price book for Sri Devi Fashion Jewellery
+
+Prices are stored in INR. Every other display currency is a CurrencyRate
+row (rate per rupee, symbol, decimal places, rounding rule). Each process
+keeps the active rates in a PriceBook and reloads it when a version
+counter shared by every worker (shop.versions) moves on; CurrencyRate
+signals bump it, as they do for the shipping tables.
+
+Converted, rounded product prices are precomputed into
+Product.converted_prices by rebuild_price_book (one UPDATE per batch of
+distinct prices), so showing a product price is a dict lookup returning
+a Decimal. Each entry records the INR price and a fingerprint of the
+rates it was computed from; an entry that no longer matches (a price
+changed by a bulk import, or rates edited since the last rebuild) is
+converted on the fly instead, so a stale price is never shown.
+
+Formatting is Decimal-exact and done by one PriceFormatter per currency
+(built with the price book, so it is cached per process): INR uses
+Indian digit grouping (1,00,000), other currencies their configured
+grouping, and recently formatted amounts are remembered. Templates
+resolve the price book and currency once per request
+(get_price_display), and {% prices %} formats a whole product grid in
+one tag.
 """
 
-# Current exchange rate (update periodically or use API)
-INR_TO_USD = 0.012  # 1 INR = 0.012 USD (approximately)
+import hashlib
+import threading
+from decimal import ROUND_CEILING, ROUND_HALF_UP, Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+
+from .models import CurrencyRate, Product
+from .versions import bump_version, get_version
+
+
+BASE_CURRENCY = 'INR'
+BASE_SYMBOL = '₹'
+CURRENCY_SESSION_KEY = 'currency'
+CURRENCY_VERSION = 'currency'
+
+# Distinct prices per UPDATE when rebuilding converted prices
+PRICE_BOOK_BATCH_SIZE = 500
+
+# Formatted amounts remembered per currency before the memo starts over
+PRICE_FORMAT_CACHE_SIZE = 4096
+
+
+def get_currency_version():
+    """Return the current rates version (0 if never bumped)"""
+    return get_version(CURRENCY_VERSION)
+
+
+def bump_currency_version():
+    """Record a change to the currency rates and return the new version"""
+    return bump_version(CURRENCY_VERSION)
+
+
+def round_price(amount, places, rounding='exact'):
+    """
+    Round a converted amount for display
+
+    exact rounds to the nearest minor unit; whole rounds up to a whole
+    unit; charm rounds up and drops one minor unit (12.34 -> 12.99), or
+    for currencies without decimals, to just under the next ten (1,234 -> 1,239).
+    """
+    unit = Decimal(1).scaleb(-places)
+    if rounding == 'whole':
+        return amount.to_integral_value(ROUND_CEILING).quantize(unit)
+    if rounding == 'charm':
+        step = Decimal(1) if places else Decimal(10)
+        rounded = (amount / step).to_integral_value(ROUND_CEILING) * step - unit
+        return max(rounded, unit).quantize(unit)
+    return amount.quantize(unit, ROUND_HALF_UP)
+
+
+def group_digits(digits, grouping='western'):
+    """'1234567' -> '1,234,567' (western) or '12,34,567' (indian)"""
+    if len(digits) <= 3:
+        return digits
+    if grouping == 'indian':
+        head, tail = digits[:-3], digits[-3:]
+        start = len(head) % 2
+        groups = [head[:start]] if start else []
+        groups += [head[i:i + 2] for i in range(start, len(head), 2)]
+        return ','.join(groups + [tail])
+    start = len(digits) % 3 or 3
+    return ','.join([digits[:start]] + [digits[i:i + 3] for i in range(start, len(digits), 3)])
+
+
+class PriceFormatter:
+    """Formats amounts for one currency exactly, remembering recent results"""
+
+    __slots__ = ('symbol', 'places', 'grouping', 'unit', 'memo')
+
+    def __init__(self, symbol, places=2, grouping='western'):
+        self.symbol = symbol
+        self.places = places
+        self.grouping = grouping
+        self.unit = Decimal(1).scaleb(-places)
+        self.memo = {}
+
+    def __call__(self, amount):
+        text = self.memo.get(amount)
+        if text is None:
+            text = self.format(amount)
+            if len(self.memo) >= PRICE_FORMAT_CACHE_SIZE:
+                self.memo.clear()
+            self.memo[amount] = text
+        return text
+
+    def format(self, amount):
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        digits = format(amount.quantize(self.unit, ROUND_HALF_UP), 'f')
+        sign = ''
+        if digits.startswith('-'):
+            sign, digits = '-', digits[1:]
+        whole, _, fraction = digits.partition('.')
+        text = f'{sign}{self.symbol}{group_digits(whole, self.grouping)}'
+        return f'{text}.{fraction}' if fraction else text
+
+
+class Currency:
+    """Conversion and display rules of one currency"""
+
+    __slots__ = ('code', 'symbol', 'rate', 'places', 'rounding', 'format')
+
+    def __init__(self, code, symbol, rate, places=2, rounding='exact', grouping='western'):
+        self.code = code
+        self.symbol = symbol
+        self.rate = rate
+        self.places = places
+        self.rounding = rounding
+        self.format = PriceFormatter(symbol, places, grouping)
+
+    def convert(self, amount, display=False):
+        """
+        Convert an INR amount to this currency
+
+        display applies the currency's rounding rule (for shown product
+        prices); otherwise amounts are rounded to the minor unit, so
+        converted order totals still add up.
+        """
+        converted = Decimal(str(amount)) * self.rate
+        return round_price(converted, self.places, self.rounding if display else 'exact')
+
+
+BASE = Currency(BASE_CURRENCY, BASE_SYMBOL, Decimal(1), grouping='indian')
+
+
+class PriceBook:
+    """A snapshot of the active currencies"""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.currencies = {BASE_CURRENCY: BASE}
+        self.fingerprint = ''
+
+    @classmethod
+    def load(cls, version=None):
+        """Read the active rates from the database (one query)"""
+        book = cls(version)
+        for code, symbol, rate, places, rounding, grouping in CurrencyRate.objects.filter(
+            is_active=True
+        ).exclude(code=BASE_CURRENCY).values_list('code', 'symbol', 'rate', 'decimal_places', 'rounding', 'grouping'):
+            book.currencies[code] = Currency(code, symbol, rate, places, rounding, grouping)
+        # Identifies the rates, not the load, so every process agrees on it
+        rules = sorted((c.code, str(c.rate.normalize()), c.places, c.rounding) for c in book.currencies.values())
+        book.fingerprint = hashlib.sha256(repr(rules).encode()).hexdigest()[:12]
+        return book
+
+    def get(self, code):
+        """The currency for code, or INR if it isn't active"""
+        return self.currencies.get(code, BASE)
+
+    def price_entry(self, price):
+        """Product.converted_prices value for an INR price"""
+        entry = {'rates': self.fingerprint, 'price': str(price)}
+        for code, currency in self.currencies.items():
+            if currency is not BASE:
+                entry[code] = str(currency.convert(price, display=True))
+        return entry
+
+    def product_price(self, product, code):
+        """A product's display price in a currency, from its precomputed entry when current"""
+        currency = self.get(code)
+        if currency is BASE:
+            return product.price
+        entry = product.converted_prices
+        if entry.get('rates') == self.fingerprint and code in entry and Decimal(entry['price']) == product.price:
+            return Decimal(entry[code])
+        return currency.convert(product.price, display=True)
+
+    def convert(self, amount, code):
+        """Convert an INR amount (e.g. an order total) exactly to the minor unit"""
+        return self.get(code).convert(amount)
+
+    def format(self, amount, code):
+        return self.get(code).format(amount)
+
+
+_book = None
+_book_lock = threading.Lock()
+
+
+def get_price_book():
+    """Return this process's price book, reloading it if it is out of date"""
+    global _book
+    version = get_currency_version()
+    book = _book
+    if book is not None and book.version == version:
+        return book
+    with _book_lock:
+        if _book is None or _book.version != version:
+            _book = PriceBook.load(version)
+        return _book
+
+
+def rebuild_price_book(batch_size=PRICE_BOOK_BATCH_SIZE):
+    """
+    Precompute every product's converted prices from the current rates
+
+    Products sharing an INR price share an entry, so each UPDATE sets one
+    CASE branch per distinct price. Returns the number of products updated.
+    """
+    book = PriceBook.load(get_currency_version())
+    prices = list(Product.objects.order_by().values_list('price', flat=True).distinct())
+    updated = 0
+    with transaction.atomic():
+        for start in range(0, len(prices), batch_size):
+            batch = prices[start:start + batch_size]
+            updated += Product.objects.filter(price__in=batch).update(converted_prices=Case(
+                *[When(price=price, then=Value(book.price_entry(price), output_field=models.JSONField()))
+                  for price in batch],
+                output_field=models.JSONField(),
+            ))
+    return updated
+
 
 def get_currency(request):
     """Get current currency from session"""
-    return request.session.get('currency', 'INR')
+    return request.session.get(CURRENCY_SESSION_KEY, BASE_CURRENCY)
+
+
+def get_price_display(request):
+    """
+    Return (price book, Currency) for showing prices on this request
+
+    Resolved once per request, so a page full of prices reads the
+    session and the rates version only once.
+    """
+    display = getattr(request, '_price_display', None)
+    if display is None:
+        book = get_price_book()
+        display = request._price_display = (book, book.get(get_currency(request)))
+    return display
+
 
 def set_currency(request, currency):
-    """Set currency in session"""
-    if currency in ['INR', 'USD']:
-        request.session['currency'] = currency
+    """Set currency in session (INR or any active rate)"""
+    currency = (currency or '').upper()
+    if currency in get_price_book().currencies:
+        request.session[CURRENCY_SESSION_KEY] = currency
+        request._price_display = None
         return True
     return False
 
+
 def convert_price(amount, from_currency='INR', to_currency='USD'):
-    """Convert price from one currency to another"""
+    """Convert an amount between INR and an active currency, as a Decimal"""
+    amount = Decimal(str(amount))
     if from_currency == to_currency:
         return amount
-    
-    if from_currency == 'INR' and to_currency == 'USD':
-        return round(amount * INR_TO_USD, 2)
-    elif from_currency == 'USD' and to_currency == 'INR':
-        return round(amount / INR_TO_USD, 2)
-    
-    return amount
+    book = get_price_book()
+    if from_currency == BASE_CURRENCY:
+        return book.convert(amount, to_currency)
+    if to_currency == BASE_CURRENCY:
+        return round_price(amount / book.get(from_currency).rate, 2)
+    return book.convert(amount / book.get(from_currency).rate, to_currency)
+
 
 def format_price(amount, currency='INR'):
     """Format price with currency symbol"""
-    if currency == 'USD':
-        return f'${amount:.2f}'
-    else:  # INR
-        return f'₹{amount:.2f}'
+    return get_price_book().format(Decimal(str(amount)), currency)
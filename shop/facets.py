@@ -0,0 +1,130 @@
+"""
+Faceted search counts for the product search page
+
+Counts for sizes, colors, categories, brands and price buckets are taken
+from the active search backend in one pass (bitset popcounts for the
+inverted index) and cached per normalized query/filter combination. The
+catalog version is part of the cache key, so any product or category
+write invalidates every cached facet set at once.
+"""
+
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .catalog import get_catalog_version
+from .models import Category, Product
+from .search import get_search_backend, tokenize
+
+
+# Lower bounds (in ₹) of the default price buckets; the last bucket is open-ended
+DEFAULT_PRICE_BUCKETS = (0, 500, 1000, 2500, 5000)
+
+FACET_CACHE_TIMEOUT = 300  # 5 minutes
+
+# Maximum number of brands returned, most common first
+MAX_BRAND_FACETS = 20
+
+
+def get_price_buckets():
+    """Return configured price buckets as (min, max) pairs, max exclusive"""
+    bounds = [Decimal(str(bound)) for bound in
+              getattr(settings, 'SEARCH_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)]
+    return [(low, bounds[i + 1] if i + 1 < len(bounds) else None)
+            for i, low in enumerate(bounds)]
+
+
+def normalize_value(value):
+    """Render a filter value in a canonical string form"""
+    if isinstance(value, Decimal):
+        return format(value.normalize(), 'f')
+    return str(value)
+
+
+def facet_cache_key(query, filters):
+    """Cache key for a query/filter combination at the current catalog version"""
+    parts = [' '.join(tokenize(query))]
+    for name in sorted(filters):
+        if filters[name] not in (None, ''):
+            parts.append(f'{name}={normalize_value(filters[name])}')
+    digest = hashlib.md5('|'.join(parts).encode('utf-8')).hexdigest()
+    return f'shop:facets:{get_catalog_version()}:{digest}'
+
+
+def compute_facets(query='', **filters):
+    """Compute facet counts without caching"""
+    buckets = get_price_buckets()
+    counts = get_search_backend().facet_counts(query or '', price_buckets=buckets, **filters)
+
+    category_names = dict(Category.objects.values_list('slug', 'name'))
+    categories = sorted(
+        ({'value': slug, 'label': category_names.get(slug, slug), 'count': count}
+         for slug, count in counts['category'].items()),
+        key=lambda facet: facet['label']
+    )
+    brands = sorted(
+        ({'value': brand, 'label': brand, 'count': count}
+         for brand, count in counts['brand'].items()),
+        key=lambda facet: (-facet['count'], facet['label'])
+    )[:MAX_BRAND_FACETS]
+
+    return {
+        'category': categories,
+        'size': [{'value': code, 'label': label, 'count': counts['size'].get(code, 0)}
+                 for code, label in Product.SIZE_CHOICES],
+        'color': [{'value': code, 'label': label, 'count': counts['color'].get(code, 0)}
+                  for code, label in Product.COLOR_CHOICES],
+        'brand': brands,
+        'price': [{'min': low, 'max': high, 'count': count}
+                  for (low, high), count in zip(buckets, counts['price'])],
+    }
+
+
+def get_facets(query='', **filters):
+    """Return facet counts for a search, served from the cache when possible"""
+    key = facet_cache_key(query or '', filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(query, **filters)
+        timeout = getattr(settings, 'SEARCH_FACET_CACHE_TIMEOUT', FACET_CACHE_TIMEOUT)
+        cache.set(key, facets, timeout)
+    return facets
+
+
+def add_facet_links(facets, params):
+    """
+    Return a copy of facets with 'selected' and 'query_string' on each value
+
+    params is the request's QueryDict; selecting a selected value clears it.
+    """
+    linked = {}
+    for field in ('category', 'size', 'color', 'brand'):
+        current = params.get(field, '')
+        linked[field] = []
+        for facet in facets[field]:
+            selected = facet['value'] == current
+            query = params.copy()
+            query.pop('page', None)
+            if selected:
+                query.pop(field, None)
+            else:
+                query[field] = facet['value']
+            linked[field].append(dict(facet, selected=selected, query_string=query.urlencode()))
+
+    linked['price'] = []
+    for facet in facets['price']:
+        low = normalize_value(facet['min']) if facet['min'] is not None else ''
+        # max_price filters are inclusive, bucket maxima are not
+        high = normalize_value(facet['max'] - Decimal('0.01')) if facet['max'] is not None else ''
+        selected = params.get('min_price', '') == low and params.get('max_price', '') == high
+        query = params.copy()
+        query.pop('page', None)
+        for name, value in (('min_price', low), ('max_price', high)):
+            if selected or not value:
+                query.pop(name, None)
+            else:
+                query[name] = value
+        linked['price'].append(dict(facet, selected=selected, query_string=query.urlencode()))
+    return linked
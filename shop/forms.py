@@ -177,6 +177,11 @@ class ProductSearchForm(forms.Form):
         required=False,
         widget=forms.HiddenInput()
     )
+    brand = forms.CharField(
+        max_length=100,
+        required=False,
+        widget=forms.HiddenInput()
+    )
     min_price = forms.DecimalField(
         max_digits=10,
         decimal_places=2,
@@ -0,0 +1,100 @@
+"""
+Precomputed home page sections
+
+The home page shows a fixed number of new arrivals, bestsellers and
+per-category highlights. They are built in a handful of bounded queries
+and cached as one snapshot under the catalog version, so the page costs
+the same however large the catalog grows. Any product or category write
+switches to a new key; bestsellers, which move with orders rather than
+catalog writes, are refreshed when the snapshot times out. The
+refresh_home_snapshot command rebuilds it ahead of traffic.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+
+from .catalog import get_catalog_version, get_categories
+from .models import OrderItem, Product
+
+
+HOME_SECTION_SIZE = 6
+HOME_CATEGORY_LIMIT = 3
+HOME_PRODUCTS_PER_CATEGORY = 4
+HOME_SNAPSHOT_TIMEOUT = 15 * 60  # 15 minutes
+
+
+def home_snapshot_key():
+    """Cache key for the snapshot at the current catalog version"""
+    return f'shop:home:{get_catalog_version()}'
+
+
+def get_new_arrivals(limit=HOME_SECTION_SIZE):
+    """Return the newest available products"""
+    return list(
+        Product.objects.filter(available=True)
+        .select_related('category')
+        .order_by('-created_at')[:limit]
+    )
+
+
+def get_bestsellers(limit=HOME_SECTION_SIZE):
+    """Return the available products with the most units sold in paid orders"""
+    top = list(
+        OrderItem.objects.filter(order__payment_status='paid', product__available=True)
+        .values('product')
+        .annotate(sold=Sum('quantity'))
+        .order_by('-sold', 'product')
+        .values_list('product', flat=True)[:limit]
+    )
+    products = Product.objects.filter(id__in=top).select_related('category').in_bulk()
+    return [products[product_id] for product_id in top if product_id in products]
+
+
+def get_category_highlights(limit=HOME_CATEGORY_LIMIT, per_category=HOME_PRODUCTS_PER_CATEGORY):
+    """Return [(category, newest products)] for the first categories, in one product query"""
+    categories = get_categories()[:limit]
+    ranked = (
+        Product.objects.filter(available=True, category__in=categories)
+        .annotate(rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('category_id')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(rank__lte=per_category)
+        .order_by('category_id', 'rank')
+    )
+    products = {}
+    for product in ranked:
+        products.setdefault(product.category_id, []).append(product)
+    return [(category, products.get(category.id, [])) for category in categories]
+
+
+def build_home_snapshot():
+    """Compute every home page section"""
+    return {
+        'new_arrivals': get_new_arrivals(),
+        'bestsellers': get_bestsellers(),
+        'category_highlights': get_category_highlights(),
+        'product_count': Product.objects.filter(available=True).count(),
+        'category_count': len(get_categories()),
+    }
+
+
+def refresh_home_snapshot():
+    """Rebuild and store the snapshot for the current catalog version"""
+    # Take the key first so a catalog write during the build isn't masked
+    key = home_snapshot_key()
+    snapshot = build_home_snapshot()
+    timeout = getattr(settings, 'HOME_SNAPSHOT_TIMEOUT', HOME_SNAPSHOT_TIMEOUT)
+    cache.set(key, snapshot, timeout)
+    return snapshot
+
+
+def get_home_snapshot():
+    """Return the cached home page sections, building them on a miss"""
+    snapshot = cache.get(home_snapshot_key())
+    if snapshot is None:
+        snapshot = refresh_home_snapshot()
+    return snapshot
@@ -0,0 +1,232 @@
+"""
+Product image derivatives
+
+Uploaded originals are never modified. After a product is saved with a new
+image, a background worker renders resized copies for each preset
+(thumbnail, card, zoom) in WebP and JPEG, plus AVIF when Pillow has an
+AVIF encoder. Files are addressed by a hash of the source bytes, so an
+unchanged image is never re-encoded and identical uploads share files.
+Everything templates need (widths, intrinsic size, a tiny blurred
+placeholder, storage names) is recorded in Product.image_derivatives, so
+rendering never touches the filesystem.
+"""
+
+import base64
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+from .models import Product
+
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELDS = ('image', 'image_2', 'image_3')
+
+# Rendered widths (px) per preset, for srcset; never upscaled past the source
+DERIVATIVE_WIDTHS = {
+    'thumbnail': (96, 192),
+    'card': (300, 450, 600),
+    'zoom': (1200, 1800),
+}
+
+# (extension, Pillow format, save options), best compression first
+DERIVATIVE_FORMATS = [
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+if '.avif' in Image.registered_extensions():
+    DERIVATIVE_FORMATS.insert(0, ('avif', 'AVIF', {'quality': 60}))
+
+# Default `sizes` per preset, matching the grid columns the presets are used in
+PRESET_SIZES = {
+    'thumbnail': '96px',
+    'card': '(max-width: 767px) 100vw, (max-width: 991px) 50vw, 400px',
+    'zoom': '(max-width: 991px) 100vw, 50vw',
+}
+
+# Format used for srcset; every browser that understands srcset decodes WebP
+SRCSET_EXTENSION = 'webp'
+
+PLACEHOLDER_WIDTH = 16
+DERIVATIVE_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide derivative worker pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', DERIVATIVE_WORKERS),
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def derivative_name(digest, width, extension):
+    """Storage name of one rendered file"""
+    return f'derivatives/{digest[:2]}/{digest}/{width}.{extension}'
+
+
+def target_widths(source_width):
+    """Widths to render for a source image, across all presets"""
+    wanted = {width for widths in DERIVATIVE_WIDTHS.values() for width in widths}
+    widths = {width for width in wanted if width <= source_width}
+    if source_width < max(wanted):
+        widths.add(source_width)
+    return sorted(widths)
+
+
+def render_placeholder(image):
+    """Return a tiny blurred JPEG data URI to show while the real image loads"""
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.convert('RGB').resize((PLACEHOLDER_WIDTH, height), Image.Resampling.BILINEAR)
+    buffer = BytesIO()
+    tiny.filter(ImageFilter.GaussianBlur(1)).save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def render_derivatives(data, digest):
+    """Render every width and format for one source image; returns its manifest entry"""
+    with Image.open(BytesIO(data)) as opened:
+        source = ImageOps.exif_transpose(opened)
+        source.load()
+
+    entry = {
+        'hash': digest,
+        'width': source.width,
+        'height': source.height,
+        'placeholder': render_placeholder(source),
+        'variants': {extension: {} for extension, _, _ in DERIVATIVE_FORMATS},
+    }
+    for width in target_widths(source.width):
+        height = max(1, round(source.height * width / source.width))
+        resized = None
+        for extension, image_format, options in DERIVATIVE_FORMATS:
+            name = derivative_name(digest, width, extension)
+            # Content-addressed: an existing file is already the right bytes
+            if not default_storage.exists(name):
+                if resized is None:
+                    resized = source.resize((width, height), Image.Resampling.LANCZOS)
+                image = resized if image_format != 'JPEG' else resized.convert('RGB')
+                buffer = BytesIO()
+                image.save(buffer, image_format, **options)
+                default_storage.save(name, ContentFile(buffer.getvalue()))
+            entry['variants'][extension][str(width)] = name
+    return entry
+
+
+def build_derivatives(product_id, force=False):
+    """
+    Bring a product's derivatives and manifest up to date
+
+    Images whose bytes hash to the manifest's recorded hash are skipped
+    unless force is set. Returns True if the manifest changed.
+    """
+    product = Product.objects.filter(pk=product_id).only(*IMAGE_FIELDS, 'image_derivatives').first()
+    if product is None:
+        return False
+
+    manifest = {}
+    for field in IMAGE_FIELDS:
+        image = getattr(product, field)
+        if not image:
+            continue
+        try:
+            with image.open('rb') as source:
+                data = source.read()
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read {field} of product {product_id}: {e}")
+            continue
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        previous = product.image_derivatives.get(field)
+        if previous and previous['hash'] == digest and not force:
+            manifest[field] = previous
+        else:
+            manifest[field] = render_derivatives(data, digest)
+
+    if manifest == product.image_derivatives:
+        return False
+    # Only record the manifest if the images weren't replaced while we worked
+    return bool(Product.objects.filter(
+        pk=product_id,
+        **{field: getattr(product, field).name for field in IMAGE_FIELDS}
+    ).update(image_derivatives=manifest, updated_at=timezone.now()))
+
+
+def run_derivative_job(product_id):
+    """Worker entry point: build derivatives, logging instead of raising"""
+    try:
+        build_derivatives(product_id)
+    except Exception:
+        logger.exception(f"Building image derivatives for product {product_id} failed")
+    finally:
+        # Worker threads own their connection
+        connection.close()
+
+
+def schedule_derivatives(product_id):
+    """Queue a derivative build for when the current transaction commits"""
+    if getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(run_derivative_job, product_id))
+    else:
+        transaction.on_commit(lambda: build_derivatives(product_id))
+
+
+def preset_widths(entry, preset, extension='jpg'):
+    """Rendered widths of one manifest entry that serve a preset"""
+    rendered = sorted(int(width) for width in entry['variants'].get(extension, {}))
+    low, high = min(DERIVATIVE_WIDTHS[preset]), max(DERIVATIVE_WIDTHS[preset])
+    # A source narrower than the preset only has smaller copies: use the largest
+    return ([width for width in rendered if low <= width <= high]
+            or [width for width in rendered if width < low][-1:])
+
+
+def get_srcset(product, preset='card', extension='jpg', field='image'):
+    """Return a srcset string for a product image preset, or '' if not built yet"""
+    entry = product.image_derivatives.get(field)
+    if not entry or extension not in entry['variants']:
+        return ''
+    names = entry['variants'][extension]
+    return ', '.join(
+        f'{default_storage.url(names[str(width)])} {width}w'
+        for width in preset_widths(entry, preset, extension)
+    )
+
+
+def get_preset_image(product, preset='card', field='image'):
+    """
+    Return what an <img> needs to show one image preset, from the manifest
+
+    Returns a dict of src (largest JPEG of the preset), srcset, sizes,
+    intrinsic width/height and placeholder, or None if the derivatives
+    haven't been built yet.
+    """
+    entry = product.image_derivatives.get(field)
+    if not entry:
+        return None
+    widths = preset_widths(entry, preset, 'jpg')
+    if not widths:
+        return None
+    width = widths[-1]
+    return {
+        'src': default_storage.url(entry['variants']['jpg'][str(width)]),
+        'srcset': get_srcset(product, preset, SRCSET_EXTENSION, field) or get_srcset(product, preset, 'jpg', field),
+        'sizes': PRESET_SIZES[preset],
+        'width': width,
+        'height': max(1, round(entry['height'] * width / entry['width'])),
+        'placeholder': entry['placeholder'],
+    }
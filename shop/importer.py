@@ -0,0 +1,507 @@
+"""
+Bulk product import from CSV
+
+The file is streamed in chunks. Categories and existing product slugs are
+loaded once, so each chunk is resolved in memory and written with a
+single bulk_create; images are fetched concurrently over a pooled HTTP
+session. Progress is checkpointed to a JSON file after every chunk, so a
+large import interrupted part way resumes where it stopped instead of
+starting over or duplicating products.
+
+CatalogSync applies a recurring supplier feed on top, matching products
+on their SKU and only writing rows whose content changed.
+
+bulk_create and bulk_update bypass Product signals: the catalog version
+is bumped once per chunk (search indexes rebuild lazily), and image
+derivatives are left to the build_image_derivatives command.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .catalog import bump_catalog_version
+from .models import Category, Product
+
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_IMAGE_WORKERS = 8
+IMAGE_TIMEOUT = 10  # seconds
+# Bytes read at a time when hashing the file for its checkpoint
+FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+
+class CheckpointMismatch(Exception):
+    """Raised when a checkpoint was written for a different version of the file"""
+
+
+class ImportStats:
+    """Counters for one import run, including rows done before a resume"""
+
+    def __init__(self, rows=0, created=0, errors=0, images=0):
+        self.rows = rows
+        self.created = created
+        self.errors = errors
+        self.images = images
+
+
+def unique_slug(base, taken):
+    """Return base, or base-N, whichever is not in taken; records the choice"""
+    base = base or 'product'
+    slug = base
+    counter = 1
+    while slug in taken:
+        slug = f"{base}-{counter}"
+        counter += 1
+    taken.add(slug)
+    return slug
+
+
+class ProductImporter:
+    """
+    Import products from a CSV file in checkpointed chunks
+
+    CSV columns: name, description, price, category, stock, size, color,
+    image_url, and optionally material, brand and weight_kg.
+    """
+
+    def __init__(self, path, batch_size=IMPORT_BATCH_SIZE, workers=IMPORT_IMAGE_WORKERS,
+                 skip_images=False, checkpoint_path=None, session=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.skip_images = skip_images
+        self.checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+        self.session = session or self.make_session(workers)
+        self.categories = {}
+        self.category_slugs = {}
+        self.slugs = set()
+        self.errors = []  # (line number, message) for this run
+        self.file_hash = None
+
+    @staticmethod
+    def make_session(workers):
+        """HTTP session whose connection pool is large enough for every worker"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=2)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    # Checkpoints
+
+    def fingerprint(self):
+        """SHA-256 of the whole file, streamed once per run"""
+        if self.file_hash is None:
+            digest = hashlib.sha256()
+            with open(self.path, 'rb') as f:
+                for block in iter(lambda: f.read(FINGERPRINT_BLOCK_SIZE), b''):
+                    digest.update(block)
+            self.file_hash = digest.hexdigest()
+        return self.file_hash
+
+    def load_checkpoint(self):
+        """Return the saved checkpoint dict, or None to start from the top"""
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+        if checkpoint.get('fingerprint') != self.fingerprint():
+            raise CheckpointMismatch(
+                f"{self.checkpoint_path} belongs to a different version of {self.path}; "
+                f"delete it (or use --restart) to import from the beginning"
+            )
+        return checkpoint
+
+    def save_checkpoint(self, stats, pending=None):
+        """Atomically record progress; pending names a chunk being committed"""
+        checkpoint = {
+            'fingerprint': self.fingerprint(),
+            'rows': stats.rows,
+            'created': stats.created,
+            'errors': stats.errors,
+            'images': stats.images,
+            'pending': pending,
+        }
+        temp_path = f'{self.checkpoint_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        for path in (self.checkpoint_path, f'{self.checkpoint_path}.tmp'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def resume_stats(self, checkpoint):
+        """Stats to continue from, settling a chunk whose commit outcome is unknown"""
+        stats = ImportStats(checkpoint['rows'], checkpoint['created'],
+                            checkpoint['errors'], checkpoint['images'])
+        pending = checkpoint.get('pending')
+        # The crash came between the chunk's commit and its checkpoint: if its
+        # products exist, it committed
+        if pending and pending['slugs'] and Product.objects.filter(slug__in=pending['slugs']).exists():
+            stats.rows = pending['rows']
+            stats.created += len(pending['slugs'])
+            stats.errors += pending['errors']
+            stats.images += pending['images']
+        return stats
+
+    # Row resolution
+
+    def load_lookups(self):
+        """Load every category and product slug once"""
+        self.categories = {category.name: category for category in Category.objects.all()}
+        self.category_slugs = {category.slug: category for category in self.categories.values()}
+        self.slugs = set(Product.objects.values_list('slug', flat=True).iterator(chunk_size=5000))
+
+    def get_category(self, name):
+        """
+        Return the category called name, creating it on first use
+
+        Names with the same slug ("Rings", "rings!") share a category.
+        Raises ValueError if the category can't be created.
+        """
+        category = self.categories.get(name)
+        if category is None:
+            slug = slugify(name) or name.lower().replace(' ', '-')
+            category = self.category_slugs.get(slug)
+            if category is None:
+                try:
+                    with transaction.atomic():
+                        category = Category.objects.create(name=name, slug=slug)
+                except IntegrityError:
+                    raise ValueError(f'category {name!r} clashes with an existing category')
+                self.category_slugs[slug] = category
+            self.categories[name] = category
+        return category
+
+    def product_values(self, row):
+        """Return the Product field values for a CSV row; raises ValueError for bad data"""
+        name = (row.get('name') or '').strip()
+        if not name:
+            raise ValueError('name is required')
+        if not (row.get('category') or '').strip():
+            raise ValueError('category is required')
+        try:
+            price = Decimal(str(row['price']).strip())
+            weight = Decimal(str(row.get('weight_kg') or '0.100').strip())
+        except (KeyError, InvalidOperation):
+            raise ValueError('invalid price or weight_kg')
+        stock = int(row.get('stock') or 0)
+        if price <= 0 or stock < 0:
+            raise ValueError('price must be positive and stock not negative')
+
+        return {
+            'name': name,
+            'description': row.get('description', ''),
+            'price': price,
+            'category': self.get_category(row['category'].strip()),
+            'stock': stock,
+            'size': row.get('size') or 'M',
+            'color': row.get('color') or 'black',
+            'material': row.get('material', ''),
+            'brand': row.get('brand', ''),
+            'weight_kg': weight,
+            'available': stock > 0,
+        }
+
+    def build_product(self, row):
+        """Return an unsaved Product with a unique slug for a CSV row"""
+        values = self.product_values(row)
+        return Product(slug=unique_slug(slugify(values['name']), self.slugs), **values)
+
+    # Images
+
+    def fetch_image(self, url):
+        """Return the image bytes at url, or None if it can't be downloaded"""
+        try:
+            response = self.session.get(url, timeout=IMAGE_TIMEOUT)
+            response.raise_for_status()
+            return response.content
+        except requests.RequestException as e:
+            logger.warning(f"Could not download {url}: {e}")
+            return None
+
+    def attach_images(self, executor, products, urls):
+        """Download the chunk's images concurrently and store them on the products"""
+        wanted = [(product, url) for product, url in zip(products, urls) if url]
+        attached = 0
+        for (product, url), data in zip(wanted, executor.map(self.fetch_image, [url for _, url in wanted])):
+            if data:
+                product.image.save(f"{product.slug}.jpg", ContentFile(data), save=False)
+                attached += 1
+        return attached
+
+    # Import
+
+    def read_chunks(self, skip):
+        """Yield lists of (line number, row), starting after skip rows"""
+        with open(self.path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            rows = enumerate(islice(reader, skip, None), start=skip + 2)
+            while True:
+                chunk = list(islice(rows, self.batch_size))
+                if not chunk:
+                    return
+                yield chunk
+
+    def import_chunk(self, executor, chunk, stats):
+        """Resolve, fetch images for and insert one chunk; updates stats"""
+        products, urls, errors = [], [], 0
+        for line, row in chunk:
+            try:
+                products.append(self.build_product(row))
+                urls.append(None if self.skip_images else (row.get('image_url') or '').strip())
+            except (ValueError, TypeError) as e:
+                errors += 1
+                self.errors.append((line, str(e)))
+
+        images = self.attach_images(executor, products, urls) if products else 0
+        pending = {
+            'rows': stats.rows + len(chunk),
+            'slugs': [product.slug for product in products],
+            'errors': errors,
+            'images': images,
+        }
+        self.save_checkpoint(stats, pending)
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+        if products:
+            bump_catalog_version()
+
+        stats.rows = pending['rows']
+        stats.created += len(products)
+        stats.errors += errors
+        stats.images += images
+        self.save_checkpoint(stats)
+
+    def run(self, restart=False, progress=None):
+        """Import the file, resuming from the checkpoint unless restart; returns ImportStats"""
+        checkpoint = None if restart else self.load_checkpoint()
+        stats = self.resume_stats(checkpoint) if checkpoint else ImportStats()
+        self.load_lookups()
+
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            for chunk in self.read_chunks(stats.rows):
+                self.import_chunk(executor, chunk, stats)
+                if progress:
+                    progress(stats)
+
+        self.clear_checkpoint()
+        return stats
+
+
+# Feed sync
+
+SYNC_FIELDS = ('name', 'description', 'price', 'category', 'stock', 'size',
+               'color', 'material', 'brand', 'weight_kg', 'available')
+DEACTIVATE_BATCH_SIZE = 500
+
+
+def content_hash(values):
+    """Hash of the synced field values of one feed row"""
+    canonical = []
+    for field in SYNC_FIELDS:
+        value = values[field]
+        if field == 'category':
+            value = value.pk
+        elif isinstance(value, Decimal):
+            value = value.normalize()
+        canonical.append(str(value))
+    return hashlib.sha256('\x1f'.join(canonical).encode('utf-8')).hexdigest()[:32]
+
+
+class SyncStats:
+    """Counters for one catalog sync"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.linked = 0
+        self.deactivated = 0
+        self.errors = 0
+        self.images = 0
+
+
+class CatalogSync(ProductImporter):
+    """
+    Upsert products from a supplier feed keyed on Product.sku
+
+    Each row's content hash is compared with Product.sync_hash from the
+    previous sync, so unchanged rows cost no queries. Changed rows are
+    loaded per chunk and written with bulk_update on just their dirty
+    fields; unknown SKUs are created (with images), and products whose SKU
+    is missing from the feed are marked unavailable. Re-running a sync is
+    cheap, so there is no checkpoint: an interrupted sync is simply run
+    again. Rows are diffed against the last feed, not the live row, so
+    force compares every row (e.g. to undo manual edits).
+
+    Products without a SKU (created by hand or by import_products, e.g.
+    the whole catalog on the first sync) are linked to an unknown SKU
+    whose name slugifies to their slug, and updated like a changed row,
+    instead of being duplicated; match_slug=False turns this off. SKU-less
+    products no row links to are left alone, even by deactivate_missing.
+    """
+
+    def __init__(self, path, batch_size=IMPORT_BATCH_SIZE, workers=IMPORT_IMAGE_WORKERS,
+                 skip_images=False, deactivate_missing=True, force=False, match_slug=True, session=None):
+        super().__init__(path, batch_size, workers, skip_images, session=session)
+        self.deactivate_missing = deactivate_missing
+        self.force = force
+        self.match_slug = match_slug
+        self.existing = {}  # sku -> (id, sync_hash)
+        self.unlinked = {}  # slug -> id of products without a SKU
+        self.seen = set()
+
+    def load_lookups(self):
+        super().load_lookups()
+        rows = Product.objects.exclude(sku='').filter(sku__isnull=False).values_list('sku', 'id', 'sync_hash')
+        self.existing = {sku: (pk, digest) for sku, pk, digest in rows.iterator(chunk_size=5000)}
+        if self.match_slug:
+            rows = Product.objects.filter(Q(sku__isnull=True) | Q(sku='')).values_list('slug', 'id')
+            self.unlinked = dict(rows.iterator(chunk_size=5000))
+
+    def parse_row(self, row):
+        """Return (sku, field values) for a feed row; raises ValueError for bad data"""
+        sku = (row.get('sku') or '').strip()
+        if not sku:
+            raise ValueError('sku is required')
+        if sku in self.seen:
+            raise ValueError(f'duplicate sku {sku}')
+        # Seen even if the row is invalid, so a bad row doesn't deactivate its product
+        self.seen.add(sku)
+        return sku, self.product_values(row)
+
+    def dirty_updates(self, changed, now, linked=None):
+        """
+        Apply changed rows to their products, grouped by the fields that differ
+
+        linked maps the ids of SKU-less products matched by slug to their
+        new SKU. Returns ({fields: [products]}, number of products with
+        real changes).
+        """
+        linked = linked or {}
+        products = Product.objects.only(*SYNC_FIELDS, 'sku', 'sync_hash').in_bulk(list(changed))
+        groups = {}
+        updated = 0
+        for pk, (values, digest) in changed.items():
+            product = products.get(pk)
+            if product is None:
+                continue
+            dirty = []
+            if pk in linked:
+                product.sku = linked[pk]
+                dirty.append('sku')
+            for field in SYNC_FIELDS:
+                if field == 'category':
+                    differs = product.category_id != values[field].pk
+                else:
+                    differs = getattr(product, field) != values[field]
+                if differs:
+                    setattr(product, field, values[field])
+                    dirty.append(field)
+            if not dirty and product.sync_hash == digest:
+                continue
+            product.sync_hash = digest
+            fields = [*dirty, 'sync_hash']
+            if dirty:
+                product.updated_at = now
+                fields.append('updated_at')
+                updated += 1
+            groups.setdefault(tuple(fields), []).append(product)
+        return groups, updated
+
+    def sync_chunk(self, executor, chunk, stats):
+        """Create, update or skip each row of one chunk; updates stats"""
+        new, urls, changed, linked = [], [], {}, {}
+        for line, row in chunk:
+            try:
+                sku, values = self.parse_row(row)
+            except (ValueError, TypeError) as e:
+                stats.errors += 1
+                self.errors.append((line, str(e)))
+                continue
+            digest = content_hash(values)
+            existing = self.existing.get(sku)
+            if existing is None and self.match_slug:
+                pk = self.unlinked.pop(slugify(values['name']), None)
+                if pk is not None:
+                    linked[pk] = sku
+                    changed[pk] = (values, digest)
+                    continue
+            if existing is None:
+                slug = unique_slug(slugify(values['name']), self.slugs)
+                new.append(Product(sku=sku, slug=slug, sync_hash=digest, **values))
+                urls.append(None if self.skip_images else (row.get('image_url') or '').strip())
+            elif existing[1] == digest and not self.force:
+                stats.unchanged += 1
+            else:
+                changed[existing[0]] = (values, digest)
+
+        groups, updated = self.dirty_updates(changed, timezone.now(), linked) if changed else ({}, 0)
+        images = self.attach_images(executor, new, urls) if new else 0
+        if new or groups:
+            with transaction.atomic():
+                Product.objects.bulk_create(new)
+                for fields, products in groups.items():
+                    Product.objects.bulk_update(products, fields)
+        if new or updated:
+            bump_catalog_version()
+
+        stats.rows += len(chunk)
+        stats.created += len(new)
+        stats.updated += updated
+        stats.unchanged += len(changed) - updated
+        stats.linked += len(linked)
+        stats.images += images
+
+    def deactivate_missing_products(self):
+        """Mark products whose SKU wasn't in the feed unavailable; returns the count"""
+        missing = [pk for sku, (pk, _) in self.existing.items() if sku not in self.seen]
+        deactivated = 0
+        now = timezone.now()
+        for start in range(0, len(missing), DEACTIVATE_BATCH_SIZE):
+            # Clearing the hash makes the product update when it is back in the feed
+            deactivated += Product.objects.filter(
+                id__in=missing[start:start + DEACTIVATE_BATCH_SIZE], available=True
+            ).update(available=False, sync_hash='', updated_at=now)
+        if deactivated:
+            bump_catalog_version()
+        return deactivated
+
+    def run(self, progress=None):
+        """Sync the whole feed; returns SyncStats"""
+        stats = SyncStats()
+        self.load_lookups()
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            for chunk in self.read_chunks(0):
+                self.sync_chunk(executor, chunk, stats)
+                if progress:
+                    progress(stats)
+        # An empty feed is more likely a broken export than an empty catalog
+        if self.deactivate_missing and stats.rows:
+            stats.deactivated = self.deactivate_missing_products()
+        return stats
@@ -0,0 +1,299 @@
+"""
+Stock reservation for checkout
+
+Stock is taken with a single conditional UPDATE
+(stock = stock - n WHERE stock >= n) covering every product in the order,
+so concurrent checkouts can never sell more than is in stock and no row
+is read and written back in Python. An order holds its stock until it is
+paid; unpaid orders are cancelled and their stock released once the
+reservation expires (see the release_stock_reservations command).
+
+Warehouse counts are applied the same way: apply_stock_changes() sets or
+adjusts stock for thousands of products with one UPDATE per batch.
+"""
+
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, F, PositiveIntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Order, OrderItem, Product
+
+
+logger = logging.getLogger(__name__)
+
+STOCK_RESERVATION_TTL = 30 * 60  # 30 minutes
+
+
+class InsufficientStock(Exception):
+    """Raised when some products in a reservation don't have enough stock"""
+
+    def __init__(self, shortages):
+        # {product_id: units currently in stock}
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for products {sorted(shortages)}")
+
+
+def get_reservation_expiry(now=None):
+    """Return when a reservation made now should be released if unpaid"""
+    ttl = getattr(settings, 'STOCK_RESERVATION_TTL', STOCK_RESERVATION_TTL)
+    return (now or timezone.now()) + timedelta(seconds=ttl)
+
+
+def line_quantities(lines):
+    """Sum cart or order line quantities per product id"""
+    quantities = {}
+    for line in lines:
+        product_id = line['product'].id
+        quantities[product_id] = quantities.get(product_id, 0) + line['quantity']
+    return quantities
+
+
+def reserve_stock(quantities):
+    """
+    Take stock for {product_id: quantity} all-or-nothing in one UPDATE
+
+    Raises InsufficientStock (with nothing reserved) if any product is short.
+    """
+    if not quantities:
+        return
+    with transaction.atomic():
+        updated = Product.objects.filter(
+            reduce(or_, (Q(id=product_id, stock__gte=quantity)
+                         for product_id, quantity in quantities.items()))
+        ).update(stock=Case(
+            *[When(id=product_id, then=F('stock') - quantity)
+              for product_id, quantity in quantities.items()],
+            default=F('stock'),
+            output_field=PositiveIntegerField()
+        ))
+        if updated < len(quantities):
+            transaction.set_rollback(True)
+
+    if updated < len(quantities):
+        in_stock = dict(Product.objects.filter(id__in=quantities).values_list('id', 'stock'))
+        raise InsufficientStock({
+            product_id: in_stock.get(product_id, 0)
+            for product_id, quantity in quantities.items()
+            if in_stock.get(product_id, 0) < quantity
+        })
+
+
+def release_stock(quantities):
+    """Return {product_id: quantity} to stock in one UPDATE"""
+    if not quantities:
+        return
+    Product.objects.filter(id__in=quantities).update(stock=Case(
+        *[When(id=product_id, then=F('stock') + quantity)
+          for product_id, quantity in quantities.items()],
+        default=F('stock'),
+        output_field=PositiveIntegerField()
+    ))
+
+
+def order_quantities(order_id):
+    """Sum an order's item quantities per product id"""
+    quantities = {}
+    for product_id, quantity in OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def confirm_reservation(order):
+    """
+    Keep an order's reserved stock for good once it has been paid
+
+    If the reservation already expired and was released, the stock is
+    reserved again. Returns False when that is no longer possible.
+    """
+    with transaction.atomic():
+        claimed = Order.objects.filter(
+            pk=order.pk, reservation_expires_at__isnull=False
+        ).update(reservation_expires_at=None)
+        order.reservation_expires_at = None
+        if claimed:
+            return True
+        # Released while the payment was in flight: take the stock back
+        reopened = Order.objects.filter(pk=order.pk, status='cancelled').update(status='processing')
+        if not reopened:
+            return True
+        order.status = 'processing'
+        try:
+            reserve_stock(order_quantities(order.pk))
+        except InsufficientStock as e:
+            # Leave the order cancelled, so it isn't shipped or reopened twice
+            transaction.set_rollback(True)
+            order.status = 'cancelled'
+            logger.error(f"Order {order.order_number} was paid after its stock was released: {e}")
+            return False
+    return True
+
+
+def release_expired_reservations(now=None):
+    """Cancel unpaid orders whose reservation expired and restock them; returns the count"""
+    expired = list(Order.objects.filter(
+        reservation_expires_at__lt=now or timezone.now(),
+        payment_status__in=['pending', 'failed'],
+    ).values_list('pk', flat=True))
+
+    released = 0
+    for order_id in expired:
+        with transaction.atomic():
+            # Conditional update so a payment confirmed meanwhile wins
+            claimed = Order.objects.filter(
+                pk=order_id, reservation_expires_at__isnull=False,
+                payment_status__in=['pending', 'failed'],
+            ).update(reservation_expires_at=None, status='cancelled')
+            if claimed:
+                release_stock(order_quantities(order_id))
+                released += 1
+    return released
+
+
+# Batch stock updates (warehouse reconciliation)
+
+STOCK_UPDATE_BATCH_SIZE = 500
+
+
+class StockUpdateSummary:
+    """Outcome of apply_stock_changes"""
+
+    def __init__(self):
+        self.updated = 0
+        self.back_in_stock = 0
+        self.sold_out = 0
+        self.unknown = []  # identifiers that matched no product
+
+
+def read_stock_changes(rows):
+    """
+    Parse CSV rows (dicts) of id or slug plus stock or delta
+
+    Returns ({identifier: ('set' | 'add', amount)}, errors) where an
+    identifier is an int id or a slug. Repeated products are folded in
+    file order: a later stock replaces, a later delta adds.
+    """
+    changes = {}
+    errors = []
+    for line, row in enumerate(rows, start=2):
+        product = (row.get('id') or '').strip() or (row.get('slug') or '').strip()
+        stock = (row.get('stock') or '').strip()
+        delta = (row.get('delta') or '').strip()
+        try:
+            if not product or bool(stock) == bool(delta):
+                raise ValueError('needs an id or slug and exactly one of stock or delta')
+            key = int(product) if (row.get('id') or '').strip() else product
+            if stock:
+                if int(stock) < 0:
+                    raise ValueError('stock cannot be negative')
+                changes[key] = ('set', int(stock))
+            else:
+                mode, amount = changes.get(key, ('add', 0))
+                changes[key] = (mode, amount + int(delta))
+        except ValueError as e:
+            errors.append((line, str(e)))
+    return changes, errors
+
+
+def apply_stock_changes(changes, batch_size=STOCK_UPDATE_BATCH_SIZE):
+    """
+    Apply {id or slug: ('set' | 'add', amount)} in one transaction
+
+    Each batch is one UPDATE setting stock (deltas clamped at 0),
+    available = stock > 0 and updated_at together. Returns a
+    StockUpdateSummary.
+    """
+    summary = StockUpdateSummary()
+    slugs = [key for key in changes if isinstance(key, str)]
+    ids = {}
+    for start in range(0, len(slugs), batch_size):
+        ids.update(Product.objects.filter(slug__in=slugs[start:start + batch_size]).values_list('slug', 'id'))
+
+    by_id = {}
+    for key, change in changes.items():
+        product_id = ids.get(key) if isinstance(key, str) else key
+        if product_id is None:
+            summary.unknown.append(key)
+        elif product_id in by_id and change[0] == 'add':
+            # The same product listed by id and by slug
+            mode, amount = by_id[product_id]
+            by_id[product_id] = (mode, amount + change[1])
+        else:
+            by_id[product_id] = change
+
+    pending = list(by_id.items())
+    now = timezone.now()
+    with transaction.atomic():
+        for start in range(0, len(pending), batch_size):
+            batch = dict(pending[start:start + batch_size])
+            before = dict(Product.objects.filter(id__in=batch).values_list('id', 'available'))
+            summary.unknown.extend(product_id for product_id in batch if product_id not in before)
+
+            # One WHEN per distinct amount rather than per product keeps the
+            # statement small: warehouse files repeat the same few values
+            groups = {}
+            for product_id, change in batch.items():
+                groups.setdefault(change, []).append(product_id)
+            stock_cases, available_cases = [], []
+            for (mode, amount), product_ids in groups.items():
+                if mode == 'set':
+                    stock_cases.append(When(id__in=product_ids, then=Value(amount)))
+                    available_cases.append(When(id__in=product_ids, then=Value(amount > 0)))
+                else:
+                    # Right-hand sides see the pre-update stock
+                    stock_cases.append(When(id__in=product_ids, then=Greatest(F('stock') + amount, Value(0))))
+                    available_cases.append(When(id__in=product_ids, stock__gt=-amount, then=Value(True)))
+                    available_cases.append(When(id__in=product_ids, then=Value(False)))
+            summary.updated += Product.objects.filter(id__in=before).update(
+                stock=Case(*stock_cases, default=F('stock'), output_field=PositiveIntegerField()),
+                available=Case(*available_cases, default=F('available'), output_field=BooleanField()),
+                updated_at=now,
+            )
+
+            after = dict(Product.objects.filter(id__in=before).values_list('id', 'available'))
+            for product_id, was_available in before.items():
+                if after[product_id] and not was_available:
+                    summary.back_in_stock += 1
+                elif was_available and not after[product_id]:
+                    summary.sold_out += 1
+
+    if summary.updated:
+        bump_catalog_version()
+    return summary
+
+
+# Inventory report
+
+LOW_STOCK_THRESHOLD = 5
+REPORT_CHUNK_SIZE = 2000
+
+
+def inventory_summary(low_stock_threshold=LOW_STOCK_THRESHOLD):
+    """Product, restock and out-of-stock counts computed in one aggregate query"""
+    return Product.objects.aggregate(
+        total=Count('id'),
+        available=Count('id', filter=Q(available=True)),
+        low_stock=Count('id', filter=Q(stock__gt=0, stock__lte=low_stock_threshold)),
+        out_of_stock=Count('id', filter=Q(stock=0)),
+    )
+
+
+def inventory_rows(chunk_size=REPORT_CHUNK_SIZE):
+    """
+    Stream (id, name, category name, stock, available) by category and name
+
+    Tuples from a server-side iterator with the category joined in, so
+    memory stays flat however large the catalog is.
+    """
+    return (
+        Product.objects.order_by('category__name', 'name', 'id')
+        .values_list('id', 'name', 'category__name', 'stock', 'available')
+        .iterator(chunk_size=chunk_size)
+    )
@@ -0,0 +1,58 @@
+"""
+Management command to time rendering product prices in every active currency
+
+Builds unsaved products with precomputed converted prices (nothing is
+written to the database) and renders their prices with the per-price
+tags and with the batch {% prices %} tag.
+
+Usage:
+python manage.py benchmark_prices
+python manage.py benchmark_prices --count 1000 --repeat 20
+"""
+
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Template
+
+from shop.currency import get_price_book
+from shop.models import Product
+
+
+TEMPLATES = {
+    'show_price': '{% load currency_tags %}{% for p in products %}{% show_price p.price %}{% endfor %}',
+    'product_price': '{% load currency_tags %}{% for p in products %}{% product_price p %}{% endfor %}',
+    'prices': '{% load currency_tags %}{% prices products %}{% for p in products %}{{ p.display_price }}{% endfor %}',
+}
+
+
+class Command(BaseCommand):
+    help = 'Time rendering product prices with the currency template tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Prices per render')
+        parser.add_argument('--repeat', type=int, default=10, help='Renders per measurement (best is reported)')
+
+    def handle(self, *args, **options):
+        book = get_price_book()
+        products = []
+        for i in range(options['count']):
+            product = Product(name=f'Product {i}', price=Decimal(499 + i * 37) + Decimal('0.50'))
+            product.converted_prices = book.price_entry(product.price)
+            products.append(product)
+
+        self.stdout.write(f"Rendering {len(products)} prices (best of {options['repeat']}):")
+        for code in book.currencies:
+            for name, source in TEMPLATES.items():
+                template = Template(source)
+                best = None
+                for _ in range(options['repeat']):
+                    request = type('Request', (), {'session': {'currency': code}})()
+                    start = time.perf_counter()
+                    template.render(Context({'request': request, 'products': products}))
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(f"  {code} {name:<14} {best * 1000:8.2f} ms")
+
+        self.stdout.write(self.style.SUCCESS('\nBenchmark completed!'))
@@ -0,0 +1,50 @@
+"""
+Management command to build resized product image derivatives
+
+Derivatives are normally built in the background after each product save;
+use this to backfill existing products or after changing the presets.
+
+Usage:
+python manage.py build_image_derivatives
+python manage.py build_image_derivatives --product-id 12 --force
+python manage.py build_image_derivatives --workers 8
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from shop.images import build_derivatives
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Build thumbnail, card and zoom derivatives for product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product-id', type=int, help='Only build derivatives for this product')
+        parser.add_argument('--force', action='store_true', help='Re-render even if the source image is unchanged')
+        parser.add_argument('--workers', type=int, default=4, help='Number of parallel workers')
+
+    def handle(self, *args, **options):
+        products = Product.objects.filter(Q(image__gt='') | Q(image_2__gt='') | Q(image_3__gt=''))
+        if options['product_id']:
+            products = products.filter(id=options['product_id'])
+        product_ids = list(products.values_list('id', flat=True))
+
+        def build(product_id):
+            try:
+                return build_derivatives(product_id, force=options['force'])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            changed = sum(executor.map(build, product_ids))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Checked {len(product_ids)} product(s), updated derivatives for {changed}'
+            )
+        )
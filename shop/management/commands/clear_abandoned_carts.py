@@ -0,0 +1,34 @@
+"""
+Management command to delete anonymous carts whose sessions have expired
+
+Anonymous database carts (CART_STORAGE='shop.cart.DatabaseCartStorage')
+are only reachable through the visitor's session; once the session
+expires or is flushed without a login, their CartItem rows are orphaned.
+Carts whose id is in no unexpired session are deleted, unless a line was
+changed in the last --grace seconds (default one hour). Needs a
+database-backed SESSION_ENGINE (the default). Run it periodically
+alongside clearsessions, e.g. from cron:
+
+python manage.py clear_abandoned_carts
+python manage.py clear_abandoned_carts --grace 600
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.cart import ABANDONED_CART_GRACE, clear_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = 'Delete anonymous cart lines that no unexpired session refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=ABANDONED_CART_GRACE,
+                            help='Keep carts changed within this many seconds (default: 3600)')
+
+    def handle(self, *args, **options):
+        try:
+            deleted = clear_abandoned_carts(options['grace'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {deleted} abandoned cart line(s)')
+        )
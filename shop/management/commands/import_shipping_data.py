@@ -0,0 +1,52 @@
+"""
+Management command to bulk import pincodes or shipping rates from Excel or CSV
+
+Pincode columns: Pincode, Zone, City, State, Country
+Rate columns: Name, Description, Country, Cost, Min Ship, Min Order,
+Max Order, Free Ship, Priority
+
+Rows are streamed and upserted in batches: existing pincodes (matched on
+the pincode) and rates (matched on name and country) are updated, new
+ones created, and pincode rows identical to what is stored are skipped.
+
+Usage:
+python manage.py import_shipping_data pincodes pincodes.xlsx
+python manage.py import_shipping_data rates rates.csv
+python manage.py import_shipping_data pincodes all_india.csv --batch-size 5000
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.shipping_import import IMPORTERS, SHIPPING_IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Bulk import pincodes or shipping rates from an Excel (.xlsx) or CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS), help='What the file contains')
+        parser.add_argument('file', type=str, help='Path to .xlsx or .csv file')
+        parser.add_argument('--batch-size', type=int, default=SHIPPING_IMPORT_BATCH_SIZE, help='Rows per upsert')
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options['kind']](batch_size=options['batch_size'])
+
+        def progress(stats):
+            self.stdout.write(f"  {stats.rows} rows read...")
+
+        try:
+            stats = importer.run(options['file'], progress=progress if options['verbosity'] > 1 else None)
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {options['file']}")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for line, message in importer.errors:
+            self.stdout.write(self.style.ERROR(f"✗ Row {line}: {message}"))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nImport completed!\nRows: {stats.rows}\nCreated: {stats.created}\n"
+                f"Updated: {stats.updated}\nUnchanged: {stats.unchanged}\nErrors: {stats.errors}"
+            )
+        )
@@ -0,0 +1,26 @@
+"""
+Management command to recompute product rating aggregates from reviews
+
+Ratings are normally kept up to date as reviews change; run this after
+importing or deleting reviews in bulk (e.g. with queryset.update()).
+
+Usage:
+python manage.py rebuild_ratings
+python manage.py rebuild_ratings --batch-size 5000
+"""
+
+from django.core.management.base import BaseCommand
+from shop.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute product rating averages, counts and histograms from reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products updated per query')
+
+    def handle(self, *args, **options):
+        updated = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Updated rating aggregates for {updated} product(s)')
+        )
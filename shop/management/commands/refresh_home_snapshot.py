@@ -0,0 +1,27 @@
+"""
+Management command to rebuild the cached home page sections
+
+The snapshot is rebuilt automatically after catalog changes and when it
+times out; run this after deploys or from cron to keep the first visitor
+from paying for the rebuild.
+
+Usage:
+python manage.py refresh_home_snapshot
+"""
+
+from django.core.management.base import BaseCommand
+from shop.home import refresh_home_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the cached new arrivals, bestsellers and category highlights for the home page'
+
+    def handle(self, *args, **options):
+        snapshot = refresh_home_snapshot()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Home snapshot refreshed: {len(snapshot['new_arrivals'])} new arrivals, "
+                f"{len(snapshot['bestsellers'])} bestsellers, "
+                f"{len(snapshot['category_highlights'])} category highlights"
+            )
+        )
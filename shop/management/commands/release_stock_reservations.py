@@ -0,0 +1,21 @@
+"""
+Management command to release stock held by unpaid orders
+
+Orders that are still unpaid when their reservation expires are cancelled
+and their items returned to stock. Run it periodically, e.g. from cron:
+
+python manage.py release_stock_reservations
+"""
+
+from django.core.management.base import BaseCommand
+from shop.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Cancel unpaid orders with expired stock reservations and restock their items'
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(
+            self.style.SUCCESS(f'Released stock for {released} expired order(s)')
+        )
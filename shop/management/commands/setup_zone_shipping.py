@@ -6,10 +6,46 @@ python manage.py setup_zone_shipping
 """
 
 from django.core.management.base import BaseCommand
-from shop.models import ShippingZone
+from shop.models import PincodeRule, ShippingZone
+from shop.shipping import bump_shipping_version
 from decimal import Decimal
 
 
+# Indian pincodes are grouped by their leading digits (postal regions), so a
+# few prefix rules cover every pincode; exact pincode rows can still override.
+# Uttarakhand shares the 24x and 26x sorting districts with Uttar Pradesh, so
+# its rules are narrower and the longest matching prefix wins.
+INDIA_PREFIX_ZONES = [
+    ('1', 'north', 'Delhi, Haryana, Punjab, Himachal Pradesh, Jammu & Kashmir'),
+    ('2', 'central', 'Uttar Pradesh'),
+    ('246', 'north', 'Uttarakhand (Garhwal)'),
+    ('2467', 'central', 'Uttar Pradesh (Bijnor)'),
+    ('2476', 'north', 'Uttarakhand (Roorkee)'),
+    ('248', 'north', 'Uttarakhand (Dehradun)'),
+    ('249', 'north', 'Uttarakhand (Haridwar, Rishikesh)'),
+    ('2623', 'north', 'Uttarakhand (Khatima, Tanakpur)'),
+    ('2624', 'north', 'Uttarakhand (Sitarganj)'),
+    ('2625', 'north', 'Uttarakhand (Pithoragarh, Champawat)'),
+    ('2626', 'north', 'Uttarakhand (Pithoragarh)'),
+    ('263', 'north', 'Uttarakhand (Kumaon)'),
+    ('3', 'west', 'Rajasthan, Gujarat, Daman & Diu, Dadra & Nagar Haveli'),
+    ('40', 'west', 'Maharashtra, Goa'),
+    ('41', 'west', 'Maharashtra'),
+    ('42', 'west', 'Maharashtra'),
+    ('43', 'west', 'Maharashtra'),
+    ('44', 'west', 'Maharashtra'),
+    ('45', 'central', 'Madhya Pradesh'),
+    ('46', 'central', 'Madhya Pradesh'),
+    ('47', 'central', 'Madhya Pradesh'),
+    ('48', 'central', 'Madhya Pradesh'),
+    ('49', 'central', 'Chhattisgarh'),
+    ('5', 'south', 'Andhra Pradesh, Telangana, Karnataka'),
+    ('6', 'south', 'Tamil Nadu, Kerala, Puducherry'),
+    ('7', 'east', 'West Bengal, Odisha, Assam, Northeast states'),
+    ('8', 'east', 'Bihar, Jharkhand'),
+]
+
+
 class Command(BaseCommand):
     help = 'Set up zone-based shipping rates for India'
 
@@ -79,6 +115,18 @@ class Command(BaseCommand):
             )
         )
         
+        # Prefix rules route every Indian pincode to a zone
+        zones_by_key = {zone.zone: zone for zone in ShippingZone.objects.all()}
+        PincodeRule.objects.filter(country='India').delete()
+        PincodeRule.objects.bulk_create([
+            PincodeRule(prefix=prefix, zone=zones_by_key[zone], state=states, country='India')
+            for prefix, zone, states in INDIA_PREFIX_ZONES
+        ])
+        bump_shipping_version()
+        self.stdout.write(
+            self.style.SUCCESS(f'Created {len(INDIA_PREFIX_ZONES)} pincode prefix rules for India')
+        )
+        
         # Display summary
         self.stdout.write('\n' + '='*70)
         self.stdout.write('SHIPPING ZONES SUMMARY (Per Kilogram Rates)')
@@ -94,8 +142,6 @@ class Command(BaseCommand):
         self.stdout.write('\n' + '='*70)
         self.stdout.write('\nNEXT STEPS:')
         self.stdout.write('1. Add weight to products (in kg)')
-        self.stdout.write('2. Import pincode data via Excel')
-        self.stdout.write('3. Go to Admin > Pincode Zones')
-        self.stdout.write('4. Click "Import from Excel"')
-        self.stdout.write('5. Download sample template and fill it with pincodes')
+        self.stdout.write('2. Every Indian pincode is already routed by its prefix rule')
+        self.stdout.write('3. Add Pincode Zone rows only for pincodes that need a different zone')
         self.stdout.write('='*70)
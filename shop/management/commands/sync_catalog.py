@@ -0,0 +1,66 @@
+"""
+Management command to sync the product catalog with a supplier feed
+
+The feed is a CSV with the import_products columns plus a stable `sku`:
+sku,name,description,price,category,stock,size,color,image_url
+"TS-RED-M","T-Shirt Red","Comfortable cotton t-shirt",25.99,"Clothing",50,"M","red","https://example.com/image.jpg"
+
+Products are matched on SKU: new SKUs are created, changed rows update
+only their changed fields, unchanged rows are skipped, and products whose
+SKU is no longer in the feed are marked unavailable.
+
+Products without a SKU, such as the whole catalog on the first sync, are
+linked to the feed row whose name slugifies to their slug and updated
+from it rather than created again; --no-match-slug creates every unknown
+SKU as a new product. SKU-less products that match no row are left as
+they are.
+
+Usage:
+python manage.py sync_catalog feed.csv
+python manage.py sync_catalog feed.csv --keep-missing
+python manage.py sync_catalog feed.csv --force
+python manage.py sync_catalog feed.csv --no-match-slug
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importer import IMPORT_BATCH_SIZE, IMPORT_IMAGE_WORKERS, CatalogSync
+
+
+class Command(BaseCommand):
+    help = 'Create, update and deactivate products from a supplier CSV feed keyed on SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', type=str, help='Path to CSV feed')
+        parser.add_argument('--skip-images', action='store_true', help="Don't download images for new products")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Rows per batch')
+        parser.add_argument('--workers', type=int, default=IMPORT_IMAGE_WORKERS, help='Parallel image downloads')
+        parser.add_argument('--keep-missing', action='store_true', help="Don't deactivate products missing from the feed")
+        parser.add_argument('--force', action='store_true', help='Compare every row, even if unchanged since the last sync')
+        parser.add_argument('--no-match-slug', action='store_true',
+                            help="Don't link products without a SKU to feed rows by slug")
+
+    def handle(self, *args, **options):
+        sync = CatalogSync(
+            options['csv_file'],
+            batch_size=max(1, options['batch_size']),
+            workers=options['workers'],
+            skip_images=options['skip_images'],
+            deactivate_missing=not options['keep_missing'],
+            force=options['force'],
+            match_slug=not options['no_match_slug'],
+        )
+        try:
+            stats = sync.run()
+        except FileNotFoundError:
+            raise CommandError(f"CSV file not found: {options['csv_file']}")
+
+        for line, message in sync.errors:
+            self.stdout.write(self.style.ERROR(f"✗ Line {line}: {message}"))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\nSync completed!\nCreated: {stats.created}\nUpdated: {stats.updated}\n'
+                f'Unchanged: {stats.unchanged}\nLinked by slug: {stats.linked}\nDeactivated: {stats.deactivated}\nErrors: {stats.errors}'
+            )
+        )
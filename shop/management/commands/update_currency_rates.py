@@ -0,0 +1,123 @@
+"""
+Management command to load display currency rates and recompute product prices
+
+Rates are units of the currency per 1 INR. A JSON file maps codes to
+either a rate or an object of fields:
+
+    {"USD": {"rate": "0.012", "symbol": "$", "name": "US Dollar", "rounding": "charm"},
+     "AED": "0.044"}
+
+A CSV file has the columns code, rate and optionally name, symbol,
+decimal_places, rounding, grouping and is_active.
+
+Existing currencies (matched on the code) are updated, new ones created,
+and every product's converted prices are rebuilt once at the end.
+
+Usage:
+python manage.py update_currency_rates rates.json
+python manage.py update_currency_rates rates.csv
+python manage.py update_currency_rates --rebuild-only
+"""
+
+import csv
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from shop.currency import BASE_CURRENCY, rebuild_price_book
+from shop.models import CurrencyRate
+
+
+ROUNDING_RULES = {choice for choice, _ in CurrencyRate.ROUNDING_CHOICES}
+GROUPINGS = {choice for choice, _ in CurrencyRate.GROUPING_CHOICES}
+
+
+def read_rates(path):
+    """Return [(code, {field: value})] from a JSON or CSV rates file"""
+    if os.path.splitext(path)[1].lower() == '.json':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError('The JSON file must map currency codes to rates')
+        return [
+            (code, dict(value) if isinstance(value, dict) else {'rate': value})
+            for code, value in data.items()
+        ]
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return [
+            (row.pop('code', ''), {key: value for key, value in row.items() if key and value not in (None, '')})
+            for row in csv.DictReader(f)
+        ]
+
+
+def parse_rate(code, fields):
+    """Validate one currency's fields into CurrencyRate defaults"""
+    code = str(code or '').strip().upper()
+    if not code or len(code) > 3:
+        raise ValueError(f'{code!r} is not a currency code')
+    if code == BASE_CURRENCY:
+        raise ValueError(f'{BASE_CURRENCY} is the base currency and has no rate')
+    try:
+        rate = Decimal(str(fields['rate']))
+    except KeyError:
+        raise ValueError(f'{code}: rate is required')
+    except InvalidOperation:
+        raise ValueError(f"{code}: rate must be a number, got {fields['rate']!r}")
+    if not rate.is_finite() or rate <= 0:
+        raise ValueError(f'{code}: rate must be positive')
+
+    defaults = {'rate': rate}
+    for field in ('name', 'symbol'):
+        if field in fields:
+            defaults[field] = str(fields[field])
+    if 'decimal_places' in fields:
+        defaults['decimal_places'] = int(fields['decimal_places'])
+    if 'rounding' in fields:
+        if fields['rounding'] not in ROUNDING_RULES:
+            raise ValueError(f"{code}: rounding must be one of {', '.join(sorted(ROUNDING_RULES))}")
+        defaults['rounding'] = fields['rounding']
+    if 'grouping' in fields:
+        if fields['grouping'] not in GROUPINGS:
+            raise ValueError(f"{code}: grouping must be one of {', '.join(sorted(GROUPINGS))}")
+        defaults['grouping'] = fields['grouping']
+    if 'is_active' in fields:
+        defaults['is_active'] = str(fields['is_active']).lower() not in ('0', 'no', 'false', 'n')
+    return code, defaults
+
+
+class Command(BaseCommand):
+    help = 'Load display currency rates from JSON or CSV and recompute converted product prices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', type=str, help='Path to .json or .csv rates file')
+        parser.add_argument('--rebuild-only', action='store_true', help='Only recompute converted prices')
+
+    def handle(self, *args, **options):
+        if not options['file'] and not options['rebuild_only']:
+            raise CommandError('Give a rates file, or --rebuild-only')
+
+        created = updated = 0
+        if options['file']:
+            try:
+                rates = [parse_rate(code, fields) for code, fields in read_rates(options['file'])]
+            except FileNotFoundError:
+                raise CommandError(f"File not found: {options['file']}")
+            except (ValueError, TypeError) as e:
+                raise CommandError(str(e))
+
+            with transaction.atomic():
+                for code, defaults in rates:
+                    _, was_created = CurrencyRate.objects.update_or_create(code=code, defaults=defaults)
+                    created += was_created
+                    updated += not was_created
+
+        products = rebuild_price_book()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nCurrency rates updated!\nCreated: {created}\nUpdated: {updated}\n"
+                f"Products repriced: {products}"
+            )
+        )
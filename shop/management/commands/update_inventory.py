@@ -5,14 +5,32 @@ Usage:
 python manage.py update_inventory --product-id 1 --stock 25
 python manage.py update_inventory --product-name "Blue T-Shirt" --stock 30
 python manage.py update_inventory --list-products  # List all products with stock levels
+python manage.py update_inventory --list-products --format csv > inventory.csv
+python manage.py update_inventory --batch counts.csv  # Many products at once
+warehouse-export | python manage.py update_inventory --batch -
+
+Batch files are CSV with a header: an `id` or `slug` column, and a `stock`
+(absolute count) or `delta` (+/- adjustment) column, e.g.
+slug,stock
+gold-ring,25
 """
 
-from django.core.management.base import BaseCommand
+import csv
+import json
+import sys
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.inventory import (
+    LOW_STOCK_THRESHOLD, REPORT_CHUNK_SIZE, apply_stock_changes, inventory_rows,
+    inventory_summary, read_stock_changes
+)
 from shop.models import Product
 
 
 class Command(BaseCommand):
     help = 'Update product inventory levels'
+    stealth_options = ('stdin',)
 
     def add_arguments(self, parser):
         parser.add_argument('--product-id', type=int, help='Product ID to update')
@@ -21,11 +39,17 @@ class Command(BaseCommand):
         parser.add_argument('--add-stock', type=int, help='Add this amount to current stock')
         parser.add_argument('--subtract-stock', type=int, help='Subtract this amount from current stock')
         parser.add_argument('--list-products', action='store_true', help='List all products with stock levels')
-        parser.add_argument('--low-stock', type=int, default=5, help='Show products with stock below this level')
+        parser.add_argument('--low-stock', type=int, default=LOW_STOCK_THRESHOLD, help='Show products with stock below this level')
+        parser.add_argument('--format', choices=['text', 'csv', 'json'], default='text', help='Output format for --list-products')
+        parser.add_argument('--batch', type=str, help="CSV of id|slug,stock|delta rows ('-' for stdin)")
 
     def handle(self, *args, **options):
         if options['list_products']:
-            self.list_products(options['low_stock'])
+            self.list_products(options['low_stock'], options['format'])
+            return
+
+        if options['batch']:
+            self.update_batch(options['batch'], options.get('stdin') or sys.stdin)
             return
 
         if not (options['product_id'] or options['product_name']):
@@ -45,20 +69,20 @@ class Command(BaseCommand):
             if options['product_id']:
                 product = Product.objects.get(id=options['product_id'])
             else:
-                products = Product.objects.filter(name__icontains=options['product_name'])
-                if products.count() == 0:
+                products = list(Product.objects.filter(name__icontains=options['product_name'])[:20])
+                if len(products) == 0:
                     self.stdout.write(
                         self.style.ERROR(f'No products found matching: {options["product_name"]}')
                     )
                     return
-                elif products.count() > 1:
+                elif len(products) > 1:
                     self.stdout.write('Multiple products found:')
                     for p in products:
                         self.stdout.write(f'  ID: {p.id} - {p.name} (Stock: {p.stock})')
                     self.stdout.write('Please use --product-id to specify exactly which one.')
                     return
                 else:
-                    product = products.first()
+                    product = products[0]
 
             # Update stock
             old_stock = product.stock
@@ -88,38 +112,104 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Product with ID {options["product_id"]} not found')
             )
 
-    def list_products(self, low_stock_threshold):
-        """List all products with their stock levels"""
-        products = Product.objects.all().order_by('category__name', 'name')
-        
-        self.stdout.write('=' * 80)
-        self.stdout.write('INVENTORY REPORT')
-        self.stdout.write('=' * 80)
-        
-        current_category = None
-        total_products = 0
-        low_stock_products = 0
-        
-        for product in products:
-            if current_category != product.category.name:
-                current_category = product.category.name
-                self.stdout.write(f'\n📂 {current_category.upper()}')
-                self.stdout.write('-' * 40)
-            
-            status = '✅' if product.available else '❌'
-            stock_status = '⚠️ LOW' if product.stock <= low_stock_threshold and product.stock > 0 else ''
-            if product.stock == 0:
-                stock_status = '🚫 OUT'
-            
-            self.stdout.write(
-                f'  {status} [{product.id:3d}] {product.name[:30]:<30} '
-                f'Stock: {product.stock:3d} {stock_status}'
+    def update_batch(self, path, stdin):
+        """Apply a CSV of stock changes in one transaction"""
+        try:
+            if path == '-':
+                changes, errors = read_stock_changes(csv.DictReader(stdin))
+            else:
+                with open(path, newline='', encoding='utf-8') as f:
+                    changes, errors = read_stock_changes(csv.DictReader(f))
+        except FileNotFoundError:
+            raise CommandError(f'CSV file not found: {path}')
+
+        for line, message in errors:
+            self.stdout.write(self.style.ERROR(f'✗ Line {line}: {message}'))
+        summary = apply_stock_changes(changes)
+        if summary.unknown:
+            shown = ', '.join(str(key) for key in summary.unknown[:20])
+            more = f' and {len(summary.unknown) - 20} more' if len(summary.unknown) > 20 else ''
+            self.stdout.write(self.style.WARNING(f'Unknown products: {shown}{more}'))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Updated {summary.updated} products\n'
+                f'  Back in stock: {summary.back_in_stock}\n'
+                f'  Sold out: {summary.sold_out}\n'
+                f'  Unknown: {len(summary.unknown)}\n'
+                f'  Invalid rows: {len(errors)}'
             )
-            
-            total_products += 1
-            if product.stock <= low_stock_threshold:
-                low_stock_products += 1
-        
-        self.stdout.write('\n' + '=' * 80)
-        self.stdout.write(f'SUMMARY: {total_products} products, {low_stock_products} need restocking')
-        self.stdout.write('=' * 80)
\ No newline at end of file
+        )
+
+    def list_products(self, low_stock_threshold, output_format='text'):
+        """Stream every product's stock level as text, CSV or JSON"""
+        summary = inventory_summary(low_stock_threshold)
+        rows = inventory_rows()
+        writer = {'csv': self.write_csv, 'json': self.write_json}.get(output_format, self.write_text)
+        writer(rows, summary, low_stock_threshold)
+
+    def write_buffered(self, lines):
+        """Write lines in chunks rather than one write call per product"""
+        buffer = []
+        for line in lines:
+            buffer.append(line)
+            if len(buffer) >= REPORT_CHUNK_SIZE:
+                self.stdout.write('\n'.join(buffer))
+                buffer = []
+        if buffer:
+            self.stdout.write('\n'.join(buffer))
+
+    def write_text(self, rows, summary, low_stock_threshold):
+        def lines():
+            yield '=' * 80
+            yield 'INVENTORY REPORT'
+            yield '=' * 80
+            current_category = None
+            for product_id, name, category, stock, available in rows:
+                if current_category != category:
+                    current_category = category
+                    yield f'\n📂 {category.upper()}'
+                    yield '-' * 40
+                status = '✅' if available else '❌'
+                stock_status = '🚫 OUT' if stock == 0 else '⚠️ LOW' if stock <= low_stock_threshold else ''
+                yield f'  {status} [{product_id:3d}] {name[:30]:<30} Stock: {stock:3d} {stock_status}'
+            yield '\n' + '=' * 80
+            yield (
+                f"SUMMARY: {summary['total']} products, "
+                f"{summary['low_stock'] + summary['out_of_stock']} need restocking "
+                f"({summary['out_of_stock']} out of stock)"
+            )
+            yield '=' * 80
+        self.write_buffered(lines())
+
+    def write_csv(self, rows, summary, low_stock_threshold):
+        buffer = StringIO()
+        writer = csv.writer(buffer, lineterminator='')
+
+        def render(row):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            return buffer.getvalue()
+
+        def lines():
+            yield render(('id', 'name', 'category', 'stock', 'available', 'status'))
+            for product_id, name, category, stock, available in rows:
+                status = 'out' if stock == 0 else 'low' if stock <= low_stock_threshold else 'ok'
+                yield render((product_id, name, category, stock, int(available), status))
+        self.write_buffered(lines())
+
+    def write_json(self, rows, summary, low_stock_threshold):
+        def lines():
+            yield '{"summary": %s, "low_stock_threshold": %d, "products": [' % (
+                json.dumps(summary), low_stock_threshold
+            )
+            separator = ''
+            for product_id, name, category, stock, available in rows:
+                yield separator + json.dumps({
+                    'id': product_id, 'name': name, 'category': category,
+                    'stock': stock, 'available': available,
+                })
+                separator = ','
+            yield ']}'
+        self.write_buffered(lines())
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:51
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    """Fill the new columns from existing reviews"""
+    Product = apps.get_model('shop', 'Product')
+    Review = apps.get_model('shop', 'Review')
+    stats = Review.objects.order_by().values('product').annotate(
+        total=Count('id'),
+        **{f'rating_{stars}_count': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)}
+    )
+    for row in stats:
+        product_id = row.pop('product')
+        total = row.pop('total')
+        rating_sum = sum(stars * row[f'rating_{stars}_count'] for stars in range(1, 6))
+        Product.objects.filter(pk=product_id).update(
+            rating_count=total, rating_avg=rating_sum / total, **row
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_order_reservation_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
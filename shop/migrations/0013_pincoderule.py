@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_product_sku'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PincodeRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(blank=True, help_text="Matches every postal code starting with this, e.g. '11' or 'SW1A'", max_length=10)),
+                ('range_start', models.CharField(blank=True, help_text='First postal code of a range (same length as the end)', max_length=10)),
+                ('range_end', models.CharField(blank=True, help_text='Last postal code of a range', max_length=10)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('state', models.CharField(blank=True, max_length=100)),
+                ('country', models.CharField(default='India', help_text='Country for these postal codes', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('zone', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='pincode_rules', to='shop.shippingzone')),
+            ],
+            options={
+                'ordering': ['country', 'prefix', 'range_start'],
+                'indexes': [models.Index(fields=['country', 'prefix'], name='shop_pincod_country_106686_idx'), models.Index(fields=['country', 'range_start'], name='shop_pincod_country_f7ca33_idx')],
+            },
+        ),
+    ]
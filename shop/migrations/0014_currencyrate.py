@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:29
+
+from decimal import Decimal
+import django.core.validators
+from django.db import migrations, models
+
+
+def add_usd_rate(apps, schema_editor):
+    """Keep the USD rate that used to be hard-coded in shop.currency"""
+    CurrencyRate = apps.get_model('shop', 'CurrencyRate')
+    CurrencyRate.objects.get_or_create(
+        code='USD', defaults={'name': 'US Dollar', 'symbol': '$', 'rate': Decimal('0.012')}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_pincoderule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='ISO 4217 code, e.g. USD', max_length=3, unique=True)),
+                ('name', models.CharField(blank=True, max_length=50)),
+                ('symbol', models.CharField(max_length=5)),
+                ('rate', models.DecimalField(decimal_places=8, help_text='Units of this currency per 1 INR', max_digits=18, validators=[django.core.validators.MinValueValidator(Decimal('1E-8'))])),
+                ('decimal_places', models.PositiveSmallIntegerField(default=2, validators=[django.core.validators.MaxValueValidator(4)])),
+                ('rounding', models.CharField(choices=[('exact', 'Exact (nearest minor unit)'), ('whole', 'Round up to a whole unit'), ('charm', 'Charm pricing (e.g. 12.99, or 1,999 without decimals)')], default='exact', max_length=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='converted_prices',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(add_usd_rate, migrations.RunPython.noop),
+    ]
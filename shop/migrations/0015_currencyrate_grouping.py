@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_currencyrate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='currencyrate',
+            name='grouping',
+            field=models.CharField(choices=[('western', 'Thousands (1,000,000)'), ('indian', 'Lakhs and crores (10,00,000)')], default='western', help_text='Digit grouping when prices are shown', max_length=10),
+        ),
+    ]
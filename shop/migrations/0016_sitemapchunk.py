@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_currencyrate_grouping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SitemapChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(unique=True)),
+                ('first_id', models.PositiveIntegerField()),
+                ('last_id', models.PositiveIntegerField()),
+                ('base_url', models.CharField(help_text='Scheme and domain the URLs were written with', max_length=200)),
+                ('url_count', models.PositiveIntegerField(default=0)),
+                ('lastmod', models.DateTimeField()),
+                ('file', models.CharField(help_text='Storage name of the .xml.gz file', max_length=255)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['number'],
+            },
+        ),
+    ]
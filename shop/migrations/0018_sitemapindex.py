@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_versioncounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SitemapIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_url', models.CharField(help_text='Scheme and domain the index was last written with', max_length=200)),
+                ('modified_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'sitemap index',
+            },
+        ),
+    ]
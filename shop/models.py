@@ -6,14 +6,19 @@ This module contains all the database models for our Sri Devi Fashion Jewellery:
 - UserProfile: Extended user information
 - Order: Customer orders
 - OrderItem: Individual items within an order
+- CartItem: Shopping cart lines for the database cart storage
+- CurrencyRate: Exchange rates and price rounding for display currencies
+- SitemapChunk: Precompressed product sitemap files, one per product id range
+- VersionCounter: Shared change counters for the per-process catalog, shipping and currency data
 """
 
 from decimal import Decimal
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Length
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.validators import MinValueValidator, MaxValueValidator
-from PIL import Image
 
 
 class Category(models.Model):
@@ -67,6 +72,8 @@ class Product(models.Model):
 
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
+    # Supplier SKU that catalog feed rows are matched on (see shop.importer.CatalogSync)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
@@ -97,6 +104,24 @@ class Product(models.Model):
     meta_description = models.CharField(max_length=160, blank=True)
     meta_keywords = models.CharField(max_length=200, blank=True)
     
+    # Resized WebP/JPEG copies of the images above, maintained by shop.images
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Price in every active currency (converted and rounded), maintained by shop.currency
+    converted_prices = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Content hash of the last feed row applied by sync_catalog
+    sync_hash = models.CharField(max_length=32, blank=True, editable=False)
+    
+    # Review aggregates, kept up to date by shop.ratings
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -107,6 +132,9 @@ class Product(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['available']),
             models.Index(fields=['created_at']),
+            # Keyset pagination order, overall and per category
+            models.Index(fields=['-created_at', '-id'], name='product_recent_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_recent_idx'),
         ]
 
     def __str__(self):
@@ -115,37 +143,40 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse('shop:product_detail', kwargs={'slug': self.slug})
 
+    @property
+    def rating_histogram(self):
+        """Return (stars, count, percent) rows from 5 stars down to 1"""
+        rows = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}_count')
+            percent = round(count * 100 / self.rating_count) if self.rating_count else 0
+            rows.append((stars, count, percent))
+        return rows
+
+    # Image names as last loaded or saved, to tell when derivatives need rebuilding
+    _saved_image_names = ('', '', '')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_image_names = instance.get_image_names()
+        return instance
+
+    def get_image_names(self):
+        """Return the stored names of the three product images"""
+        return tuple(
+            getattr(self, field).name or '' if field in self.__dict__ else None
+            for field in ('image', 'image_2', 'image_3')
+        )
+
+    def images_changed(self):
+        """Check if any image differs from the last load or save"""
+        return self.get_image_names() != self._saved_image_names
+
     def save(self, *args, **kwargs):
-        """Override save to resize images"""
+        """Save the product; image derivatives are built in the background (see shop.images)"""
         super().save(*args, **kwargs)
-        
-        # Resize main image
-        if self.image:
-            self.resize_image(self.image.path, (800, 800))
-        
-        # Resize additional images
-        if self.image_2:
-            self.resize_image(self.image_2.path, (800, 800))
-            
-        if self.image_3:
-            self.resize_image(self.image_3.path, (800, 800))
-
-    def resize_image(self, image_path, size):
-        """Resize image to specified size while maintaining aspect ratio"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        try:
-            with Image.open(image_path) as img:
-                # Convert to RGB if image is in RGBA mode
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Resize image
-                img.thumbnail(size, Image.Resampling.LANCZOS)
-                img.save(image_path, 'JPEG', quality=95)
-        except Exception as e:
-            logger.error(f"Error resizing image {image_path}: {e}")
+        self._saved_image_names = self.get_image_names()
 
     def is_in_stock(self):
         """Check if product is in stock"""
@@ -245,6 +276,8 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     shipped_at = models.DateTimeField(blank=True, null=True)
     delivered_at = models.DateTimeField(blank=True, null=True)
+    # Set while the order holds reserved stock and is awaiting payment
+    reservation_expires_at = models.DateTimeField(blank=True, null=True, db_index=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -282,6 +315,37 @@ class OrderItem(models.Model):
         return self.price * self.quantity
 
 
+class CartItem(models.Model):
+    """Persistent cart line used by the database cart storage"""
+    cart_id = models.CharField(max_length=32, blank=True, db_index=True,
+                               help_text="Session cart id for anonymous carts")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items',
+                             null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    price = models.DecimalField(max_digits=10, decimal_places=2)  # Price when added to cart
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'product'],
+                condition=models.Q(user__isnull=False),
+                name='unique_user_cart_item'
+            ),
+            models.UniqueConstraint(
+                fields=['cart_id', 'product'],
+                condition=models.Q(user__isnull=True),
+                name='unique_anonymous_cart_item'
+            ),
+        ]
+
+    def __str__(self):
+        owner = self.user.username if self.user_id else self.cart_id
+        return f"{owner} - {self.quantity} x {self.product.name}"
+
+
 class Review(models.Model):
     """Product review model"""
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
@@ -348,54 +412,11 @@ class ShippingRate(models.Model):
         2. For India with pincode, use zone-based weight pricing
         3. For other countries, use country-based weight pricing (cost per kg)
         4. Fallback to default rate if no match found
-        """
-        # Step 1: Determine country from pincode if provided
-        if pincode:
-            detected_country = PincodeZone.get_country_from_pincode(pincode)
-            if detected_country:
-                country = detected_country
         
-        # Step 2: For India, try zone-based pricing first
-        if country == 'India' and pincode:
-            zone_rate = ShippingZone.get_rate_for_pincode(pincode, cart_total, total_weight_kg)
-            if zone_rate is not None:
-                return zone_rate
-        
-        # Step 3: Use country-based weight pricing (cost per kg from ShippingRate)
-        rates = ShippingRate.objects.filter(
-            is_active=True,
-            country=country,
-            min_order_value__lte=cart_total
-        ).order_by('priority', 'min_order_value')
-        
-        for rate in rates:
-            # Check max order value constraint
-            if rate.max_order_value and cart_total > rate.max_order_value:
-                continue
-            
-            # Check free shipping threshold (NOT USED - no free shipping)
-            # if rate.free_shipping_threshold and cart_total >= rate.free_shipping_threshold:
-            #     return Decimal('0.00')
-            
-            # Calculate shipping cost: cost per kg × total weight
-            shipping_cost = rate.cost * Decimal(str(total_weight_kg))
-            
-            # Apply minimum shipping charge
-            if rate.min_shipping_charge and shipping_cost < rate.min_shipping_charge:
-                shipping_cost = rate.min_shipping_charge
-            
-            return shipping_cost.quantize(Decimal('0.01'))
-        
-        # Step 4: Fallback - default rate per kg if no match found
-        default_rate_per_kg = Decimal('50.00')
-        default_min_charge = Decimal('100.00')
-        shipping_cost = (default_rate_per_kg * Decimal(str(total_weight_kg))).quantize(Decimal('0.01'))
-        
-        # Apply default minimum charge
-        if shipping_cost < default_min_charge:
-            shipping_cost = default_min_charge
-            
-        return shipping_cost
+        Quotes come from the in-memory tables in shop.shipping (no queries).
+        """
+        from .shipping import quote_shipping
+        return quote_shipping(cart_total, country, pincode, total_weight_kg)
 
 
 class ShippingZone(models.Model):
@@ -433,19 +454,11 @@ class ShippingZone(models.Model):
     
     @staticmethod
     def get_rate_for_pincode(pincode, cart_total, total_weight_kg):
-        """Get shipping rate for a pincode based on weight"""
-        try:
-            pincode_obj = PincodeZone.objects.select_related('zone').get(pincode=pincode)
-            if pincode_obj.zone.is_active:
-                # Check free shipping threshold
-                if cart_total >= pincode_obj.zone.free_shipping_threshold:
-                    return Decimal('0.00')
-                # Calculate shipping cost based on weight
-                shipping_cost = pincode_obj.zone.cost_per_kg * Decimal(str(total_weight_kg))
-                return shipping_cost.quantize(Decimal('0.01'))
-        except PincodeZone.DoesNotExist:
-            pass
-        return None
+        """Get shipping rate for a pincode based on weight (None if it has no active zone)"""
+        from .shipping import get_shipping_tables
+        return get_shipping_tables().zone_cost(
+            pincode, Decimal(str(cart_total)), Decimal(str(total_weight_kg))
+        )
 
 
 class PincodeZone(models.Model):
@@ -471,11 +484,176 @@ class PincodeZone(models.Model):
         return f"{self.pincode} - {self.country}"
     
     @staticmethod
-    def get_country_from_pincode(pincode):
-        """Get country from pincode/postal code"""
-        try:
-            pincode_obj = PincodeZone.objects.get(pincode=pincode)
-            return pincode_obj.country
-        except PincodeZone.DoesNotExist:
-            # Return None if postal code not found - caller should use form country
-            return None
\ No newline at end of file
+    def get_country_from_pincode(pincode, country=None):
+        """Get country from pincode/postal code (rules are only searched in country, if given)"""
+        # None if the postal code is unknown - caller should use form country
+        from .shipping import get_shipping_tables
+        return get_shipping_tables().get_country(pincode, country)
+
+
+def normalize_pincode(pincode):
+    """Canonical form of a pincode/postal code for matching: upper case, no spaces or dashes"""
+    return (pincode or '').upper().replace(' ', '').replace('-', '')
+
+
+class PincodeRule(models.Model):
+    """
+    Mapping of a pincode prefix or range to a shipping zone and country
+    
+    One rule covers many postal codes (e.g. prefix '11' for Delhi, 'SW1A'
+    for a UK outward code, or 110001-110096). Exact PincodeZone rows
+    override rules; among rules of a country a range beats a prefix and a
+    longer prefix beats a shorter one.
+    """
+    prefix = models.CharField(max_length=10, blank=True,
+                              help_text="Matches every postal code starting with this, e.g. '11' or 'SW1A'")
+    range_start = models.CharField(max_length=10, blank=True,
+                                   help_text="First postal code of a range (same length as the end)")
+    range_end = models.CharField(max_length=10, blank=True, help_text="Last postal code of a range")
+    zone = models.ForeignKey(ShippingZone, on_delete=models.CASCADE, related_name='pincode_rules', null=True, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=100, blank=True)
+    country = models.CharField(max_length=100, default='India', help_text="Country for these postal codes")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['country', 'prefix', 'range_start']
+        indexes = [
+            models.Index(fields=['country', 'prefix']),
+            models.Index(fields=['country', 'range_start']),
+        ]
+    
+    def __str__(self):
+        codes = f"{self.prefix}*" if self.prefix else f"{self.range_start}-{self.range_end}"
+        if self.zone:
+            return f"{codes} - {self.zone.get_zone_display()} ({self.country})"
+        return f"{codes} - {self.country}"
+    
+    def clean(self):
+        """Require exactly one of a prefix or a non-overlapping range"""
+        self.normalize()
+        if bool(self.prefix) == bool(self.range_start or self.range_end):
+            raise ValidationError('Enter either a prefix or a range start and end.')
+        if self.prefix:
+            return
+        if not (self.range_start and self.range_end):
+            raise ValidationError('A range needs both a start and an end.')
+        if len(self.range_start) != len(self.range_end) or self.range_start > self.range_end:
+            raise ValidationError('Range start and end must have the same length, start first.')
+        overlapping = PincodeRule.objects.filter(
+            country=self.country,
+            range_start__lte=self.range_end,
+            range_end__gte=self.range_start,
+        ).exclude(pk=self.pk).annotate(
+            start_length=Length('range_start')
+        ).filter(start_length=len(self.range_start))
+        if overlapping.exists():
+            raise ValidationError(f'Range overlaps {overlapping.first()}.')
+    
+    def normalize(self):
+        self.prefix = normalize_pincode(self.prefix)
+        self.range_start = normalize_pincode(self.range_start)
+        self.range_end = normalize_pincode(self.range_end)
+    
+    def save(self, *args, **kwargs):
+        """Store codes in the normalized form they are matched in"""
+        self.normalize()
+        super().save(*args, **kwargs)
+
+
+class CurrencyRate(models.Model):
+    """
+    Exchange rate and display rules for one currency
+    
+    Prices are stored in INR; rate is how many units of this currency one
+    rupee buys. Converted product prices are precomputed from these rows
+    (see shop.currency).
+    """
+    ROUNDING_CHOICES = [
+        ('exact', 'Exact (nearest minor unit)'),
+        ('whole', 'Round up to a whole unit'),
+        ('charm', 'Charm pricing (e.g. 12.99, or 1,999 without decimals)'),
+    ]
+    GROUPING_CHOICES = [
+        ('western', 'Thousands (1,000,000)'),
+        ('indian', 'Lakhs and crores (10,00,000)'),
+    ]
+    
+    code = models.CharField(max_length=3, unique=True, help_text="ISO 4217 code, e.g. USD")
+    name = models.CharField(max_length=50, blank=True)
+    symbol = models.CharField(max_length=5)
+    rate = models.DecimalField(max_digits=18, decimal_places=8, validators=[MinValueValidator(Decimal('0.00000001'))],
+                               help_text="Units of this currency per 1 INR")
+    decimal_places = models.PositiveSmallIntegerField(default=2, validators=[MaxValueValidator(4)])
+    rounding = models.CharField(max_length=10, choices=ROUNDING_CHOICES, default='exact')
+    grouping = models.CharField(max_length=10, choices=GROUPING_CHOICES, default='western',
+                                help_text="Digit grouping when prices are shown")
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['code']
+    
+    def __str__(self):
+        return f"{self.code} ({self.symbol}{self.rate} per ₹1)"
+    
+    def save(self, *args, **kwargs):
+        self.code = self.code.upper()
+        super().save(*args, **kwargs)
+
+
+class SitemapChunk(models.Model):
+    """
+    One gzip-compressed product sitemap file in storage
+    
+    Chunk n lists the available products with ids in [first_id, last_id];
+    url_count and lastmod (the newest product update) tell shop.sitemaps
+    whether the file still matches the catalog.
+    """
+    number = models.PositiveIntegerField(unique=True)
+    first_id = models.PositiveIntegerField()
+    last_id = models.PositiveIntegerField()
+    base_url = models.CharField(max_length=200, help_text="Scheme and domain the URLs were written with")
+    url_count = models.PositiveIntegerField(default=0)
+    lastmod = models.DateTimeField()
+    file = models.CharField(max_length=255, help_text="Storage name of the .xml.gz file")
+    generated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['number']
+    
+    def __str__(self):
+        return f"Products sitemap {self.number} ({self.url_count} URLs)"
+
+
+class SitemapIndex(models.Model):
+    """
+    When the sitemap index last changed (a single row)
+    
+    Moved by shop.sitemaps whenever a refresh writes, adds or removes a
+    product chunk or the base URL changes, and served as the index's
+    Last-Modified.
+    """
+    base_url = models.CharField(max_length=200, help_text="Scheme and domain the index was last written with")
+    modified_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name_plural = "sitemap index"
+    
+    def __str__(self):
+        return f"Sitemap index ({self.modified_at:%Y-%m-%d %H:%M:%S})"
+
+
+class VersionCounter(models.Model):
+    """
+    A named change counter shared by every worker (see shop.versions)
+    
+    Incremented atomically in the database whenever the data it guards
+    changes, so it works whatever the cache backend.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
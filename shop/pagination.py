@@ -0,0 +1,236 @@
+"""
+Keyset (seek) pagination for product listings
+
+Pages are ordered newest first on (-created_at, -id) and fetched with
+WHERE (created_at, id) < (cursor) instead of OFFSET, so a deep page costs
+the same single indexed query as the first. Links carry an opaque cursor
+naming the edge row of the current page. Counts come from a COUNT(*)
+cached per catalog version rather than one per request, and legacy page
+numbers (/products/page/<n>/, ?page=<n>) are mapped to cursors by looking
+up the row before the page on the ordering columns, cached per page.
+
+Cursors come from the URL, so decoding checks every field's type and
+range; anything else is treated as no cursor (page one).
+"""
+
+import binascii
+import json
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import Http404
+
+from .catalog import get_catalog_version
+
+
+PAGINATION_CACHE_TIMEOUT = 60 * 60  # 1 hour; a catalog change switches keys anyway
+
+# Real cursors are well under this; longer tokens aren't decoded at all
+MAX_CURSOR_LENGTH = 200
+MAX_ID = 2 ** 63 - 1
+
+
+def encode_cursor(created_at, pk, number=None, reverse=False):
+    """Return an opaque token for a position in the (-created_at, -id) ordering"""
+    payload = json.dumps([created_at.isoformat(), pk, number, reverse], separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (created_at, pk, number, reverse), or None for a malformed token"""
+    if len(token) > MAX_CURSOR_LENGTH:
+        return None
+    try:
+        payload = urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, pk, number, reverse = json.loads(payload)
+        created_at = datetime.fromisoformat(created_at)
+    except (TypeError, ValueError, binascii.Error):
+        return None
+    # bool is an int subclass, so check it isn't one where an id is expected
+    if not (type(pk) is int and 0 < pk <= MAX_ID and isinstance(reverse, bool)):
+        return None
+    if number is not None and not (type(number) is int and 0 < number <= MAX_ID):
+        return None
+    if settings.USE_TZ and created_at.tzinfo is None:
+        return None
+    return created_at, pk, number, reverse
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator, shaped like django.core.paginator.Page"""
+
+    def __init__(self, object_list, paginator, number, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def page_window(self):
+        """Page numbers to link around the current page (none if it isn't known)"""
+        if not self.number:
+            return range(0)
+        return range(max(1, self.number - 2), min(self.paginator.num_pages, self.number + 2) + 1)
+
+    @property
+    def next_cursor(self):
+        if not (self._has_next and self.object_list):
+            return None
+        last = self.object_list[-1]
+        number = self.number + 1 if self.number else None
+        return encode_cursor(last.created_at, last.pk, number)
+
+    @property
+    def previous_cursor(self):
+        if not (self._has_previous and self.object_list):
+            return None
+        first = self.object_list[0]
+        number = self.number - 1 if self.number else None
+        return encode_cursor(first.created_at, first.pk, number, reverse=True)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset newest first without OFFSET or per-request COUNT
+
+    key names the filtered set (e.g. 'category:3') for the cached count and
+    page boundaries; it must change whenever the queryset's filters do.
+    """
+
+    def __init__(self, queryset, per_page, key):
+        self.queryset = queryset.order_by('-created_at', '-id')
+        self.per_page = per_page
+        self.key = key
+
+    def cache_key(self, kind):
+        return f'shop:pages:{get_catalog_version()}:{kind}:{self.key}:{self.per_page}'
+
+    @property
+    def count(self):
+        """Number of rows, counted once per catalog version"""
+        timeout = getattr(settings, 'PAGINATION_CACHE_TIMEOUT', PAGINATION_CACHE_TIMEOUT)
+        return cache.get_or_set(self.cache_key('count'), self.queryset.count, timeout)
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def get_page(self, cursor=None):
+        """Return the page after (or, for a previous-page cursor, before) the cursor"""
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._fetch(self.queryset, number=1, has_previous=False)
+
+        created_at, pk, number, reverse = position
+        if reverse:
+            queryset = self.queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')
+            items = list(queryset[:self.per_page + 1])
+            has_previous = len(items) > self.per_page
+            items = items[:self.per_page]
+            items.reverse()
+            return KeysetPage(items, self, number, has_next=True, has_previous=has_previous)
+
+        queryset = self.queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+        return self._fetch(queryset, number=number, has_previous=True)
+
+    def get_numbered_page(self, number):
+        """Return page `number` (1-based); raises Http404 past the last page"""
+        if number == 1:
+            return self.get_page()
+        if not 1 < number <= self.num_pages:
+            raise Http404('Invalid page.')
+        boundary = self.get_boundary(number)
+        if not boundary:
+            raise Http404('Invalid page.')
+        created_at, pk = boundary
+        page = self.get_page(encode_cursor(created_at, pk, number))
+        if not page.object_list:
+            raise Http404('Invalid page.')
+        return page
+
+    def get_boundary(self, number):
+        """
+        Return (created_at, id) of the last row before page `number`
+
+        One query on the ordering columns, cached per page, so a catalog
+        change costs each requested page number a single lookup rather
+        than a scan of the whole listing. Empty past the last row.
+        """
+        key = self.cache_key(f'boundary:{number}')
+        boundary = cache.get(key)
+        if boundary is None:
+            offset = (number - 1) * self.per_page - 1
+            rows = self.queryset.values_list('created_at', 'id')[offset:offset + 1]
+            boundary = list(rows[0]) if rows else []
+            timeout = getattr(settings, 'PAGINATION_CACHE_TIMEOUT', PAGINATION_CACHE_TIMEOUT)
+            cache.set(key, boundary, timeout)
+        return boundary
+
+    def _fetch(self, queryset, number, has_previous):
+        items = list(queryset[:self.per_page + 1])
+        has_next = len(items) > self.per_page
+        return KeysetPage(items[:self.per_page], self, number, has_next, has_previous)
+
+
+def paginate_request(request, paginator, number=None):
+    """
+    Return the page a request asks for
+
+    A ?cursor= token wins; otherwise a page number from the URL (number) or
+    ?page= is resolved through the paginator's cached boundaries.
+    """
+    cursor = request.GET.get('cursor')
+    if cursor:
+        return paginator.get_page(cursor)
+    number = number or request.GET.get('page')
+    if number:
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise Http404('Invalid page.')
+        return paginator.get_numbered_page(number)
+    return paginator.get_page()
+
+
+class KeysetPaginationMixin:
+    """Use a KeysetPaginator for a ListView's paginate_by"""
+
+    def get_pagination_key(self):
+        """Name of the filtered product set being paginated"""
+        return 'all'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, self.get_pagination_key())
+        page = paginate_request(self.request, paginator, self.kwargs.get('page'))
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,80 @@
+"""
+Denormalized product rating aggregates
+
+Product.rating_avg, rating_count and the per-star rating_N_count columns
+are adjusted in place with a single UPDATE whenever a review is added,
+changed or deleted (see shop.signals), so product pages and listings can
+show ratings without aggregating reviews. rebuild_ratings() recomputes
+them from scratch, e.g. after bulk imports that bypass signals.
+"""
+
+from django.db.models import Case, Count, F, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Product, Review
+
+
+RATING_FIELDS = {stars: f'rating_{stars}_count' for stars in range(1, 6)}
+
+
+def apply_rating_change(product_id, added=None, removed=None):
+    """
+    Adjust a product's aggregates for one review rating added and/or removed
+
+    An edited review passes both its new (added) and old (removed) rating.
+    """
+    if added == removed:
+        return
+    count_delta = (added is not None) - (removed is not None)
+    sum_delta = (added or 0) - (removed or 0)
+
+    # Every right-hand side below sees the pre-update row
+    rating_sum = sum((F(field) * stars for stars, field in RATING_FIELDS.items()), Value(0))
+    new_count = F('rating_count') + count_delta
+    changes = {
+        'rating_count': new_count,
+        'rating_avg': Case(
+            When(rating_count__gt=-count_delta,
+                 then=Cast(rating_sum + sum_delta, FloatField()) / new_count),
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+        'updated_at': timezone.now(),
+    }
+    if added is not None:
+        changes[RATING_FIELDS[added]] = F(RATING_FIELDS[added]) + 1
+    if removed is not None:
+        changes[RATING_FIELDS[removed]] = F(RATING_FIELDS[removed]) - 1
+    Product.objects.filter(pk=product_id).update(**changes)
+
+
+def rebuild_ratings(batch_size=1000):
+    """Recompute every product's aggregates from its reviews; returns products updated"""
+    stats = Review.objects.order_by().values('product').annotate(
+        total=Count('id'),
+        **{field: Count('id', filter=Q(rating=stars)) for stars, field in RATING_FIELDS.items()}
+    )
+
+    fields = ['rating_avg', 'rating_count', *RATING_FIELDS.values()]
+    batch = []
+    updated = 0
+    for row in stats.iterator(chunk_size=batch_size):
+        product = Product(pk=row['product'], rating_count=row['total'])
+        rating_sum = 0
+        for stars, field in RATING_FIELDS.items():
+            setattr(product, field, row[field])
+            rating_sum += stars * row[field]
+        product.rating_avg = rating_sum / row['total']
+        batch.append(product)
+        if len(batch) == batch_size:
+            updated += Product.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        updated += Product.objects.bulk_update(batch, fields)
+
+    # Products whose last review was deleted without signals firing
+    updated += Product.objects.filter(rating_count__gt=0, reviews__isnull=True).update(
+        rating_avg=0, rating_count=0, **{field: 0 for field in RATING_FIELDS.values()}
+    )
+    return updated
@@ -0,0 +1,615 @@
+"""
+Product search backends for Sri Devi Fashion Jewellery
+
+This module provides pluggable search backends for the product search page:
+- DatabaseSearchBackend: the original icontains-based SQL search
+- InvertedIndexBackend: an in-process inverted index with BM25 ranking,
+  prefix matching and bitset-based filtering
+
+The active backend is selected with the SEARCH_BACKEND setting and is kept
+up to date incrementally by the Product/Category signals in shop.signals,
+using the shared catalog version from shop.catalog.
+"""
+
+import math
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils.module_loading import import_string
+
+from .catalog import get_catalog_version
+from .models import Product
+
+
+DEFAULT_SEARCH_BACKEND = 'shop.search.InvertedIndexBackend'
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+# Field weights - a term in the name counts three times as much as one in the description
+FIELD_WEIGHTS = (
+    ('name', 3),
+    ('brand', 2),
+    ('category_name', 2),
+    ('description', 1),
+)
+
+# Fields with a bitset per value, usable as filters and facets
+FACET_FIELDS = ('category', 'size', 'color', 'brand')
+
+# Maximum number of index terms a prefix may expand to
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def stem(word):
+    """Reduce a word to its stem using a light suffix-stripping stemmer"""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'shes', 'ches', 'xes')):
+        return word[:-2]
+    if word.endswith('ing') and len(word) > 5:
+        return word[:-3]
+    if word.endswith('ed') and len(word) > 4:
+        return word[:-2]
+    if word.endswith('ly') and len(word) > 4:
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens, dropping stop words"""
+    if not text:
+        return []
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def analyze(text):
+    """Tokenize and stem text for indexing or querying"""
+    return [stem(token) for token in tokenize(text)]
+
+
+class SearchResults:
+    """
+    Lazy, ordered sequence of search hits
+
+    Holds only product ids; products are fetched from the database one
+    slice at a time, so paginating 10,000 hits loads just one page of rows.
+    """
+
+    def __init__(self, product_ids):
+        self.product_ids = list(product_ids)
+
+    def count(self):
+        return len(self.product_ids)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __iter__(self):
+        chunk_size = 100
+        for start in range(0, len(self.product_ids), chunk_size):
+            yield from self[start:start + chunk_size]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._fetch(self.product_ids[key])
+        return self._fetch([self.product_ids[key]])[0]
+
+    def _fetch(self, product_ids):
+        """Load products for the given ids, preserving search order"""
+        products = Product.objects.filter(
+            id__in=product_ids, available=True
+        ).select_related('category').in_bulk()
+        # Ids removed since the index was last refreshed are silently skipped
+        return [products[pk] for pk in product_ids if pk in products]
+
+
+class BaseSearchBackend:
+    """Interface shared by all product search backends"""
+
+    def search(self, query='', category=None, min_price=None, max_price=None,
+               size=None, color=None, brand=None):
+        """Return an ordered sequence of matching available products"""
+        raise NotImplementedError
+
+    def facet_counts(self, query='', price_buckets=(), **filters):
+        """
+        Return {'category'|'size'|'color'|'brand': {value: count}, 'price': [count, ...]}
+
+        Each facet ignores its own filter; price counts follow price_buckets.
+        """
+        raise NotImplementedError
+
+    def update_product(self, product, version=None):
+        """Called after a product is saved; version is the new catalog version"""
+
+    def remove_product(self, product_id, version=None):
+        """Called after a product is deleted"""
+
+    def update_category(self, category, version=None):
+        """Called after a category is saved"""
+
+    def rebuild(self):
+        """Rebuild any derived search state from the database"""
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Plain SQL search using icontains lookups (no index to maintain)"""
+
+    def filtered(self, query='', category=None, min_price=None, max_price=None,
+                 size=None, color=None, brand=None):
+        """Return the unordered queryset of matching products"""
+        queryset = Product.objects.filter(available=True)
+
+        if query:
+            queryset = queryset.filter(
+                Q(name__icontains=query) |
+                Q(description__icontains=query) |
+                Q(category__name__icontains=query) |
+                Q(brand__icontains=query)
+            )
+
+        if category:
+            queryset = queryset.filter(category__slug=category)
+
+        if min_price:
+            queryset = queryset.filter(price__gte=min_price)
+
+        if max_price:
+            queryset = queryset.filter(price__lte=max_price)
+
+        if size:
+            queryset = queryset.filter(size=size)
+
+        if color:
+            queryset = queryset.filter(color=color)
+
+        if brand:
+            queryset = queryset.filter(brand=brand)
+
+        return queryset
+
+    def search(self, query='', **filters):
+        return self.filtered(query, **filters).select_related('category').order_by('-created_at')
+
+    def facet_counts(self, query='', price_buckets=(), **filters):
+        counts = {}
+        for field, column in (('category', 'category__slug'), ('size', 'size'),
+                              ('color', 'color'), ('brand', 'brand')):
+            others = {name: value for name, value in filters.items() if name != field}
+            rows = self.filtered(query, **others).values(column).annotate(count=Count('id'))
+            counts[field] = {row[column]: row['count'] for row in rows if row[column]}
+
+        others = {name: value for name, value in filters.items()
+                  if name not in ('min_price', 'max_price')}
+        aggregates = {}
+        for position, (low, high) in enumerate(price_buckets):
+            condition = Q(price__gte=low) if low is not None else Q()
+            if high is not None:
+                condition &= Q(price__lt=high)
+            aggregates[f'bucket_{position}'] = Count('id', filter=condition)
+        totals = self.filtered(query, **others).aggregate(**aggregates) if aggregates else {}
+        counts['price'] = [totals[f'bucket_{position}'] for position in range(len(price_buckets))]
+        return counts
+
+
+def ordinals_to_bits(ordinals):
+    """Pack an iterable of ordinals into an int bitset"""
+    ordinals = list(ordinals)
+    if not ordinals:
+        return 0
+    buffer = bytearray((max(ordinals) >> 3) + 1)
+    for ordinal in ordinals:
+        buffer[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def bits_to_ordinals(bits):
+    """Yield the ordinals set in an int bitset, lowest first"""
+    digits = bin(bits)[:1:-1]
+    position = digits.find('1')
+    while position != -1:
+        yield position
+        position = digits.find('1', position + 1)
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index over available products
+
+    Every document gets a dense ordinal. Term postings and facet values are
+    turned into Python int bitsets keyed by ordinal (built on demand and
+    cached until the underlying set changes), so filters are combined with a
+    handful of bitwise ANDs instead of extra SQL predicates.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """Drop all indexed documents"""
+        self.postings = {}        # term -> {ordinal: weighted term frequency}
+        self.facets = {}          # (field, value) -> set of ordinals
+        self.doc_ids = []         # ordinal -> product id (None once freed)
+        self.ordinals = {}        # product id -> ordinal
+        self.free_ordinals = []
+        self.doc_terms = {}       # ordinal -> Counter of terms
+        self.doc_lengths = {}     # ordinal -> weighted document length
+        self.doc_facets = {}      # ordinal -> tuple of facet keys
+        self.prices = {}          # ordinal -> price
+        self.created = {}         # ordinal -> created_at timestamp
+        self.total_length = 0
+        self._bits = {}           # cached bitsets, see bits_for()
+        self._sorted_terms = None
+        self._sorted_prices = None
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def bits_for(self, key):
+        """
+        Return the bitset for a term, a facet key or the special 'live' key
+
+        Terms are looked up as ('term', term) and facets as (field, value).
+        """
+        bits = self._bits.get(key)
+        if bits is None:
+            if key == 'live':
+                members = self.ordinals.values()
+            elif key[0] == 'term':
+                members = self.postings.get(key[1], ())
+            else:
+                members = self.facets.get(key, ())
+            bits = self._bits[key] = ordinals_to_bits(members)
+        return bits
+
+    def add(self, doc):
+        """Index (or re-index) a document dict produced by document_for()"""
+        with self.lock:
+            self.remove(doc['id'])
+
+            if self.free_ordinals:
+                ordinal = self.free_ordinals.pop()
+                self.doc_ids[ordinal] = doc['id']
+            else:
+                ordinal = len(self.doc_ids)
+                self.doc_ids.append(doc['id'])
+            self.ordinals[doc['id']] = ordinal
+
+            terms = Counter()
+            for field, weight in FIELD_WEIGHTS:
+                for term in analyze(doc.get(field)):
+                    terms[term] += weight
+
+            for term, frequency in terms.items():
+                if term not in self.postings:
+                    self.postings[term] = {}
+                    self._sorted_terms = None
+                self.postings[term][ordinal] = frequency
+                self._bits.pop(('term', term), None)
+
+            length = sum(terms.values())
+            self.doc_terms[ordinal] = terms
+            self.doc_lengths[ordinal] = length
+            self.total_length += length
+
+            facets = (
+                ('category', doc.get('category_slug')),
+                ('size', doc.get('size')),
+                ('color', doc.get('color')),
+                ('brand', doc.get('brand')),
+            )
+            for key in facets:
+                self.facets.setdefault(key, set()).add(ordinal)
+                self._bits.pop(key, None)
+            self.doc_facets[ordinal] = facets
+
+            self.prices[ordinal] = doc['price']
+            self.created[ordinal] = doc['created_at']
+            self._bits.pop('live', None)
+            self._sorted_prices = None
+
+    def remove(self, product_id):
+        """Remove a product from the index if present"""
+        with self.lock:
+            ordinal = self.ordinals.pop(product_id, None)
+            if ordinal is None:
+                return
+
+            for term in self.doc_terms.pop(ordinal):
+                postings = self.postings[term]
+                del postings[ordinal]
+                if not postings:
+                    del self.postings[term]
+                    self._sorted_terms = None
+                self._bits.pop(('term', term), None)
+
+            for key in self.doc_facets.pop(ordinal):
+                members = self.facets[key]
+                members.discard(ordinal)
+                if not members:
+                    del self.facets[key]
+                self._bits.pop(key, None)
+
+            self.total_length -= self.doc_lengths.pop(ordinal)
+            del self.prices[ordinal]
+            del self.created[ordinal]
+            self.doc_ids[ordinal] = None
+            self.free_ordinals.append(ordinal)
+            self._bits.pop('live', None)
+            self._sorted_prices = None
+
+    def expand_prefix(self, prefix):
+        """Return index terms starting with prefix (bounded)"""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        terms = self._sorted_terms
+        start = bisect_left(terms, prefix)
+        matches = []
+        for term in terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def price_bits(self, min_price=None, max_price=None, inclusive=True):
+        """
+        Bitset of documents whose price falls in [min_price, max_price]
+
+        With inclusive=False the upper bound is excluded, as used for price buckets.
+        """
+        if self._sorted_prices is None:
+            pairs = sorted((price, ordinal) for ordinal, price in self.prices.items())
+            self._sorted_prices = ([price for price, _ in pairs], [ordinal for _, ordinal in pairs])
+        prices, ordinals = self._sorted_prices
+        start = bisect_left(prices, min_price) if min_price is not None else 0
+        if max_price is None:
+            end = len(prices)
+        elif inclusive:
+            end = bisect_right(prices, max_price)
+        else:
+            end = bisect_left(prices, max_price)
+        return ordinals_to_bits(ordinals[start:end])
+
+    def filter_bits(self, category=None, min_price=None, max_price=None, size=None,
+                    color=None, brand=None):
+        """Intersect facet bitsets for the given filters"""
+        bits = self.bits_for('live')
+        for key in (('category', category), ('size', size), ('color', color), ('brand', brand)):
+            if key[1]:
+                bits &= self.bits_for(key)
+        if bits and (min_price is not None or max_price is not None):
+            bits &= self.price_bits(min_price, max_price)
+        return bits
+
+    def text_bits(self, groups, bits):
+        """Narrow bits to documents matching every query word group"""
+        for terms in groups:
+            group_bits = 0
+            for term in terms:
+                group_bits |= self.bits_for(('term', term))
+            bits &= group_bits
+            if not bits:
+                break
+        return bits
+
+    def query_terms(self, query):
+        """
+        Map a query string to one list of index terms per query word
+
+        The last word is treated as a prefix so partially typed queries match.
+        """
+        tokens = tokenize(query)
+        groups = []
+        for position, token in enumerate(tokens):
+            stemmed = stem(token)
+            if position == len(tokens) - 1:
+                terms = set(self.expand_prefix(stemmed))
+                if token != stemmed:
+                    terms.update(self.expand_prefix(token))
+            else:
+                terms = {stemmed} if stemmed in self.postings else set()
+            groups.append(sorted(terms))
+        return groups
+
+    def search(self, query='', **filters):
+        """Return matching product ids, best match first"""
+        with self.lock:
+            bits = self.filter_bits(**filters)
+            groups = self.query_terms(query)
+
+            if not groups:
+                ranked = sorted(bits_to_ordinals(bits), key=self.created.__getitem__, reverse=True)
+                return [self.doc_ids[ordinal] for ordinal in ranked]
+
+            # Every query word must match at least one of its terms
+            bits = self.text_bits(groups, bits)
+            if not bits:
+                return []
+
+            scores = self.score(set(bits_to_ordinals(bits)), groups)
+            ranked = sorted(scores, key=lambda o: (scores[o], self.created[o]), reverse=True)
+            return [self.doc_ids[ordinal] for ordinal in ranked]
+
+    def facet_counts(self, query='', price_buckets=(), **filters):
+        """
+        Count matching documents per facet value
+
+        Each facet is counted with every filter applied except its own, so
+        the counts show what selecting another value of that facet would give.
+        Price buckets are (min, max) pairs with an exclusive upper bound.
+        """
+        with self.lock:
+            text_bits = self.text_bits(self.query_terms(query), self.bits_for('live'))
+            counts = {}
+            for field in FACET_FIELDS:
+                others = {name: value for name, value in filters.items() if name != field}
+                base = text_bits & self.filter_bits(**others)
+                field_counts = counts[field] = {}
+                for facet, value in self.facets:
+                    if facet == field and value:
+                        field_counts[value] = (base & self.bits_for((facet, value))).bit_count()
+            others = {name: value for name, value in filters.items()
+                      if name not in ('min_price', 'max_price')}
+            base = text_bits & self.filter_bits(**others)
+            counts['price'] = [
+                (base & self.price_bits(low, high, inclusive=False)).bit_count()
+                for low, high in price_buckets
+            ]
+            return counts
+
+    def score(self, candidates, groups):
+        """BM25 score for each candidate ordinal"""
+        total_docs = len(self.ordinals)
+        average_length = self.total_length / total_docs if total_docs else 0
+        scores = dict.fromkeys(candidates, 0.0)
+
+        for terms in groups:
+            for term in terms:
+                postings = self.postings[term]
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for ordinal in candidates.intersection(postings):
+                    frequency = postings[ordinal]
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[ordinal] / average_length)
+                    scores[ordinal] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    Search backend backed by a per-process InvertedIndex
+
+    The index is built lazily on the first search. Saves and deletes are
+    applied incrementally when this process is in step with the catalog
+    version; otherwise (another worker wrote in between) the index is
+    rebuilt on the next search.
+    """
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self.version = None
+
+    @staticmethod
+    def document_for(product):
+        """Build an index document from a Product instance"""
+        return {
+            'id': product.id,
+            'name': product.name,
+            'description': product.description,
+            'brand': product.brand,
+            'category_name': product.category.name,
+            'category_slug': product.category.slug,
+            'size': product.size,
+            'color': product.color,
+            'price': Decimal(str(product.price)),
+            'created_at': product.created_at.timestamp(),
+        }
+
+    def rebuild(self):
+        """Rebuild the whole index from the database"""
+        rows = Product.objects.filter(available=True).values_list(
+            'id', 'name', 'description', 'brand', 'category__name',
+            'category__slug', 'size', 'color', 'price', 'created_at'
+        )
+        with self.index.lock:
+            self.version = get_catalog_version()
+            self.index.clear()
+            for row in rows.iterator(chunk_size=2000):
+                (pk, name, description, brand, category_name,
+                 category_slug, size, color, price, created_at) = row
+                self.index.add({
+                    'id': pk,
+                    'name': name,
+                    'description': description,
+                    'brand': brand,
+                    'category_name': category_name,
+                    'category_slug': category_slug,
+                    'size': size,
+                    'color': color,
+                    'price': price,
+                    'created_at': created_at.timestamp(),
+                })
+
+    def ensure_current(self):
+        """Build the index on first use or when another process changed the catalog"""
+        if self.version is None or self.version != get_catalog_version():
+            self.rebuild()
+
+    def _apply(self, version, change):
+        """
+        Apply an incremental change recorded as catalog `version`
+
+        The change is only applied if the index already reflects version - 1;
+        otherwise the index is marked stale and rebuilt lazily.
+        """
+        with self.index.lock:
+            if self.version is None:
+                return
+            if version is None:
+                change()
+            elif self.version == version - 1:
+                change()
+                self.version = version
+            else:
+                self.version = None
+
+    def search(self, query='', **filters):
+        self.ensure_current()
+        return SearchResults(self.index.search(query or '', **filters))
+
+    def facet_counts(self, query='', price_buckets=(), **filters):
+        self.ensure_current()
+        return self.index.facet_counts(query or '', price_buckets, **filters)
+
+    def update_product(self, product, version=None):
+        def change():
+            if product.available:
+                self.index.add(self.document_for(product))
+            else:
+                self.index.remove(product.id)
+        self._apply(version, change)
+
+    def remove_product(self, product_id, version=None):
+        self._apply(version, lambda: self.index.remove(product_id))
+
+    def update_category(self, category, version=None):
+        # Category name/slug changes affect every product in the category
+        def change():
+            products = Product.objects.filter(
+                category=category, available=True
+            ).select_related('category')
+            for product in products:
+                self.index.add(self.document_for(product))
+        self._apply(version, change)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the process-wide search backend configured in settings"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+                _backend = import_string(path)()
+    return _backend
@@ -0,0 +1,284 @@
+"""
+In-memory shipping rate tables
+
+Pincodes, zones and country rates change rarely but are read on every
+shipping quote, so each process keeps them in plain dicts and tuples:
+pincode -> (zone, country), zone -> per-kg pricing, country -> ordered
+rate bands. A quote is then pure arithmetic with no queries.
+
+Postal codes resolve in order of specificity: an exact PincodeZone row,
+then the country's PincodeRule ranges (binary search over sorted range
+starts), then its longest matching prefix (one dict probe per distinct
+prefix length), so a handful of rules can stand in for thousands of rows.
+
+Many destinations can be priced in one call (quote_shipping_batch), e.g.
+for a saved address list: every quote is served from the same snapshot.
+
+Like the catalog caches, the tables carry a version: the PincodeZone,
+PincodeRule, ShippingZone and ShippingRate signals bump a counter shared
+by every worker (shop.versions), and a process reloads its tables the
+next time it sees a newer version.
+"""
+
+import threading
+from bisect import bisect_right
+from decimal import Decimal
+
+from .models import PincodeRule, PincodeZone, ShippingRate, ShippingZone, normalize_pincode
+from .versions import bump_version, get_version
+
+
+SHIPPING_VERSION = 'shipping'
+
+# Used when a country has no matching ShippingRate
+DEFAULT_RATE_PER_KG = Decimal('50.00')
+DEFAULT_MIN_CHARGE = Decimal('100.00')
+
+CENT = Decimal('0.01')
+
+SHIPPING_QUOTE_BATCH_LIMIT = 1000
+
+# Largest weight (kg) and cart total (INR) a quote request may ask about;
+# far beyond any real parcel, and small enough that costs stay exact
+SHIPPING_QUOTE_MAX_WEIGHT = Decimal('10000')
+SHIPPING_QUOTE_MAX_CART_TOTAL = Decimal('1000000000')
+
+
+def get_shipping_version():
+    """Return the current shipping tables version (0 if never bumped)"""
+    return get_version(SHIPPING_VERSION)
+
+
+def bump_shipping_version():
+    """Record a change to pincodes, zones or rates and return the new version"""
+    return bump_version(SHIPPING_VERSION)
+
+
+class ZoneRate:
+    """Per-kg pricing of one active ShippingZone"""
+
+    __slots__ = ('zone', 'cost_per_kg', 'free_shipping_threshold')
+
+    def __init__(self, zone, cost_per_kg, free_shipping_threshold):
+        self.zone = zone
+        self.cost_per_kg = cost_per_kg
+        self.free_shipping_threshold = free_shipping_threshold
+
+
+class ShippingQuote:
+    """The price of shipping one order to one destination"""
+
+    __slots__ = ('pincode', 'country', 'weight', 'cart_total', 'cost', 'pincode_found')
+
+    def __init__(self, pincode, country, weight, cart_total, cost, pincode_found):
+        self.pincode = pincode
+        self.country = country  # detected from the pincode when it is known
+        self.weight = weight
+        self.cart_total = cart_total
+        self.cost = cost
+        self.pincode_found = pincode_found
+
+
+class CountryRules:
+    """One country's prefix and range rules, indexed for logarithmic lookup"""
+
+    def __init__(self):
+        self.prefixes = {}  # prefix -> zone id or None
+        self.prefix_lengths = []  # distinct prefix lengths, longest first
+        self.ranges = {}  # code length -> (sorted starts, [(start, end, zone id)])
+
+    def add_prefix(self, prefix, zone_id):
+        self.prefixes[prefix] = zone_id
+
+    def add_range(self, start, end, zone_id):
+        self.ranges.setdefault(len(start), ([], []))[1].append((start, end, zone_id))
+
+    def freeze(self):
+        """Sort the ranges and prefix lengths once everything is loaded"""
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.prefixes}, reverse=True)
+        for length, (starts, entries) in self.ranges.items():
+            entries.sort()
+            starts[:] = [start for start, _, _ in entries]
+
+    def match(self, code):
+        """Return (found, zone id) for the most specific rule covering code"""
+        if len(code) in self.ranges:
+            starts, entries = self.ranges[len(code)]
+            index = bisect_right(starts, code) - 1
+            if index >= 0 and code <= entries[index][1]:
+                return True, entries[index][2]
+        for length in self.prefix_lengths:
+            if length <= len(code) and code[:length] in self.prefixes:
+                return True, self.prefixes[code[:length]]
+        return False, None
+
+
+class ShippingTables:
+    """A snapshot of every pincode, active zone and active country rate"""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.pincodes = {}  # normalized pincode -> (zone id or None, country)
+        self.rules = {}  # country -> CountryRules
+        self.zones = {}  # zone id -> ZoneRate, active zones only
+        self.rates = {}  # country -> [(min order, max order, cost/kg, min charge)]
+
+    @classmethod
+    def load(cls, version=None):
+        """Read the tables from the database (four queries)"""
+        tables = cls(version)
+        for pk, zone, cost, threshold in ShippingZone.objects.filter(is_active=True).values_list(
+            'id', 'zone', 'cost_per_kg', 'free_shipping_threshold'
+        ):
+            tables.zones[pk] = ZoneRate(zone, cost, threshold)
+
+        # Many pincodes share a country; keep one string per country
+        countries = {}
+        rows = PincodeZone.objects.values_list('pincode', 'zone_id', 'country')
+        for pincode, zone_id, country in rows.iterator(chunk_size=5000):
+            country = countries.setdefault(country, country)
+            tables.pincodes[normalize_pincode(pincode)] = (zone_id, country)
+
+        for prefix, start, end, zone_id, country in PincodeRule.objects.values_list(
+            'prefix', 'range_start', 'range_end', 'zone_id', 'country'
+        ).iterator(chunk_size=5000):
+            rules = tables.rules.setdefault(country, CountryRules())
+            if prefix:
+                rules.add_prefix(prefix, zone_id)
+            elif start and end:
+                rules.add_range(start, end, zone_id)
+        for rules in tables.rules.values():
+            rules.freeze()
+
+        for country, min_order, max_order, cost, min_charge in ShippingRate.objects.filter(
+            is_active=True
+        ).order_by('priority', 'min_order_value').values_list(
+            'country', 'min_order_value', 'max_order_value', 'cost', 'min_shipping_charge'
+        ):
+            tables.rates.setdefault(country, []).append((min_order, max_order, cost, min_charge))
+        return tables
+
+    def lookup(self, pincode, country=None):
+        """
+        Return (zone id or None, country) for a postal code, else None
+
+        Exact pincode rows apply whatever the country; rules are searched
+        within country when it is given, otherwise across every country.
+        """
+        code = normalize_pincode(pincode)
+        if not code:
+            return None
+        entry = self.pincodes.get(code)
+        if entry:
+            return entry
+        if country is not None:
+            rules = self.rules.get(country)
+            found, zone_id = rules.match(code) if rules else (False, None)
+            return (zone_id, country) if found else None
+        for rule_country, rules in self.rules.items():
+            found, zone_id = rules.match(code)
+            if found:
+                return zone_id, rule_country
+        return None
+
+    def get_country(self, pincode, country=None):
+        """Country a postal code belongs to, or None if nothing matches"""
+        entry = self.lookup(pincode, country)
+        return entry[1] if entry else None
+
+    def zone_cost(self, pincode, cart_total, weight, country=None):
+        """Zone-based cost for a pincode, or None if it has no active zone"""
+        entry = self.lookup(pincode, country)
+        return self.zone_rate_cost(entry[0], cart_total, weight) if entry else None
+
+    def zone_rate_cost(self, zone_id, cart_total, weight):
+        """Cost under one zone's pricing, or None if the zone isn't active"""
+        zone = self.zones.get(zone_id)
+        if zone is None:
+            return None
+        if cart_total >= zone.free_shipping_threshold:
+            return Decimal('0.00')
+        return (zone.cost_per_kg * weight).quantize(CENT)
+
+    def country_cost(self, country, cart_total, weight):
+        """Cost from the first matching country rate band, or the default rate"""
+        for min_order, max_order, cost, min_charge in self.rates.get(country, ()):
+            if min_order > cart_total or (max_order and cart_total > max_order):
+                continue
+            shipping_cost = cost * weight
+            if min_charge and shipping_cost < min_charge:
+                shipping_cost = min_charge
+            return shipping_cost.quantize(CENT)
+
+        shipping_cost = (DEFAULT_RATE_PER_KG * weight).quantize(CENT)
+        return max(shipping_cost, DEFAULT_MIN_CHARGE)
+
+    def entry_cost(self, entry, country, cart_total, weight):
+        """Cost for a resolved lookup entry (or None), falling back to country"""
+        if entry:
+            zone_id, country = entry
+            zone_cost = self.zone_rate_cost(zone_id, cart_total, weight) if country == 'India' else None
+            if zone_cost is not None:
+                return zone_cost
+        return self.country_cost(country, cart_total, weight)
+
+    def quote(self, cart_total, country='India', pincode=None, total_weight_kg=1.0):
+        """
+        Shipping cost for an order, without touching the database
+
+        A known pincode decides the country; Indian pincodes in an active
+        zone use zone pricing, everything else the country's rate bands.
+        """
+        cart_total = Decimal(str(cart_total))
+        weight = Decimal(str(total_weight_kg))
+        entry = self.lookup(pincode, country) if pincode else None
+        return self.entry_cost(entry, country, cart_total, weight)
+
+    def quote_many(self, destinations):
+        """
+        Quote every (pincode, country, weight, cart_total) in destinations
+
+        Each pincode is resolved once, and repeated destinations in a batch
+        share their lookup. Returns a ShippingQuote per destination, in order.
+        """
+        entries = {}
+        quotes = []
+        for pincode, country, weight, cart_total in destinations:
+            cart_total = Decimal(str(cart_total))
+            weight = Decimal(str(weight))
+            key = (pincode, country)
+            if key not in entries:
+                entries[key] = self.lookup(pincode, country) if pincode else None
+            entry = entries[key]
+            quotes.append(ShippingQuote(
+                pincode, entry[1] if entry else country, weight, cart_total,
+                self.entry_cost(entry, country, cart_total, weight), entry is not None,
+            ))
+        return quotes
+
+
+_tables = None
+_tables_lock = threading.Lock()
+
+
+def get_shipping_tables():
+    """Return this process's tables, reloading them if they are out of date"""
+    global _tables
+    version = get_shipping_version()
+    tables = _tables
+    if tables is not None and tables.version == version:
+        return tables
+    with _tables_lock:
+        if _tables is None or _tables.version != version:
+            _tables = ShippingTables.load(version)
+        return _tables
+
+
+def quote_shipping(cart_total, country='India', pincode=None, total_weight_kg=1.0):
+    """Shipping cost for an order from the in-memory tables"""
+    return get_shipping_tables().quote(cart_total, country, pincode, total_weight_kg)
+
+
+def quote_shipping_batch(destinations):
+    """Quote many (pincode, country, weight, cart_total) destinations from one snapshot"""
+    return get_shipping_tables().quote_many(destinations)
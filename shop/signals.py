@@ -4,12 +4,28 @@ Django signals for the shop app
 This module contains signal handlers for automatic operations:
 - Creating user profiles when new users register
 - Updating product stock when orders are placed
+- Moving an anonymous cart onto the user's account at login
+- Keeping the product search index and typeahead data in sync with catalog changes
+- Keeping product rating aggregates in sync with reviews
+- Queueing resized image derivatives when product images change
+- Invalidating the in-memory shipping tables when pincodes, pincode rules, zones or rates change
+- Keeping converted product prices in step with prices and currency rates
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.contrib.auth.signals import user_logged_in
+from .models import (
+    UserProfile, Product, Category, Review, PincodeRule, PincodeZone, ShippingRate, ShippingZone, CurrencyRate
+)
+from .cart import get_cart_storage_class
+from .catalog import bump_catalog_version
+from .currency import bump_currency_version, get_price_book
+from .ratings import apply_rating_change
+from .images import schedule_derivatives
+from .search import get_search_backend
+from .shipping import bump_shipping_version
 
 
 @receiver(post_save, sender=User)
@@ -23,4 +39,92 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     """Save the UserProfile when the User is saved"""
     if hasattr(instance, 'userprofile'):
-        instance.userprofile.save()
\ No newline at end of file
+        instance.userprofile.save()
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Attach the anonymous cart to the user who just logged in"""
+    get_cart_storage_class().merge_on_login(request, user)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Add or refresh a product in the search index"""
+    version = bump_catalog_version()
+    get_search_backend().update_product(instance, version)
+
+
+@receiver(post_save, sender=Product)
+def queue_image_derivatives(sender, instance, **kwargs):
+    """Build resized copies of new or replaced images after the save commits"""
+    if instance.images_changed():
+        schedule_derivatives(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Drop a deleted product from the search index"""
+    version = bump_catalog_version()
+    get_search_backend().remove_product(instance.id, version)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category(sender, instance, **kwargs):
+    """Re-index products whose category name or slug may have changed"""
+    version = bump_catalog_version()
+    get_search_backend().update_category(instance, version)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    """Invalidate per-process catalog caches (products are removed via cascade)"""
+    bump_catalog_version()
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    """Note the stored rating of an edited review so the aggregates can move it"""
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def add_review_rating(sender, instance, **kwargs):
+    """Count a new or edited review in the product's rating aggregates"""
+    apply_rating_change(
+        instance.product_id,
+        added=instance.rating,
+        removed=getattr(instance, '_previous_rating', None)
+    )
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    """Drop a deleted review from the product's rating aggregates"""
+    apply_rating_change(instance.product_id, removed=instance.rating)
+
+
+@receiver([post_save, post_delete], sender=PincodeZone)
+@receiver([post_save, post_delete], sender=PincodeRule)
+@receiver([post_save, post_delete], sender=ShippingZone)
+@receiver([post_save, post_delete], sender=ShippingRate)
+def shipping_tables_changed(sender, **kwargs):
+    """Make every process reload its shipping tables on the next quote"""
+    bump_shipping_version()
+
+
+@receiver(pre_save, sender=Product)
+def convert_product_price(sender, instance, **kwargs):
+    """Store the product's price in every active currency"""
+    if instance.price is not None:
+        instance.converted_prices = get_price_book().price_entry(instance.price)
+
+
+@receiver([post_save, post_delete], sender=CurrencyRate)
+def currency_rates_changed(sender, **kwargs):
+    """Make every process reload its price book on the next price shown"""
+    bump_currency_version()
@@ -1,6 +1,51 @@
+"""
+Sitemaps for Sri Devi Fashion Jewellery
+
+/sitemap.xml is a sitemap index. The static pages and categories are
+small, so their sitemaps are rendered by django.contrib.sitemaps. Products
+are split into chunks by id range (SITEMAP_CHUNK_SIZE ids each, at most
+the protocol's 50,000 URLs), and each chunk is written to storage once as
+a gzip-compressed file that is served as-is with Last-Modified.
+
+Chunks are refreshed incrementally: one grouped query counts each range's
+available products and finds its newest update, and only the chunks whose
+count or last update differ from what was written (or that were written
+for another range or domain) are regenerated. The check runs when the
+catalog version or the base URL has moved since the last refresh, i.e.
+after product writes, so crawler hits normally cost a cache read.
+
+The index's Last-Modified is the time of the last refresh that changed
+what it lists (SitemapIndex), so removing a chunk or moving to another
+domain is seen by crawlers even though no remaining chunk was rewritten.
+"""
+
+import gzip
+import hashlib
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Floor
 from django.urls import reverse
-from shop.models import Product, Category
+from django.utils import timezone
+
+from shop.catalog import get_catalog_version
+from shop.models import Category, Product, SitemapChunk, SitemapIndex
+
+
+# The sitemap protocol's limit on URLs per file
+SITEMAP_MAX_URLS = 50000
+
+SITEMAP_STORAGE_DIR = 'sitemaps'
+SITEMAP_VERSION_KEY = 'shop:sitemaps:version'
+SITEMAP_LOCK_KEY = 'shop:sitemaps:lock'
+SITEMAP_LOCK_TIMEOUT = 5 * 60
 
 
 class StaticViewSitemap(Sitemap):
@@ -16,7 +61,12 @@ class StaticViewSitemap(Sitemap):
 
 
 class ProductSitemap(Sitemap):
-    """Sitemap for products"""
+    """
+    Sitemap for products
+
+    Not served directly: its entries are written to the precompressed
+    chunk files by write_chunk.
+    """
     changefreq = "weekly"
     priority = 0.9
 
@@ -36,15 +86,177 @@ class CategorySitemap(Sitemap):
     priority = 0.7
 
     def items(self):
-        return Category.objects.all()
+        return Category.objects.annotate(
+            latest_product=Max('products__updated_at', filter=Q(products__available=True))
+        ).order_by('name')
+
+    def lastmod(self, obj):
+        """The category's own update or its newest available product's, whichever is later"""
+        latest = getattr(obj, 'latest_product', None)
+        return max(obj.updated_at, latest) if latest else obj.updated_at
 
     def location(self, obj):
         return reverse('shop:category_detail', args=[obj.slug])
 
 
-# Dictionary of all sitemaps
+# Sections rendered on request; products are served from the chunk files
 sitemaps = {
     'static': StaticViewSitemap,
-    'products': ProductSitemap,
     'categories': CategorySitemap,
-}
\ No newline at end of file
+}
+
+
+def get_chunk_size():
+    return max(1, min(getattr(settings, 'SITEMAP_CHUNK_SIZE', 10000), SITEMAP_MAX_URLS))
+
+
+def get_base_url():
+    """Scheme and domain written into the sitemaps (SITEMAP_BASE_URL, else the current Site)"""
+    base_url = getattr(settings, 'SITEMAP_BASE_URL', '')
+    if not base_url:
+        base_url = f'https://{Site.objects.get_current().domain}'
+    return base_url.rstrip('/')
+
+
+def chunk_range(number, size):
+    """First and last product id of chunk number (chunks start at 1)"""
+    return (number - 1) * size + 1, number * size
+
+
+def render_chunk(products, base_url):
+    """The sitemap XML for (slug, updated_at) rows, as bytes"""
+    # Reverse once and substitute slugs; slugs never need URL escaping
+    placeholder = 'sitemap-slug-placeholder'
+    prefix, suffix = reverse('shop:product_detail', args=[placeholder]).split(placeholder)
+    head = escape(base_url + prefix)
+    tail = (
+        f'{escape(suffix)}</loc><lastmod>{{}}</lastmod>'
+        f'<changefreq>{ProductSitemap.changefreq}</changefreq>'
+        f'<priority>{ProductSitemap.priority}</priority></url>\n'
+    )
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for slug, updated_at in products:
+        lines.append('<url><loc>' + head + slug + tail.format(updated_at.date().isoformat()))
+    lines.append('</urlset>\n')
+    return ''.join(lines).encode()
+
+
+def write_chunk(number, size, base_url, url_count, lastmod, previous=None):
+    """Render, compress and store one chunk, replacing its previous file"""
+    first_id, last_id = chunk_range(number, size)
+    products = Product.objects.filter(
+        available=True, id__range=(first_id, last_id)
+    ).order_by('id').values_list('slug', 'updated_at')
+    # mtime=0 keeps identical chunks byte-identical, so their names match
+    data = gzip.compress(render_chunk(products.iterator(chunk_size=5000), base_url), mtime=0)
+    name = f'{SITEMAP_STORAGE_DIR}/products-{number}-{hashlib.sha256(data).hexdigest()[:12]}.xml.gz'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+
+    chunk, _ = SitemapChunk.objects.update_or_create(number=number, defaults={
+        'first_id': first_id,
+        'last_id': last_id,
+        'base_url': base_url,
+        'url_count': url_count,
+        'lastmod': lastmod,
+        'file': name,
+    })
+    # Written under a new name first, so a crawler never sees a missing file
+    if previous and previous.file != name:
+        default_storage.delete(previous.file)
+    return chunk
+
+
+def refresh_sitemaps(force=False):
+    """
+    Regenerate the product chunks whose products changed
+
+    Returns the numbers of the chunks written. force rewrites every chunk.
+    """
+    size = get_chunk_size()
+    base_url = get_base_url()
+    current = {
+        int(row['chunk']) + 1: (row['urls'], row['lastmod'])
+        for row in Product.objects.filter(available=True).annotate(
+            chunk=Floor((F('id') - 1) / size)
+        ).values('chunk').annotate(urls=Count('id'), lastmod=Max('updated_at')).order_by()
+    }
+    stored = {chunk.number: chunk for chunk in SitemapChunk.objects.all()}
+
+    written = []
+    for number, (url_count, lastmod) in sorted(current.items()):
+        chunk = stored.get(number)
+        if (not force and chunk is not None and chunk.url_count == url_count and chunk.lastmod == lastmod
+                and chunk.base_url == base_url and (chunk.first_id, chunk.last_id) == chunk_range(number, size)):
+            continue
+        write_chunk(number, size, base_url, url_count, lastmod, chunk)
+        written.append(number)
+
+    # Ranges with no available products left
+    removed = [number for number in stored if number not in current]
+    for number in removed:
+        stored[number].delete()
+        default_storage.delete(stored[number].file)
+
+    index = SitemapIndex.objects.first()
+    if index is None or written or removed or index.base_url != base_url:
+        touch_index(index, base_url)
+    return written
+
+
+def touch_index(index, base_url):
+    """Record that the index changed now"""
+    modified_at = timezone.now()
+    if index is None:
+        SitemapIndex.objects.create(base_url=base_url, modified_at=modified_at)
+        return
+    # Last-Modified has whole seconds: always move it past the previous one
+    modified_at = max(modified_at, index.modified_at.replace(microsecond=0) + timedelta(seconds=1))
+    SitemapIndex.objects.filter(pk=index.pk).update(base_url=base_url, modified_at=modified_at)
+
+
+def get_index_modified():
+    """When the index last changed, or None before the first refresh"""
+    return SitemapIndex.objects.values_list('modified_at', flat=True).first()
+
+
+def sitemap_state():
+    """What the chunks were last refreshed for: the catalog version and base URL"""
+    return get_catalog_version(), get_base_url()
+
+
+def ensure_sitemaps():
+    """
+    Refresh the chunks if the catalog or base URL changed since the last refresh
+
+    One worker refreshes at a time; the others keep serving the chunks
+    already written until it is done.
+    """
+    state = sitemap_state()
+    if cache.get(SITEMAP_VERSION_KEY) == state:
+        return
+    if not cache.add(SITEMAP_LOCK_KEY, 1, SITEMAP_LOCK_TIMEOUT):
+        return
+    try:
+        refresh_sitemaps()
+        cache.set(SITEMAP_VERSION_KEY, state, None)
+    finally:
+        cache.delete(SITEMAP_LOCK_KEY)
+
+
+def render_index(sections, chunks, base_url):
+    """The sitemap index XML for section names and SitemapChunk rows"""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for section in sections:
+        location = reverse('django.contrib.sitemaps.views.sitemap', kwargs={'section': section})
+        lines.append(f'<sitemap><loc>{escape(base_url + location)}</loc></sitemap>\n')
+    for chunk in chunks:
+        location = reverse('sitemap_products', kwargs={'number': chunk.number})
+        lines.append(
+            f'<sitemap><loc>{escape(base_url + location)}</loc>'
+            f'<lastmod>{chunk.lastmod.isoformat()}</lastmod></sitemap>\n'
+        )
+    lines.append('</sitemapindex>\n')
+    return ''.join(lines)
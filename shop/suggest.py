@@ -0,0 +1,179 @@
+"""
+Typeahead suggestions for the product search box
+
+Category names, brands and product names are held per worker in sorted
+arrays of lowercase keys, searched with bisect. Every word of a phrase is
+indexed, so "neck" suggests "Gold Necklace". The arrays are rebuilt when
+the shared catalog version changes, so lookups never touch the database.
+"""
+
+import logging
+import threading
+from bisect import bisect_left
+
+from django.db import DatabaseError
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .catalog import get_catalog_version
+from .models import Category, Product
+from .search import tokenize
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of keys scanned per lookup, bounds the cost of short prefixes
+MAX_SCAN = 200
+
+
+def phrase_keys(text):
+    """Return the lookup keys for a phrase: the phrase from each word onwards"""
+    words = tokenize(text)
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def normalize_prefix(text):
+    """Normalize user input the same way keys are built"""
+    words = tokenize(text)
+    key = ' '.join(words)
+    # Keep a trailing space so "gold " only matches whole-word "gold ..."
+    if words and text[-1:].isspace():
+        key += ' '
+    return key
+
+
+class SortedKeyIndex:
+    """Sorted array of (key, item position) pairs supporting prefix scans"""
+
+    def __init__(self, entries):
+        entries = sorted(entries)
+        self.keys = [key for key, _ in entries]
+        self.positions = [position for _, position in entries]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def scan(self, prefix, limit):
+        """Return up to `limit` distinct item positions whose key starts with prefix"""
+        found = []
+        if limit <= 0:
+            return found
+        seen = set()
+        start = bisect_left(self.keys, prefix)
+        for index in range(start, min(start + MAX_SCAN, len(self.keys))):
+            if not self.keys[index].startswith(prefix):
+                break
+            position = self.positions[index]
+            if position not in seen:
+                seen.add(position)
+                found.append(position)
+                if len(found) == limit:
+                    break
+        return found
+
+
+class SuggestionIndex:
+    """Per-process typeahead index over categories, brands and products"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.categories = []       # [(name, slug)]
+        self.brands = []           # [name]
+        self.products = []         # [(name, slug)]
+        self.category_keys = SortedKeyIndex([])
+        self.brand_keys = SortedKeyIndex([])
+        self.product_keys = SortedKeyIndex([])
+
+    def rebuild(self):
+        """Reload suggestion data from the database"""
+        version = get_catalog_version()
+        categories = list(Category.objects.values_list('name', 'slug'))
+        products = list(
+            Product.objects.filter(available=True)
+            .order_by('name')
+            .values_list('name', 'slug')
+        )
+        brands = sorted(set(
+            Product.objects.filter(available=True)
+            .exclude(brand='')
+            .values_list('brand', flat=True)
+        ))
+
+        category_keys = SortedKeyIndex(
+            (key, position)
+            for position, (name, _) in enumerate(categories)
+            for key in phrase_keys(name)
+        )
+        brand_keys = SortedKeyIndex(
+            (key, position)
+            for position, name in enumerate(brands)
+            for key in phrase_keys(name)
+        )
+        product_keys = SortedKeyIndex(
+            (key, position)
+            for position, (name, _) in enumerate(products)
+            for key in phrase_keys(name)
+        )
+
+        with self.lock:
+            self.categories, self.brands, self.products = categories, brands, products
+            self.category_keys, self.brand_keys, self.product_keys = category_keys, brand_keys, product_keys
+            self.version = version
+
+    def ensure_current(self):
+        """Rebuild when the catalog changed since the last build"""
+        if self.version is None or self.version != get_catalog_version():
+            self.rebuild()
+
+    def suggest(self, text, limit=8):
+        """
+        Return suggestion dicts for partially typed text
+
+        Categories come first, then brands, then products.
+        """
+        prefix = normalize_prefix(text)
+        if not prefix:
+            return []
+
+        self.ensure_current()
+        with self.lock:
+            categories, brands, products = self.categories, self.brands, self.products
+            category_keys, brand_keys, product_keys = self.category_keys, self.brand_keys, self.product_keys
+
+        suggestions = []
+        for position in category_keys.scan(prefix, limit):
+            name, slug = categories[position]
+            suggestions.append({
+                'type': 'category',
+                'label': name,
+                'url': reverse('shop:category_detail', kwargs={'slug': slug}),
+            })
+        for position in brand_keys.scan(prefix, limit - len(suggestions)):
+            name = brands[position]
+            suggestions.append({
+                'type': 'brand',
+                'label': name,
+                'url': f"{reverse('shop:product_search')}?{urlencode({'query': name})}",
+            })
+        if len(suggestions) < limit:
+            for position in product_keys.scan(prefix, limit - len(suggestions)):
+                name, slug = products[position]
+                suggestions.append({
+                    'type': 'product',
+                    'label': name,
+                    'url': reverse('shop:product_detail', kwargs={'slug': slug}),
+                })
+        return suggestions[:limit]
+
+
+suggestion_index = SuggestionIndex()
+
+
+def warm_suggestion_index():
+    """Build the suggestion index at worker startup so the first keystroke is fast"""
+    try:
+        suggestion_index.rebuild()
+    except DatabaseError as e:
+        # Tables may not exist yet (e.g. before the first migrate)
+        logger.warning(f"Could not warm suggestion index: {e}")
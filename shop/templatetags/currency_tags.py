@@ -1,8 +1,17 @@
 """
 Template tags for currency conversion
+
+Amounts are converted with Decimal arithmetic from the per-process price
+book; product prices come precomputed from Product.converted_prices. The
+price book and currency are resolved once per request, and each
+currency's formatter (digit grouping, symbol, minor unit) is built once
+per process.
+
+For product grids, {% prices products %} formats every card's price in
+one tag; the cards then show {{ product.display_price }}.
 """
 from django import template
-from shop.currency import get_currency, convert_price, format_price
+from shop.currency import get_price_display
 
 register = template.Library()
 
@@ -10,37 +19,45 @@ register = template.Library()
 @register.filter
 def currency_convert(price, request):
     """Convert price to current currency"""
-    if not price:
-        return 0
-    
-    current_currency = get_currency(request)
-    if current_currency == 'USD':
-        return convert_price(float(price), 'INR', 'USD')
-    return float(price)
+    return get_price_display(request)[1].convert(price or 0)
 
 
 @register.filter
 def currency_format(price, request):
     """Format price with currency symbol"""
-    if not price:
-        return format_price(0, get_currency(request))
-    
-    current_currency = get_currency(request)
-    if current_currency == 'USD':
-        converted = convert_price(float(price), 'INR', 'USD')
-        return format_price(converted, 'USD')
-    return format_price(float(price), 'INR')
+    currency = get_price_display(request)[1]
+    return currency.format(currency.convert(price or 0))
 
 
 @register.simple_tag(takes_context=True)
 def show_price(context, price):
     """Display price in current currency"""
-    request = context['request']
-    if not price:
-        return format_price(0, get_currency(request))
-    
-    current_currency = get_currency(request)
-    if current_currency == 'USD':
-        converted = convert_price(float(price), 'INR', 'USD')
-        return format_price(converted, 'USD')
-    return format_price(float(price), 'INR')
+    return currency_format(price, context['request'])
+
+
+@register.simple_tag(takes_context=True)
+def product_price(context, product):
+    """Display a product's price in the current currency, rounded for display"""
+    book, currency = get_price_display(context['request'])
+    return currency.format(book.product_price(product, currency.code))
+
+
+@register.simple_tag(takes_context=True)
+def prices(context, products, *fields):
+    """
+    Format the prices of many products at once
+
+    {% prices products %} sets product.display_price on every product;
+    naming other price fields, e.g. {% prices products 'compare_at_price' %},
+    also sets display_<field> ('' when the product has no such value).
+    Renders nothing.
+    """
+    book, currency = get_price_display(context['request'])
+    for product in products:
+        product.display_price = currency.format(book.product_price(product, currency.code))
+        for field in fields:
+            value = getattr(product, field, None)
+            setattr(product, f'display_{field}', '' if value is None else currency.format(
+                currency.convert(value, display=True)
+            ))
+    return ''
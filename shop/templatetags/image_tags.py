@@ -0,0 +1,66 @@
+"""
+Template tags for responsive product images
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from shop.images import get_preset_image, get_srcset
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_image(product, preset='card', field='image', alt=None, loading='lazy', **attrs):
+    """
+    Render an <img> for a product image preset ('thumbnail', 'card', 'zoom')
+
+    Uses the prebuilt derivative manifest for srcset, sizes, intrinsic
+    width/height and a blurred placeholder background, so nothing touches
+    storage at render time. Falls back to the original upload until the
+    derivatives exist. Extra keyword arguments become attributes
+    (underscores turn into hyphens, e.g. data_index -> data-index).
+    """
+    image = getattr(product, field)
+    details = get_preset_image(product, preset, field) if image else None
+    attributes = {
+        'alt': product.name if alt is None else alt,
+        'loading': loading,
+        'decoding': 'async',
+    }
+    if details:
+        attributes.update({
+            'src': details['src'],
+            'srcset': details['srcset'],
+            'sizes': details['sizes'],
+            'width': details['width'],
+            'height': details['height'],
+        })
+        placeholder = f"background: url('{details['placeholder']}') center / cover no-repeat;"
+        attributes['style'] = f"{placeholder} {attrs.pop('style', '')}".strip()
+        attributes.setdefault('onload', "this.style.backgroundImage='none'")
+    else:
+        attributes['src'] = image.url if image else product.get_main_image_url()
+    attributes.update((name.replace('_', '-'), value) for name, value in attrs.items())
+    return format_html('<img{}>', format_html_join('', ' {}="{}"', attributes.items()))
+
+
+@register.simple_tag
+def product_image_url(product, preset='card', field='image'):
+    """
+    Return the URL of the largest JPEG of a product image preset
+
+    For places that take a single URL (og:image, structured data, a
+    thumbnail's full-size target); the original upload until the
+    derivatives are built, and '' without an image.
+    """
+    image = getattr(product, field)
+    if not image:
+        return ''
+    details = get_preset_image(product, preset, field)
+    return details['src'] if details else image.url
+
+
+@register.simple_tag
+def product_srcset(product, preset='card', field='image'):
+    """Return just the srcset for a product image preset ('' until it is built)"""
+    return get_srcset(product, preset, 'webp', field) or get_srcset(product, preset, 'jpg', field)
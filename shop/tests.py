@@ -8,14 +8,67 @@ This module contains tests for:
 - Cart functionality
 """
 
-from django.test import TestCase, Client
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+
+from openpyxl import Workbook
+from PIL import Image
+
 from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import F
+from django.http import Http404
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from decimal import Decimal
-from shop.models import Category, Product, Order, OrderItem, UserProfile
-from shop.cart import Cart
-from shop.forms import CustomUserCreationForm, ProductSearchForm
+from django.utils import timezone
 
+from shop.models import (
+    Category, Product, Order, OrderItem, UserProfile, CartItem, Review, VersionCounter,
+    PincodeRule, PincodeZone, ShippingRate, ShippingZone, CurrencyRate, SitemapChunk
+)
+from shop.cart import CART_ID_SESSION_KEY, Cart
+from shop.catalog import bump_catalog_version, get_catalog_version, get_categories
+from shop.checks import check_shared_cache
+from shop.currency import (
+    PriceFormatter, convert_price, get_price_book, group_digits, rebuild_price_book, round_price, set_currency
+)
+from shop.forms import CustomUserCreationForm, ProductSearchForm
+from shop.home import get_home_snapshot
+from shop.images import build_derivatives, get_srcset
+from shop.importer import CatalogSync, CheckpointMismatch, ProductImporter
+from shop.inventory import (
+    InsufficientStock, reserve_stock, release_expired_reservations, confirm_reservation,
+    apply_stock_changes
+)
+from shop.pagination import KeysetPaginator, decode_cursor, encode_cursor
+from shop.ratings import rebuild_ratings
+from shop.search import InvertedIndexBackend, DatabaseSearchBackend, stem
+from shop.shipping import get_shipping_tables, get_shipping_version, quote_shipping, quote_shipping_batch
+from shop.shipping_import import PincodeImporter, ShippingRateImporter
+from shop.sitemaps import CategorySitemap, ensure_sitemaps, refresh_sitemaps
+from shop.versions import bump_version, get_version, version_key
 
 class CategoryModelTest(TestCase):
     """Test Category model"""
@@ -351,4 +404,2073 @@ class SearchTest(TestCase):
         })
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Laptop')
-        self.assertNotContains(response, 'Smartphone')
\ No newline at end of file
+        self.assertNotContains(response, 'Smartphone')
+
+class SearchIndexTest(TestCase):
+    """Test the inverted index search backend"""
+    
+    def setUp(self):
+        self.backend = InvertedIndexBackend()
+        self.category = Category.objects.create(name='Jewellery', slug='jewellery')
+        self.necklace = Product.objects.create(
+            name='Gold Necklace',
+            slug='gold-necklace',
+            category=self.category,
+            description='Handcrafted necklace with matching earrings',
+            price=Decimal('2499.00'),
+            stock=5,
+            size='S',
+            color='yellow',
+            brand='Sri Devi'
+        )
+        self.earrings = Product.objects.create(
+            name='Pearl Earrings',
+            slug='pearl-earrings',
+            category=self.category,
+            description='Classic pearl earrings',
+            price=Decimal('899.00'),
+            stock=5,
+            size='S',
+            color='white'
+        )
+        self.backend.rebuild()
+    
+    def search_ids(self, query='', **filters):
+        return [product.id for product in self.backend.search(query, **filters)]
+    
+    def test_stemming(self):
+        """Test that plural and singular forms match"""
+        self.assertEqual(stem('earrings'), 'earring')
+        self.assertEqual(stem('accessories'), 'accessory')
+        self.assertEqual(self.search_ids('necklaces'), [self.necklace.id])
+    
+    def test_bm25_ranking(self):
+        """Test that name matches rank above description matches"""
+        self.assertEqual(self.search_ids('earrings'), [self.earrings.id, self.necklace.id])
+    
+    def test_prefix_matching(self):
+        """Test that the last query word matches as a prefix"""
+        self.assertEqual(self.search_ids('pea'), [self.earrings.id])
+        self.assertEqual(self.search_ids('gold neck'), [self.necklace.id])
+        self.assertEqual(self.search_ids('gold pea'), [])
+    
+    def test_filters(self):
+        """Test that facet and price filters narrow the results"""
+        self.assertEqual(self.search_ids('earrings', color='white'), [self.earrings.id])
+        self.assertEqual(self.search_ids(max_price=Decimal('1000.00')), [self.earrings.id])
+        self.assertEqual(self.search_ids(category='other'), [])
+    
+    def test_incremental_updates(self):
+        """Test that saves and deletes update the index"""
+        self.earrings.name = 'Silver Studs'
+        self.backend.update_product(self.earrings)
+        self.assertEqual(self.search_ids('pearl'), [self.earrings.id])
+        self.assertEqual(self.search_ids('silver'), [self.earrings.id])
+        
+        self.earrings.available = False
+        self.backend.update_product(self.earrings)
+        self.assertEqual(self.search_ids('silver'), [])
+        
+        self.backend.remove_product(self.necklace.id)
+        self.assertEqual(self.search_ids('gold'), [])
+    
+    def test_change_from_another_worker(self):
+        """Test that a write by another process is seen once this worker's cached version expires"""
+        # Committed, as the other worker only sees committed versions
+        with self.captureOnCommitCallbacks(execute=True):
+            versions = [bump_catalog_version(), bump_catalog_version()]
+        self.assertEqual(versions[1], versions[0] + 1)
+        self.backend.rebuild()
+        
+        # Another worker renames a product; only the database counter moves
+        Product.objects.filter(pk=self.earrings.pk).update(name='Silver Studs')
+        VersionCounter.objects.filter(name='catalog').update(value=F('value') + 1)
+        self.assertEqual(self.search_ids('silver'), [])
+        cache.delete(version_key('catalog'))
+        self.assertEqual(get_catalog_version(), versions[1] + 1)
+        self.assertEqual(self.search_ids('silver'), [self.earrings.id])
+
+
+class VersionCounterTest(TestCase):
+    """Test the shared change counters"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_bump_published_on_commit(self):
+        """Test that other workers only see a version bumped in a transaction once it commits"""
+        with self.captureOnCommitCallbacks(execute=True):
+            version = bump_version('catalog')
+        self.assertEqual(get_version('catalog'), version)
+        self.assertEqual(cache.get(version_key('catalog')), version)
+        
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.assertEqual(bump_version('catalog'), version + 1)
+            # This thread sees its own change; the shared cache still has the old version
+            self.assertEqual(get_version('catalog'), version + 1)
+            self.assertEqual(cache.get(version_key('catalog')), version)
+        
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(version_key('catalog')))
+        self.assertEqual(get_version('catalog'), version + 1)
+        self.assertEqual(cache.get(version_key('catalog')), version + 1)
+    
+    def test_rolled_back_bump_is_forgotten(self):
+        """Test that a bump rolled back with its transaction isn't reported"""
+        version = get_version('catalog')
+        try:
+            with transaction.atomic():
+                bump_version('catalog')
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertEqual(get_version('catalog'), version)
+
+
+class SearchSuggestTest(TestCase):
+    """Test the typeahead suggestion endpoint"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Necklaces', slug='necklaces')
+        self.product = Product.objects.create(
+            name='Gold Temple Necklace',
+            slug='gold-temple-necklace',
+            category=self.category,
+            description='Temple jewellery',
+            price=Decimal('1999.00'),
+            stock=3,
+            brand='Sri Devi'
+        )
+    
+    def get_labels(self, query):
+        response = self.client.get(reverse('shop:search_suggest'), {'query': query})
+        self.assertEqual(response.status_code, 200)
+        return [(s['type'], s['label']) for s in response.json()['suggestions']]
+    
+    def test_suggest_matches_any_word(self):
+        """Test that categories, brands and products match by word prefix"""
+        self.assertEqual(self.get_labels('neck'), [
+            ('category', 'Necklaces'),
+            ('product', 'Gold Temple Necklace'),
+        ])
+        self.assertEqual(self.get_labels('dev'), [('brand', 'Sri Devi')])
+        self.assertEqual(self.get_labels(''), [])
+    
+    def test_suggest_refreshes_on_catalog_change(self):
+        """Test that product changes are picked up without a restart"""
+        self.assertEqual(self.get_labels('temple'), [('product', 'Gold Temple Necklace')])
+        self.product.name = 'Silver Chain'
+        self.product.save()
+        self.assertEqual(self.get_labels('temple'), [])
+        self.assertEqual(self.get_labels('silver ch'), [('product', 'Silver Chain')])
+
+
+class SearchFacetTest(TestCase):
+    """Test facet counts on the search page"""
+    
+    def setUp(self):
+        self.rings = Category.objects.create(name='Rings', slug='rings')
+        self.bangles = Category.objects.create(name='Bangles', slug='bangles')
+        for i, (category, color, price) in enumerate([
+            (self.rings, 'red', '450.00'),
+            (self.rings, 'blue', '1200.00'),
+            (self.bangles, 'red', '750.00'),
+        ]):
+            Product.objects.create(
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                category=category,
+                description='Festive collection',
+                price=Decimal(price),
+                stock=5,
+                size='M',
+                color=color,
+                brand='Sri Devi'
+            )
+    
+    def test_backends_agree(self):
+        """Test that the index and database backends count the same"""
+        buckets = [(Decimal('0'), Decimal('500')), (Decimal('500'), None)]
+        index_backend = InvertedIndexBackend()
+        index_backend.rebuild()
+        for backend in (index_backend, DatabaseSearchBackend()):
+            counts = backend.facet_counts('festive', price_buckets=buckets, color='red')
+            self.assertEqual(counts['category'], {'rings': 1, 'bangles': 1})
+            # A facet ignores its own filter
+            self.assertEqual(counts['color'], {'red': 2, 'blue': 1})
+            self.assertEqual(counts['brand'], {'Sri Devi': 2})
+            self.assertEqual(counts['price'], [1, 1])
+    
+    def test_facets_in_context_and_json(self):
+        """Test facet counts on the search page and JSON endpoint"""
+        response = self.client.get(reverse('shop:product_search'), {'category': 'rings'})
+        facets = response.context['facets']
+        self.assertEqual({f['value']: f['count'] for f in facets['color'] if f['count']},
+                         {'red': 1, 'blue': 1})
+        self.assertTrue(next(f for f in facets['category'] if f['value'] == 'rings')['selected'])
+        
+        response = self.client.get(reverse('shop:search_facets'), {'color': 'blue'})
+        data = response.json()['facets']
+        self.assertEqual([f['count'] for f in data['category']], [0, 1])
+    
+    def test_facets_are_cached(self):
+        """Test that repeated facet requests are served from the cache"""
+        self.client.get(reverse('shop:search_facets'), {'query': 'festive'})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('shop:search_facets'), {'query': 'Festive '})
+
+
+@override_settings(CART_STORAGE='shop.cart.DatabaseCartStorage')
+class DatabaseCartStorageTest(TestCase):
+    """Test the database-backed cart storage"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.product = Product.objects.create(
+            name='Test Product',
+            slug='test-product',
+            category=self.category,
+            description='Test product description',
+            price=Decimal('99.99'),
+            stock=10
+        )
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+    
+    def add_to_cart(self, client, quantity=1):
+        return client.post(
+            reverse('shop:cart_add', kwargs={'product_id': self.product.id}),
+            {'quantity': quantity}
+        )
+    
+    def test_session_holds_only_cart_id(self):
+        """Test that the session stores a cart id instead of the cart contents"""
+        self.add_to_cart(self.client, quantity=2)
+        session = self.client.session
+        self.assertNotIn('cart', session)
+        item = CartItem.objects.get(cart_id=session['cart_id'])
+        self.assertEqual(item.quantity, 2)
+        self.assertEqual(item.price, Decimal('99.99'))
+    
+    def test_reading_cart_does_not_write_session(self):
+        """Test that viewing the cart without one creates no session row"""
+        self.client.get(reverse('shop:cart_detail'))
+        self.assertEqual(Session.objects.count(), 0)
+    
+    def test_cart_merged_on_login_and_shared_across_devices(self):
+        """Test that a user's cart follows them to another client"""
+        self.add_to_cart(self.client, quantity=1)
+        self.client.post(reverse('account_login'), {
+            'login': 'test@example.com',
+            'password': 'testpass123'
+        })
+        self.user.refresh_from_db()
+        self.assertEqual(CartItem.objects.get().user, self.user)
+        
+        other_device = Client()
+        other_device.force_login(self.user)
+        self.add_to_cart(other_device, quantity=2)
+        response = self.client.get(reverse('shop:cart_detail'))
+        self.assertEqual(len(response.context['cart']), 3)
+    
+    def test_clear_abandoned_carts(self):
+        """Test that only anonymous carts no unexpired session refers to are deleted"""
+        def session(cart_id, expiry):
+            store = SessionStore()
+            store[CART_ID_SESSION_KEY] = cart_id
+            store.set_expiry(expiry)
+            store.create()
+
+        # A live session keeps its cart however long the cart sat untouched
+        session('active', 3600)
+        session('expired', -3600)
+        old = timezone.now() - timedelta(days=30)
+        for cart_id in ('active', 'expired', 'orphan'):
+            CartItem.objects.create(cart_id=cart_id, product=self.product, price=Decimal('99.99'))
+        CartItem.objects.create(user=self.user, product=self.product, price=Decimal('99.99'))
+        CartItem.objects.update(updated_at=old)
+        CartItem.objects.create(cart_id='fresh', product=self.product, price=Decimal('99.99'))
+
+        out = StringIO()
+        call_command('clear_abandoned_carts', stdout=out)
+        self.assertIn('Deleted 2 abandoned', out.getvalue())
+        self.assertEqual(
+            sorted(CartItem.objects.values_list('cart_id', flat=True)), ['', 'active', 'fresh']
+        )
+        # Without the grace period a cart whose session never arrived goes too
+        call_command('clear_abandoned_carts', '--grace', '0', stdout=StringIO())
+        self.assertEqual(sorted(CartItem.objects.values_list('cart_id', flat=True)), ['', 'active'])
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_clear_abandoned_carts_needs_listable_sessions(self):
+        """Test that cookie sessions are refused rather than emptying every cart"""
+        CartItem.objects.create(cart_id='active', product=self.product, price=Decimal('99.99'))
+        with self.assertRaises(CommandError):
+            call_command('clear_abandoned_carts', stdout=StringIO())
+        self.assertEqual(CartItem.objects.count(), 1)
+
+
+class CartQueryCountTest(TestCase):
+    """Test that cart pages cost a constant number of queries"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}',
+                slug=f'product-{i}',
+                category=self.category,
+                description='Test product',
+                price=Decimal('100.00'),
+                stock=10
+            )
+            for i in range(5)
+        ]
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+        self.client.force_login(self.user)
+    
+    def count_queries(self, url_name, product_count):
+        CartItem.objects.all().delete()
+        for product in self.products[:product_count]:
+            self.client.post(reverse('shop:cart_add', kwargs={'product_id': product.id}), {'quantity': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+    
+    def test_cart_totals_are_memoized(self):
+        """Test that iterating and totalling the cart loads products once"""
+        self.count_queries('shop:cart_detail', 5)
+        request = type('Request', (), {'session': self.client.session, 'user': self.user})()
+        cart = Cart(request)
+        get_shipping_tables()
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                list(cart)
+            cart.get_final_total()
+        self.assertEqual(cart.get_total_price(), Decimal('1000.00'))
+        
+        cart.update(self.products[0], 1)
+        self.assertEqual(cart.get_total_price(), Decimal('900.00'))
+    
+    def test_checkout_queries_independent_of_cart_size(self):
+        """Test that checkout and cart pages don't issue per-item queries"""
+        for url_name in ('shop:checkout', 'shop:cart_detail'):
+            self.assertEqual(
+                self.count_queries(url_name, 1),
+                self.count_queries(url_name, 5)
+            )
+    
+    def count_order_queries(self, product_count):
+        Order.objects.all().delete()
+        CartItem.objects.all().delete()
+        for product in self.products[:product_count]:
+            self.client.post(reverse('shop:cart_add', kwargs={'product_id': product.id}), {'quantity': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('shop:order_create'), {
+                'first_name': 'Test', 'last_name': 'User', 'email': 'test@example.com',
+                'phone': '1234567890', 'address_line_1': '123 Test St', 'city': 'Chennai',
+                'state': 'Tamil Nadu', 'postal_code': '600001', 'country': 'India',
+                'payment_method': 'razorpay',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get().items.count(), product_count)
+        return len(queries)
+    
+    def test_order_create_queries_independent_of_cart_size(self):
+        """Test that placing an order doesn't issue per-item queries"""
+        # The first order loads the shipping tables and versions once per process
+        self.count_order_queries(1)
+        self.assertEqual(self.count_order_queries(1), self.count_order_queries(5))
+
+
+class CartContextProcessorTest(TestCase):
+    """Test that the cart context costs nothing for read-only visitors"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.product = Product.objects.create(
+            name='Test Product',
+            slug='test-product',
+            category=self.category,
+            description='Test product',
+            price=Decimal('100.00'),
+            stock=10
+        )
+    
+    def browse(self):
+        for url in (reverse('shop:home'), reverse('shop:product_list'),
+                    self.product.get_absolute_url(), reverse('shop:cart_detail')):
+            self.assertEqual(self.client.get(url).status_code, 200)
+    
+    def test_anonymous_browsing_writes_no_session(self):
+        """Test that read-only anonymous pages never create a session row"""
+        for storage in ('shop.cart.SessionCartStorage', 'shop.cart.DatabaseCartStorage'):
+            with self.subTest(storage=storage), override_settings(CART_STORAGE=storage):
+                self.browse()
+                self.assertEqual(Session.objects.count(), 0)
+                self.assertNotIn('sessionid', self.client.cookies)
+    
+    @override_settings(CART_STORAGE='shop.cart.SessionCartStorage')
+    def test_cart_count_in_context(self):
+        """Test the precomputed cart badge count"""
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertEqual(response.context['cart_count'], 0)
+        
+        self.client.post(reverse('shop:cart_add', kwargs={'product_id': self.product.id}), {'quantity': 3})
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertEqual(response.context['cart_count'], 3)
+        self.assertContains(response, '<span class="cart-badge">3</span>', html=True)
+        self.assertEqual(Session.objects.count(), 1)
+
+
+class StockReservationTest(TestCase):
+    """Test atomic stock reservation and release"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.ring = Product.objects.create(
+            name='Ring', slug='ring', category=self.category,
+            description='Test product', price=Decimal('100.00'), stock=5
+        )
+        self.chain = Product.objects.create(
+            name='Chain', slug='chain', category=self.category,
+            description='Test product', price=Decimal('200.00'), stock=1
+        )
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+    
+    def create_order(self, expires_at, **kwargs):
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD{Order.objects.count()}',
+            first_name='Test', last_name='User', email='test@example.com', phone='1234567890',
+            address_line_1='123 Test St', city='Test City', state='Test State', postal_code='12345',
+            total_amount=Decimal('100.00'), payment_method='razorpay',
+            reservation_expires_at=expires_at, **kwargs
+        )
+        OrderItem.objects.create(order=order, product=self.ring, price=Decimal('100.00'), quantity=2)
+        return order
+    
+    def assertStock(self, ring, chain):
+        self.assertEqual(Product.objects.get(pk=self.ring.pk).stock, ring)
+        self.assertEqual(Product.objects.get(pk=self.chain.pk).stock, chain)
+    
+    def test_reserve_in_one_update(self):
+        """Test that all products are reserved with a single UPDATE"""
+        with CaptureQueriesContext(connection) as queries:
+            reserve_stock({self.ring.id: 2, self.chain.id: 1})
+        updates = [query for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertStock(3, 0)
+    
+    def test_reserve_is_all_or_nothing(self):
+        """Test that a shortage on one product reserves nothing"""
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_stock({self.ring.id: 2, self.chain.id: 2})
+        self.assertEqual(raised.exception.shortages, {self.chain.id: 1})
+        self.assertStock(5, 1)
+    
+    def test_checkout_shortage_creates_nothing(self):
+        """Test that checkout with too little stock leaves stock and orders untouched"""
+        self.client.force_login(self.user)
+        self.client.post(reverse('shop:cart_add', kwargs={'product_id': self.ring.id}), {'quantity': 1})
+        self.client.post(reverse('shop:cart_add', kwargs={'product_id': self.chain.id}), {'quantity': 1})
+        Product.objects.filter(pk=self.chain.pk).update(stock=0)
+        
+        response = self.client.post(reverse('shop:order_create'), {
+            'first_name': 'Test', 'last_name': 'User', 'email': 'test@example.com',
+            'phone': '1234567890', 'address_line_1': '123 Test St', 'city': 'Test City',
+            'state': 'Test State', 'postal_code': '12345', 'country': 'India',
+            'payment_method': 'razorpay',
+        })
+        self.assertRedirects(response, reverse('shop:cart_detail'), fetch_redirect_response=False)
+        self.assertStock(5, 0)
+        self.assertFalse(Order.objects.exists())
+    
+    def test_release_expired_reservations(self):
+        """Test that expired unpaid orders are cancelled and restocked once"""
+        reserve_stock({self.ring.id: 4})
+        now = timezone.now()
+        expired = self.create_order(now - timedelta(minutes=1))
+        self.create_order(now + timedelta(minutes=10))
+        self.create_order(now - timedelta(minutes=1), payment_status='paid')
+        
+        self.assertEqual(release_expired_reservations(now), 1)
+        self.assertEqual(release_expired_reservations(now), 0)
+        self.assertStock(3, 1)
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, 'cancelled')
+        self.assertIsNone(expired.reservation_expires_at)
+    
+    def test_confirm_after_release_reserves_again(self):
+        """Test that paying for a released order takes its stock again"""
+        reserve_stock({self.ring.id: 2})
+        order = self.create_order(timezone.now() - timedelta(minutes=1))
+        release_expired_reservations()
+        self.assertStock(5, 1)
+        
+        self.assertTrue(confirm_reservation(order))
+        self.assertStock(3, 1)
+        # A second confirmation doesn't take stock twice
+        self.assertTrue(confirm_reservation(order))
+        self.assertStock(3, 1)
+    
+    def test_confirm_after_release_and_sellout(self):
+        """Test that paying for a released order whose stock sold out leaves it cancelled"""
+        reserve_stock({self.ring.id: 2})
+        order = self.create_order(timezone.now() - timedelta(minutes=1))
+        release_expired_reservations()
+        reserve_stock({self.ring.id: 4})
+        
+        self.assertFalse(confirm_reservation(order))
+        self.assertEqual(order.status, 'cancelled')
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'cancelled')
+        self.assertStock(1, 1)
+    
+    def test_payment_after_release_and_sellout(self):
+        """Test that a payment for a sold out order is recorded but not sent for processing"""
+        reserve_stock({self.ring.id: 2})
+        order = self.create_order(timezone.now() - timedelta(minutes=1))
+        release_expired_reservations()
+        reserve_stock({self.ring.id: 4})
+        
+        with mock.patch('shop.views.razorpay.Client'):
+            response = self.client.post(reverse('shop:razorpay_verify'), {
+                'razorpay_payment_id': 'pay_1', 'razorpay_order_id': 'order_1',
+                'razorpay_signature': 'signature', 'order_number': order.order_number,
+            })
+        self.assertRedirects(response, reverse('shop:payment_failed'), fetch_redirect_response=False)
+        order.refresh_from_db()
+        self.assertEqual(order.payment_status, 'paid')
+        self.assertEqual(order.payment_id, 'pay_1')
+        self.assertEqual(order.status, 'cancelled')
+        self.assertStock(1, 1)
+
+
+class ConcurrentStockReservationTest(TransactionTestCase):
+    """Test that concurrent checkouts can't oversell"""
+    
+    def test_last_unit_sold_once(self):
+        """Test many threads buying the last unit"""
+        category = Category.objects.create(name='Test Category', slug='test-category')
+        product = Product.objects.create(
+            name='Last Ring', slug='last-ring', category=category,
+            description='Test product', price=Decimal('100.00'), stock=1
+        )
+        threads = 16
+        barrier = threading.Barrier(threads)
+        outcomes = []
+        
+        def buy():
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        reserve_stock({product.id: 1})
+                        outcomes.append('reserved')
+                    except InsufficientStock:
+                        outcomes.append('short')
+                    except OperationalError:
+                        # SQLite allows one writer at a time; retry like a busy timeout would
+                        time.sleep(0.001)
+                        continue
+                    break
+            finally:
+                connections.close_all()
+        
+        workers = [threading.Thread(target=buy) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        
+        self.assertEqual(outcomes.count('reserved'), 1)
+        self.assertEqual(outcomes.count('short'), threads - 1)
+        self.assertEqual(Product.objects.get(pk=product.pk).stock, 0)
+
+
+class ProductRatingTest(TestCase):
+    """Test the denormalized rating aggregates on Product"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.product = Product.objects.create(
+            name='Test Ring', slug='test-ring', category=self.category,
+            description='Test product', price=Decimal('100.00'), stock=10
+        )
+        self.users = [User.objects.create_user(username=f'reviewer{i}', password='testpass123') for i in range(3)]
+    
+    def review(self, user, rating):
+        return Review.objects.create(product=self.product, user=user, rating=rating, title='Title', comment='Comment')
+    
+    def assertRatings(self, avg, count, histogram):
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertAlmostEqual(product.rating_avg, avg)
+        self.assertEqual(product.rating_count, count)
+        self.assertEqual([row[1] for row in product.rating_histogram], histogram)
+    
+    def test_incremental_updates(self):
+        """Test that adding, editing and deleting reviews adjusts the aggregates"""
+        first = self.review(self.users[0], 5)
+        self.review(self.users[1], 4)
+        self.assertRatings(4.5, 2, [1, 1, 0, 0, 0])
+        
+        first.rating = 1
+        first.save()
+        self.assertRatings(2.5, 2, [0, 1, 0, 0, 1])
+        
+        first.delete()
+        self.assertRatings(4.0, 1, [0, 1, 0, 0, 0])
+        Review.objects.all().delete()
+        self.assertRatings(0, 0, [0, 0, 0, 0, 0])
+    
+    def test_rebuild_ratings(self):
+        """Test recomputing aggregates after writes that bypass signals"""
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 3)
+        Review.objects.filter(rating=3).update(rating=2)
+        Product.objects.filter(pk=self.product.pk).update(rating_avg=0, rating_count=0)
+        
+        rebuild_ratings()
+        self.assertRatings(3.5, 2, [1, 0, 0, 1, 0])
+        
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {Review._meta.db_table}')
+        rebuild_ratings()
+        self.assertRatings(0, 0, [0, 0, 0, 0, 0])
+    
+    def test_detail_page_uses_stored_aggregates(self):
+        """Test that the detail page shows ratings without aggregating reviews"""
+        self.review(self.users[0], 4)
+        self.review(self.users[1], 5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.product.get_absolute_url())
+        self.assertContains(response, '(4.5) • 2 reviews')
+        sql = [query['sql'] for query in queries]
+        self.assertFalse([query for query in sql if 'AVG(' in query or 'COUNT(' in query])
+        self.assertEqual(len([query for query in sql if '"shop_product"."slug" =' in query]), 1)
+
+
+class FragmentCacheTest(TestCase):
+    """Test cached category lists and product card fragments"""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.product = Product.objects.create(
+            name='Cached Ring', slug='cached-ring', category=self.category,
+            description='Test product', price=Decimal('100.00'), stock=10
+        )
+    
+    def test_categories_cached_until_catalog_changes(self):
+        """Test that the category list is served from cache until a catalog write"""
+        get_categories()
+        with self.assertNumQueries(0):
+            self.assertEqual([category.name for category in get_categories()], ['Test Category'])
+        
+        Category.objects.create(name='Another Category', slug='another-category')
+        self.assertEqual(len(get_categories()), 2)
+    
+    def test_warm_listing_skips_category_query(self):
+        """Test that a warm product list doesn't query categories"""
+        url = reverse('shop:product_list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertContains(response, 'Cached Ring')
+        self.assertFalse([query for query in queries if 'FROM "shop_category"' in query['sql']])
+    
+    def test_product_save_refreshes_card(self):
+        """Test that saving a product renders a fresh card"""
+        url = reverse('shop:product_list')
+        self.assertContains(self.client.get(url), 'Cached Ring')
+        
+        self.product.name = 'Renamed Ring'
+        self.product.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Renamed Ring')
+        self.assertNotContains(response, 'Cached Ring')
+
+
+class HomeSnapshotTest(TestCase):
+    """Test the bounded, cached home page sections"""
+    
+    def setUp(self):
+        cache.clear()
+        self.categories = [
+            Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(4)
+        ]
+        self.products = [
+            Product.objects.create(
+                name=f'Product {i}', slug=f'product-{i}', category=self.categories[i % 4],
+                description='Test product', price=Decimal('100.00'), stock=10
+            )
+            for i in range(30)
+        ]
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+    
+    def order(self, product, quantity, payment_status='paid'):
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD{Order.objects.count()}',
+            first_name='Test', last_name='User', email='test@example.com', phone='1234567890',
+            address_line_1='123 Test St', city='Test City', state='Test State', postal_code='12345',
+            total_amount=Decimal('100.00'), payment_method='razorpay', payment_status=payment_status
+        )
+        OrderItem.objects.create(order=order, product=product, price=product.price, quantity=quantity)
+    
+    def test_sections_are_bounded(self):
+        """Test that every section has a fixed size whatever the catalog size"""
+        snapshot = get_home_snapshot()
+        self.assertEqual(len(snapshot['new_arrivals']), 6)
+        self.assertEqual(snapshot['new_arrivals'][0], self.products[-1])
+        self.assertEqual(len(snapshot['category_highlights']), 3)
+        for category, highlights in snapshot['category_highlights']:
+            self.assertEqual(len(highlights), 4)
+            self.assertTrue(all(product.category_id == category.id for product in highlights))
+        self.assertEqual(snapshot['product_count'], 30)
+    
+    def test_bestsellers_count_paid_orders_only(self):
+        """Test bestseller ranking by units sold in paid orders"""
+        self.order(self.products[0], 2)
+        self.order(self.products[1], 5)
+        self.order(self.products[0], 1)
+        self.order(self.products[2], 50, payment_status='pending')
+        self.assertEqual(get_home_snapshot()['bestsellers'], [self.products[1], self.products[0]])
+    
+    def test_warm_home_page_queries_no_products(self):
+        """Test that a warm home page is served from the snapshot"""
+        self.client.get(reverse('shop:home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shop:home'))
+        self.assertContains(response, 'Product 29')
+        self.assertNotContains(response, 'Product 0<')
+        self.assertNotIn('products', response.context)
+        self.assertFalse([query for query in queries if 'shop_product' in query['sql']])
+    
+    def test_catalog_write_refreshes_snapshot(self):
+        """Test that a new product shows up immediately"""
+        get_home_snapshot()
+        newest = Product.objects.create(
+            name='Brand New', slug='brand-new', category=self.categories[0],
+            description='Test product', price=Decimal('100.00'), stock=10
+        )
+        self.assertEqual(get_home_snapshot()['new_arrivals'][0], newest)
+
+
+class KeysetPaginationTest(TestCase):
+    """Test cursor pagination of product listings"""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        for i in range(30):
+            Product.objects.create(
+                name=f'Product {i}', slug=f'product-{i}', category=self.category,
+                description='Test product', price=Decimal('100.00'), stock=10
+            )
+        # Ties on created_at must still page in a stable order
+        Product.objects.filter(name__in=['Product 10', 'Product 11', 'Product 12']).update(
+            created_at=Product.objects.get(name='Product 10').created_at
+        )
+        self.expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+    
+    def test_walk_forward_and_back(self):
+        """Test that next and previous cursors visit every product exactly once"""
+        paginator = KeysetPaginator(Product.objects.all(), 7, key='test')
+        page = paginator.get_page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(page)
+        self.assertEqual([product.id for page in pages for product in page], self.expected)
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertFalse(pages[0].has_previous())
+        
+        for previous in reversed(pages[:-1]):
+            page = paginator.get_page(page.previous_cursor)
+            self.assertEqual(list(page), list(previous))
+            self.assertEqual(page.number, previous.number)
+        self.assertFalse(page.has_previous())
+    
+    def test_numbered_pages_match_cursors(self):
+        """Test that page numbers resolve to the same rows as cursors"""
+        paginator = KeysetPaginator(Product.objects.all(), 7, key='test')
+        self.assertEqual(paginator.count, 30)
+        self.assertEqual(paginator.num_pages, 5)
+        page = paginator.get_numbered_page(5)
+        self.assertEqual([product.id for product in page], self.expected[28:])
+        self.assertFalse(page.has_next())
+    
+    def test_deep_page_costs_one_query(self):
+        """Test that any page is a single product query once counts are cached"""
+        url = reverse('shop:product_list_paginated', kwargs={'page': 3})
+        self.client.get(url)
+        for page in (1, 3):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('shop:product_list_paginated', kwargs={'page': page}))
+            self.assertEqual(response.status_code, 200)
+            product_queries = [query['sql'] for query in queries if 'FROM "shop_product"' in query['sql']]
+            self.assertEqual(len(product_queries), 1)
+            self.assertFalse([sql for sql in product_queries if 'OFFSET' in sql or 'COUNT(' in sql])
+        self.assertEqual(response.context['page_obj'].number, 3)
+        self.assertEqual(
+            [product.id for product in response.context['products']],
+            self.expected[24:30]
+        )
+    
+    def test_numbered_page_is_one_boundary_lookup(self):
+        """Test that a page number costs one row lookup, not a scan of the listing"""
+        paginator = KeysetPaginator(Product.objects.all(), 7, key='test')
+        self.assertEqual(paginator.count, 30)
+        with CaptureQueriesContext(connection) as queries:
+            page = paginator.get_numbered_page(4)
+        self.assertEqual([product.id for product in page], self.expected[21:28])
+        product_queries = [query['sql'] for query in queries if 'FROM "shop_product"' in query['sql']]
+        self.assertEqual(len(product_queries), 2)
+        self.assertIn('LIMIT 1 OFFSET 20', product_queries[0])
+        with self.assertRaises(Http404):
+            paginator.get_numbered_page(10 ** 30)
+    
+    def test_malformed_cursors_are_rejected(self):
+        """Test that cursors with a wrongly typed or out-of-range field decode to None"""
+        now = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(now, 5, 2)), (now, 5, 2, False))
+        
+        def token(payload):
+            return urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        
+        stamp = now.isoformat()
+        for payload in (
+            [stamp, True, 2, False], [stamp, '5', 2, False], [stamp, 10 ** 30, 2, False],
+            [stamp, 5, 2.5, False], [stamp, 5, 0, False], [stamp, 5, 2, 'yes'],
+            [now.replace(tzinfo=None).isoformat(), 5, 2, False], [5, 5, 2, False], {'cursor': 1},
+        ):
+            self.assertIsNone(decode_cursor(token(payload)), payload)
+        self.assertIsNone(decode_cursor('W1' * 200))
+        
+        response = self.client.get(reverse('shop:product_list'), {'cursor': token([stamp, 10 ** 30, None, False])})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].number, 1)
+    
+    def test_invalid_pages(self):
+        """Test out-of-range pages 404 and malformed cursors fall back to page one"""
+        self.assertEqual(self.client.get(reverse('shop:product_list_paginated', kwargs={'page': 9})).status_code, 404)
+        response = self.client.get(reverse('shop:category_detail', kwargs={'slug': 'test-category'}), {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+
+class ImageDerivativeTest(TestCase):
+    """Test the content-addressed image derivative pipeline"""
+    
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_DERIVATIVES_ASYNC=False)
+        self.settings_override.enable()
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+    
+    def upload(self, color='red', size=(1000, 800)):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'PNG')
+        return SimpleUploadedFile('ring.png', buffer.getvalue(), content_type='image/png')
+    
+    def create_product(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                name='Ring', slug='ring', category=self.category, description='Test product',
+                price=Decimal('100.00'), stock=10, image=self.upload(), **kwargs
+            )
+    
+    def test_derivatives_built_and_original_untouched(self):
+        """Test that every preset width is rendered without modifying the upload"""
+        product = self.create_product()
+        with open(product.image.path, 'rb') as original:
+            self.assertEqual(Image.open(original).size, (1000, 800))
+        
+        product.refresh_from_db()
+        entry = product.image_derivatives['image']
+        self.assertEqual((entry['width'], entry['height']), (1000, 800))
+        self.assertTrue(entry['placeholder'].startswith('data:image/jpeg;base64,'))
+        self.assertEqual(sorted(entry['variants']['webp'], key=int), ['96', '192', '300', '450', '600', '1000'])
+        self.assertEqual(get_srcset(product, 'zoom'), f"/media/{entry['variants']['jpg']['1000']} 1000w")
+        self.assertIn(' 450w', get_srcset(product, 'card', 'webp'))
+    
+    def test_unchanged_images_are_skipped(self):
+        """Test that saves without a new image queue nothing and rebuilds are no-ops"""
+        product = self.create_product()
+        product = Product.objects.get(pk=product.pk)
+        product.name = 'Renamed Ring'
+        with mock.patch('shop.signals.schedule_derivatives') as schedule:
+            product.save()
+        schedule.assert_not_called()
+        self.assertFalse(build_derivatives(product.pk))
+    
+    def test_replaced_image_rebuilds(self):
+        """Test that a new image gets its own content-addressed derivatives"""
+        product = self.create_product()
+        product = Product.objects.get(pk=product.pk)
+        old_hash = product.image_derivatives['image']['hash']
+        product.image = self.upload(color='blue', size=(200, 100))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        product.refresh_from_db()
+        entry = product.image_derivatives['image']
+        self.assertNotEqual(entry['hash'], old_hash)
+        self.assertEqual(sorted(entry['variants']['jpg'], key=int), ['96', '192', '200'])
+        self.assertEqual(get_srcset(product, 'card'), f"/media/{entry['variants']['jpg']['200']} 200w")
+
+    def render_tag(self, product, arguments="'card'"):
+        template = Template("{% load image_tags %}{% product_image product " + arguments + " %}")
+        return template.render(Context({'product': product}))
+    
+    def test_product_image_tag(self):
+        """Test that the tag renders srcset, sizes and placeholder from the manifest alone"""
+        product = Product.objects.get(pk=self.create_product().pk)
+        entry = product.image_derivatives['image']
+        with mock.patch.object(FileSystemStorage, 'exists', side_effect=AssertionError), \
+                mock.patch.object(FileSystemStorage, 'size', side_effect=AssertionError):
+            html = self.render_tag(product, "'card' class='card-img-top'")
+        
+        self.assertIn(f'src="/media/{entry["variants"]["jpg"]["600"]}"', html)
+        self.assertIn(f'/media/{entry["variants"]["webp"]["300"]} 300w', html)
+        self.assertIn('sizes="(max-width: 767px) 100vw', html)
+        self.assertIn('width="600" height="480"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn("data:image/jpeg;base64,", html)
+        self.assertIn('class="card-img-top"', html)
+        self.assertNotIn('1000w', html)
+    
+    def test_product_image_tag_before_derivatives(self):
+        """Test that the tag falls back to the original until derivatives exist"""
+        with self.settings(IMAGE_DERIVATIVES_ASYNC=True), mock.patch('shop.images.get_executor'):
+            product = self.create_product()
+        html = self.render_tag(product, "'zoom' loading='eager'")
+        self.assertIn(f'src="{product.image.url}"', html)
+        self.assertIn('loading="eager"', html)
+        self.assertNotIn('srcset', html)
+        url = Template("{% load image_tags %}{% product_image_url product 'zoom' %}").render(Context({'product': product}))
+        self.assertEqual(url, product.image.url)
+    
+    def test_detail_page_serves_derivatives(self):
+        """Test that the product page and its share tags never point at the full-size upload"""
+        product = Product.objects.get(pk=self.create_product().pk)
+        entry = product.image_derivatives['image']
+        response = self.client.get(reverse('shop:product_detail', args=[product.slug]))
+        self.assertNotContains(response, product.image.url)
+        zoom = f"/media/{entry['variants']['jpg']['1000']}"
+        self.assertContains(response, f'://testserver{zoom}', count=3)  # og:image, twitter:image, JSON-LD
+        self.assertContains(response, f'data-zoom-src="{zoom}"')
+        
+        html = Template(
+            "{% load image_tags %}{% product_image_url product 'thumbnail' %}|{% product_image_url product 'zoom' 'image_2' %}"
+        ).render(Context({'product': product}))
+        self.assertEqual(html, f"/media/{entry['variants']['jpg']['192']}|")
+
+
+class ImageRequestHandler(BaseHTTPRequestHandler):
+    """Local stand-in for remote product image URLs"""
+    
+    def do_GET(self):
+        if self.path.startswith('/missing'):
+            self.send_error(404)
+            return
+        self.server.hits += 1
+        body = self.server.image_bytes
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+class ProductImportTest(TestCase):
+    """Test the chunked, resumable product importer"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageRequestHandler)
+        buffer = BytesIO()
+        Image.new('RGB', (40, 40), 'gold').save(buffer, 'PNG')
+        cls.server.image_bytes = buffer.getvalue()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+    
+    def setUp(self):
+        self.server.hits = 0
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.directory)
+        self.settings_override.enable()
+        self.path = os.path.join(self.directory, 'products.csv')
+        Category.objects.create(name='Rings', slug='rings')
+        Product.objects.create(
+            name='Gold Ring', slug='gold-ring', category=Category.objects.get(slug='rings'),
+            description='Existing', price=Decimal('10.00'), stock=1
+        )
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def write_csv(self, rows):
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['name', 'description', 'price', 'category', 'stock', 'size', 'color', 'image_url'])
+            writer.writerows(rows)
+    
+    def test_import_resolves_categories_slugs_and_images(self):
+        """Test categories, slug collisions, images and bad rows in one run"""
+        self.write_csv([
+            ['Gold Ring', 'New', '20.00', 'Rings', '5', 'S', 'yellow', f'{self.base_url}/ring.png'],
+            ['Gold Ring', 'Another', '25.00', 'Rings', '0', 'M', 'yellow', ''],
+            ['Pearl Necklace', 'Pearls', '99.50', 'Necklaces', '3', 'M', 'white', f'{self.base_url}/pearl.png'],
+            ['Broken', 'Bad price', 'abc', 'Rings', '1', 'M', 'red', ''],
+            ['Silver Bangle', 'Bangle', '15.00', 'Bangles', '2', 'L', 'gray', f'{self.base_url}/missing.png'],
+        ])
+        importer = ProductImporter(self.path, batch_size=2, workers=4)
+        with self.assertLogs('shop.importer', 'WARNING'):
+            stats = importer.run()
+        
+        self.assertEqual((stats.rows, stats.created, stats.errors, stats.images), (5, 4, 1, 2))
+        self.assertEqual(importer.errors, [(5, 'invalid price or weight_kg')])
+        self.assertEqual(self.server.hits, 2)
+        self.assertEqual(
+            set(Product.objects.filter(name='Gold Ring').values_list('slug', flat=True)),
+            {'gold-ring', 'gold-ring-1', 'gold-ring-2'}
+        )
+        self.assertTrue(Category.objects.filter(slug='necklaces').exists())
+        self.assertFalse(Product.objects.get(slug='gold-ring-2').available)
+        self.assertTrue(Product.objects.get(slug='pearl-necklace').image.name.startswith('products/'))
+        self.assertFalse(os.path.exists(importer.checkpoint_path))
+    
+    def test_import_resumes_after_crash(self):
+        """Test that a failed chunk is retried on the next run without duplicates"""
+        self.write_csv([[f'Item {i}', '', '10.00', 'Rings', '1', 'M', 'red', ''] for i in range(5)])
+        original = Product.objects.bulk_create
+        calls = []
+        
+        def crash_on_second_chunk(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise RuntimeError('simulated crash')
+            return original(objs, *args, **kwargs)
+        
+        with mock.patch.object(Product.objects, 'bulk_create', side_effect=crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                ProductImporter(self.path, batch_size=2, skip_images=True).run()
+        self.assertEqual(Product.objects.filter(name__startswith='Item').count(), 2)
+        
+        stats = ProductImporter(self.path, batch_size=2, skip_images=True).run()
+        self.assertEqual((stats.rows, stats.created), (5, 5))
+        self.assertEqual(Product.objects.filter(name__startswith='Item').count(), 5)
+    
+    def test_committed_pending_chunk_is_not_repeated(self):
+        """Test that a chunk committed just before a crash counts as done"""
+        self.write_csv([[f'Item {i}', '', '10.00', 'Rings', '1', 'M', 'red', ''] for i in range(3)])
+        importer = ProductImporter(self.path, batch_size=2, skip_images=True)
+        with mock.patch.object(ProductImporter, 'clear_checkpoint'):
+            importer.run()
+        # Roll the checkpoint back to "first chunk committing"
+        with open(importer.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        checkpoint.update(rows=0, created=0, pending={'rows': 2, 'slugs': ['item-0', 'item-1'], 'errors': 0, 'images': 0})
+        Product.objects.filter(slug='item-2').delete()
+        with open(importer.checkpoint_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        
+        stats = ProductImporter(self.path, batch_size=2, skip_images=True).run()
+        self.assertEqual((stats.rows, stats.created), (3, 3))
+        self.assertEqual(Product.objects.filter(name__startswith='Item').count(), 3)
+    
+    def test_checkpoint_for_other_file_is_rejected(self):
+        """Test that a checkpoint is not applied to a changed file"""
+        self.write_csv([['Item', '', '10.00', 'Rings', '1', 'M', 'red', '']])
+        with open(f'{self.path}.checkpoint', 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': '1', 'rows': 1, 'created': 1, 'errors': 0, 'images': 0, 'pending': None}, f)
+        with self.assertRaises(CheckpointMismatch):
+            ProductImporter(self.path).run()
+        self.assertEqual(ProductImporter(self.path, skip_images=True).run(restart=True).created, 1)
+    
+    def test_checkpoint_for_same_size_file_is_rejected(self):
+        """Test that a rewritten file of the same size doesn't match the old checkpoint"""
+        rows = [[f'Item {i}', '', '10.00', 'Rings', '1', 'M', 'red', ''] for i in range(3000)]
+        self.write_csv(rows)
+        importer = ProductImporter(self.path, batch_size=1000, skip_images=True)
+        with mock.patch.object(ProductImporter, 'clear_checkpoint'):
+            importer.run()
+        size = os.path.getsize(self.path)
+        # Edited well past the first 64 KB
+        rows[-1][2] = '20.00'
+        self.write_csv(rows)
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertGreater(size, 64 * 1024)
+        with self.assertRaises(CheckpointMismatch):
+            ProductImporter(self.path, skip_images=True).run()
+    
+    def test_categories_with_the_same_slug(self):
+        """Test that names slugifying alike share a category and a clash is reported on the row"""
+        self.write_csv([
+            ['Plain Ring', '', '10.00', 'rings!', '1', 'M', 'red', ''],
+            ['Anklet', '', '10.00', 'Anklets', '1', 'M', 'red', ''],
+        ])
+        importer = ProductImporter(self.path, skip_images=True)
+        original = importer.load_lookups
+        
+        def load_then_add_category():
+            original()
+            # Created by someone else after the lookups were loaded
+            Category.objects.create(name='Anklets', slug='anklet')
+        
+        with mock.patch.object(importer, 'load_lookups', side_effect=load_then_add_category):
+            stats = importer.run()
+        self.assertEqual((stats.created, stats.errors), (1, 1))
+        self.assertEqual(Product.objects.get(slug='plain-ring').category.slug, 'rings')
+        self.assertEqual(importer.errors, [(3, "category 'Anklets' clashes with an existing category")])
+
+
+class CatalogSyncTest(TestCase):
+    """Test SKU-keyed catalog feed sync"""
+    
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'feed.csv')
+        self.rows = [
+            [f'SKU-{i}', f'Bangle {i}', 'Gold bangle', '100.00', 'Bangles', '5', 'M', 'yellow']
+            for i in range(20)
+        ]
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def sync(self, **kwargs):
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['sku', 'name', 'description', 'price', 'category', 'stock', 'size', 'color'])
+            writer.writerows(self.rows)
+        return CatalogSync(self.path, batch_size=8, skip_images=True, **kwargs).run()
+    
+    def test_resync_only_touches_changed_rows(self):
+        """Test created, updated, unchanged and deactivated counts across syncs"""
+        stats = self.sync()
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (20, 0, 0))
+        first = Product.objects.get(sku='SKU-0')
+        
+        # Same feed again: nothing but the lookups and no writes
+        with CaptureQueriesContext(connection) as queries:
+            stats = self.sync()
+        self.assertEqual((stats.created, stats.updated, stats.unchanged), (0, 0, 20))
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+        
+        self.rows[3][3] = '120.00'
+        self.rows[4][5] = '0'
+        self.rows[5][1] = 'Bangle 5'  # unchanged value
+        self.rows.append(['SKU-NEW', 'Anklet', 'Silver anklet', '40.00', 'Anklets', '2', 'S', 'gray'])
+        del self.rows[0]
+        stats = self.sync()
+        self.assertEqual(
+            (stats.created, stats.updated, stats.unchanged, stats.deactivated),
+            (1, 2, 17, 1)
+        )
+        self.assertEqual(Product.objects.get(sku='SKU-3').price, Decimal('120.00'))
+        self.assertFalse(Product.objects.get(sku='SKU-4').available)
+        self.assertFalse(Product.objects.get(sku='SKU-0').available)
+        self.assertEqual(Product.objects.get(sku='SKU-0').slug, first.slug)
+        self.assertEqual(Product.objects.filter(name__startswith='Bangle 1').count(), 11)
+    
+    def test_first_sync_links_products_without_sku(self):
+        """Test that existing SKU-less products take their feed row's SKU instead of being duplicated"""
+        category = Category.objects.create(name='Bangles', slug='bangles')
+        for i in range(3):
+            Product.objects.create(
+                name=f'Bangle {i}', slug=f'bangle-{i}', category=category,
+                description='Gold bangle', price=Decimal('90.00'), stock=5
+            )
+        manual = Product.objects.create(
+            name='Handmade Bangle', slug='handmade-bangle', category=category,
+            description='One off', price=Decimal('500.00'), stock=1
+        )
+        stats = self.sync()
+        
+        self.assertEqual((stats.created, stats.linked, stats.updated), (17, 3, 3))
+        self.assertEqual(Product.objects.count(), 21)
+        linked = Product.objects.get(slug='bangle-1')
+        self.assertEqual((linked.sku, linked.price), ('SKU-1', Decimal('100.00')))
+        self.assertEqual(Product.objects.filter(name='Bangle 1').count(), 1)
+        
+        del self.rows[0]
+        self.assertEqual(self.sync().deactivated, 1)
+        self.assertFalse(Product.objects.get(slug='bangle-0').available)
+        self.assertTrue(Product.objects.get(pk=manual.pk).available)
+    
+    def test_no_match_slug_creates_new_products(self):
+        """Test that match_slug=False creates every unknown SKU"""
+        category = Category.objects.create(name='Bangles', slug='bangles')
+        Product.objects.create(
+            name='Bangle 0', slug='bangle-0', category=category,
+            description='Gold bangle', price=Decimal('90.00'), stock=5
+        )
+        self.assertEqual(self.sync(match_slug=False).created, 20)
+        self.assertIsNone(Product.objects.get(slug='bangle-0').sku)
+    
+    def test_reappearing_product_is_reactivated(self):
+        """Test that a deactivated SKU comes back when it returns to the feed"""
+        self.sync()
+        removed = self.rows.pop(0)
+        self.assertEqual(self.sync().deactivated, 1)
+        self.rows.append(removed)
+        stats = self.sync()
+        self.assertEqual((stats.updated, stats.deactivated), (1, 0))
+        self.assertTrue(Product.objects.get(sku='SKU-0').available)
+    
+    def test_force_reverts_manual_edits(self):
+        """Test that --force compares rows whose feed content didn't change"""
+        self.sync()
+        Product.objects.filter(sku='SKU-1').update(price=Decimal('1.00'))
+        self.assertEqual(self.sync().updated, 0)
+        self.assertEqual(self.sync(force=True).updated, 1)
+        self.assertEqual(Product.objects.get(sku='SKU-1').price, Decimal('100.00'))
+    
+    def test_invalid_and_duplicate_rows(self):
+        """Test that bad rows are reported and their products left active"""
+        self.sync()
+        self.rows[2][3] = 'free'
+        self.rows.append(list(self.rows[1]))
+        self.rows.append(['', 'No SKU', '', '10.00', 'Bangles', '1', 'M', 'red'])
+        stats = self.sync()
+        self.assertEqual((stats.errors, stats.deactivated), (3, 0))
+        self.assertTrue(Product.objects.get(sku='SKU-2').available)
+
+
+class BatchStockUpdateTest(TestCase):
+    """Test set-based warehouse stock updates"""
+    
+    def setUp(self):
+        self.category = Category.objects.create(name='Rings', slug='rings')
+        self.products = [
+            Product.objects.create(
+                name=f'Ring {i}', slug=f'ring-{i}', category=self.category,
+                description='Test', price=Decimal('10.00'), stock=stock, available=stock > 0
+            )
+            for i, stock in enumerate([5, 0, 3, 8])
+        ]
+    
+    def stocks(self):
+        return list(Product.objects.order_by('slug').values_list('stock', 'available'))
+    
+    def test_batch_from_stdin(self):
+        """Test sets, deltas, clamping, availability and the summary in one UPDATE"""
+        feed = StringIO(
+            'id,slug,stock,delta\n'
+            f'{self.products[0].id},,0,\n'
+            ',ring-1,,4\n'
+            ',ring-2,,-10\n'
+            ',ring-3,,2\n'
+            ',ring-3,,-1\n'
+            ',no-such-ring,7,\n'
+            ',ring-3,1,1\n'
+        )
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('update_inventory', batch='-', stdin=feed, stdout=out)
+        
+        self.assertEqual(self.stocks(), [(0, False), (4, True), (0, False), (9, True)])
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 1)
+        output = out.getvalue()
+        self.assertIn('Updated 4 products', output)
+        self.assertIn('Back in stock: 1', output)
+        self.assertIn('Sold out: 2', output)
+        self.assertIn('Unknown products: no-such-ring', output)
+        self.assertIn('✗ Line 8', output)
+    
+    def test_large_batch_is_split(self):
+        """Test that batches larger than the chunk size all apply in one transaction"""
+        changes = {product.id: ('add', 1) for product in self.products}
+        changes[10 ** 6] = ('set', 1)
+        summary = apply_stock_changes(changes, batch_size=2)
+        self.assertEqual(summary.updated, 4)
+        self.assertEqual(summary.unknown, [10 ** 6])
+        self.assertEqual(self.stocks(), [(6, True), (1, True), (4, True), (9, True)])
+
+
+class InventoryReportTest(TestCase):
+    """Test the streaming --list-products report"""
+    
+    def setUp(self):
+        for index, name in enumerate(['Rings', 'Anklets']):
+            category = Category.objects.create(name=name, slug=name.lower())
+            for stock in [0, 3, 20]:
+                Product.objects.create(
+                    name=f'{name} {stock}', slug=f'{name.lower()}-{stock}', category=category,
+                    description='Test', price=Decimal('10.00'), stock=stock
+                )
+    
+    def report(self, output_format):
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('update_inventory', list_products=True, format=output_format, stdout=out)
+        return out.getvalue(), len(queries)
+    
+    def test_text_report(self):
+        """Test that the report costs two queries whatever the catalog size"""
+        output, queries = self.report('text')
+        self.assertEqual(queries, 2)
+        self.assertLess(output.index('ANKLETS'), output.index('RINGS'))
+        self.assertIn('SUMMARY: 6 products, 4 need restocking (2 out of stock)', output)
+    
+    def test_csv_and_json_reports(self):
+        """Test machine-readable output modes"""
+        output, _ = self.report('csv')
+        rows = list(csv.DictReader(StringIO(output)))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0], {
+            'id': str(Product.objects.get(slug='anklets-0').id), 'name': 'Anklets 0',
+            'category': 'Anklets', 'stock': '0', 'available': '1', 'status': 'out'
+        })
+        
+        output, queries = self.report('json')
+        report = json.loads(output)
+        self.assertEqual(queries, 2)
+        self.assertEqual(report['summary'], {'total': 6, 'available': 6, 'low_stock': 2, 'out_of_stock': 2})
+        self.assertEqual([p['name'] for p in report['products']][:2], ['Anklets 0', 'Anklets 20'])
+
+
+class ShippingTablesTest(TestCase):
+    """Test in-memory shipping quotes"""
+    
+    def setUp(self):
+        cache.clear()
+        self.south = ShippingZone.objects.create(
+            zone='south', cost_per_kg=Decimal('40.00'), free_shipping_threshold=Decimal('2000.00')
+        )
+        PincodeZone.objects.create(pincode='600001', zone=self.south, city='Chennai')
+        PincodeZone.objects.create(pincode='SW1A', country='UK')
+        ShippingRate.objects.create(name='India', country='India', cost=Decimal('60.00'))
+        ShippingRate.objects.create(
+            name='UK small', country='UK', cost=Decimal('500.00'),
+            min_shipping_charge=Decimal('800.00'), max_order_value=Decimal('5000.00')
+        )
+        ShippingRate.objects.create(name='UK large', country='UK', cost=Decimal('400.00'), priority=1)
+    
+    def test_quotes_run_without_queries(self):
+        """Test zone, country, band and fallback pricing from the loaded tables"""
+        get_shipping_tables()
+        with self.assertNumQueries(0):
+            self.assertEqual(quote_shipping(500, 'India', '600001', 1.5), Decimal('60.00'))
+            self.assertEqual(quote_shipping(2500, 'India', '600001', 1.5), Decimal('0.00'))
+            self.assertEqual(quote_shipping(500, 'India', '110001', 2), Decimal('120.00'))
+            # A known postal code overrides the submitted country
+            self.assertEqual(quote_shipping(1000, 'India', 'SW1A', 1), Decimal('800.00'))
+            self.assertEqual(quote_shipping(6000, 'UK', None, 3), Decimal('1200.00'))
+            self.assertEqual(quote_shipping(100, 'Peru', '1000', 1), Decimal('100.00'))
+            self.assertEqual(PincodeZone.get_country_from_pincode('SW1A'), 'UK')
+            self.assertIsNone(ShippingZone.get_rate_for_pincode('SW1A', 100, 1))
+            self.assertEqual(ShippingRate.calculate_shipping_cost(500, 'India', '600001', 1), Decimal('40.00'))
+    
+    def test_changes_reload_tables(self):
+        """Test that saving a zone, rate or pincode is picked up by the next quote"""
+        self.assertEqual(quote_shipping(500, 'India', '600001', 1), Decimal('40.00'))
+        self.south.cost_per_kg = Decimal('45.00')
+        self.south.save()
+        self.assertEqual(quote_shipping(500, 'India', '600001', 1), Decimal('45.00'))
+        
+        self.south.is_active = False
+        self.south.save()
+        self.assertEqual(quote_shipping(500, 'India', '600001', 1), Decimal('60.00'))
+        
+        PincodeZone.objects.filter(pincode='SW1A').delete()
+        self.assertIsNone(get_shipping_tables().get_country('SW1A'))
+    
+    def test_change_from_another_worker(self):
+        """Test that a rate changed by another process is quoted once this worker's cached version expires"""
+        # Publish setUp's changes as if they had been committed
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version('shipping')
+        self.assertEqual(quote_shipping(500, 'India', '110001', 1), Decimal('60.00'))
+        
+        # Another worker edits the rate; only the database counter moves
+        ShippingRate.objects.filter(country='India').update(cost=Decimal('70.00'))
+        VersionCounter.objects.filter(name='shipping').update(value=F('value') + 1)
+        self.assertEqual(quote_shipping(500, 'India', '110001', 1), Decimal('60.00'))
+        cache.delete(version_key('shipping'))
+        self.assertEqual(quote_shipping(500, 'India', '110001', 1), Decimal('70.00'))
+    
+    def test_process_local_cache_is_reported(self):
+        """Test that the deploy checks warn about a cache the workers don't share"""
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=local):
+            self.assertEqual([message.id for message in check_shared_cache(None)], ['shop.W001'])
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+    
+    def test_batch_quotes(self):
+        """Test that a batch prices every destination like single quotes do"""
+        destinations = [
+            ('600001', 'India', 1.5, 500),
+            ('600001', 'India', 1.5, 2500),
+            ('SW1A', 'India', 1, 1000),
+            ('', 'UK', 3, 6000),
+            ('1000', 'Peru', 1, 100),
+        ] * 200
+        get_shipping_tables()
+        with self.assertNumQueries(0):
+            quotes = quote_shipping_batch(destinations)
+        self.assertEqual(len(quotes), 1000)
+        for quote, (pincode, country, weight, total) in zip(quotes, destinations):
+            self.assertEqual(quote.cost, quote_shipping(total, country, pincode, weight))
+        self.assertEqual((quotes[2].country, quotes[2].pincode_found), ('UK', True))
+        self.assertEqual((quotes[4].country, quotes[4].pincode_found), ('Peru', False))
+    
+    def test_batch_quote_api(self):
+        """Test the batch quote endpoint, including per-destination errors"""
+        url = reverse('shop:shipping_quotes')
+        body = {'destinations': [
+            {'pincode': '600001', 'country': 'India', 'weight_kg': 1.5, 'cart_total': 500},
+            {'pincode': '110001', 'country': ''},
+            {'country': 'UK', 'weight_kg': '3', 'cart_total': '6000'},
+            {'country': 'India', 'weight_kg': -1},
+            {'country': 'India', 'weight_kg': '1e30'},
+            {'country': 'India', 'cart_total': '1e30'},
+        ]}
+        get_shipping_tables()
+        with self.assertNumQueries(0):
+            response = self.client.post(url, json.dumps(body), content_type='application/json')
+        data = response.json()
+        self.assertEqual(data['count'], 6)
+        self.assertEqual([quote['success'] for quote in data['quotes']], [True, False, True, False, False, False])
+        self.assertIn('at most', data['quotes'][4]['error'])
+        self.assertEqual(data['quotes'][0]['shipping_cost'], 60.0)
+        self.assertTrue(data['quotes'][0]['pincode_found'])
+        self.assertEqual(data['quotes'][2]['shipping_cost'], 1200.0)
+        
+        self.assertEqual(self.client.post(url, 'nonsense', content_type='application/json').status_code, 400)
+        with override_settings(SHIPPING_QUOTE_BATCH_LIMIT=2):
+            response = self.client.post(url, json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PincodeRuleTest(TestCase):
+    """Test prefix/range postal code rules"""
+    
+    def setUp(self):
+        cache.clear()
+        self.north = ShippingZone.objects.create(zone='north', cost_per_kg=Decimal('40.00'))
+        self.south = ShippingZone.objects.create(zone='south', cost_per_kg=Decimal('50.00'))
+        self.east = ShippingZone.objects.create(zone='east', cost_per_kg=Decimal('60.00'))
+        PincodeRule.objects.create(prefix='1', zone=self.north)
+        PincodeRule.objects.create(prefix='11', zone=self.south)
+        PincodeRule.objects.create(range_start='110001', range_end='110096', zone=self.east)
+        PincodeRule.objects.create(prefix='sw1a', country='United Kingdom')
+    
+    def test_resolution_order(self):
+        """Test exact override, then range, then longest prefix, within the country"""
+        tables = get_shipping_tables()
+        with self.assertNumQueries(0):
+            self.assertEqual(tables.lookup('110050', 'India'), (self.east.id, 'India'))
+            self.assertEqual(tables.lookup('110097', 'India'), (self.south.id, 'India'))
+            self.assertEqual(tables.lookup('123456', 'India'), (self.north.id, 'India'))
+            self.assertIsNone(tables.lookup('923456', 'India'))
+            self.assertEqual(tables.lookup('sw1a 1aa', 'United Kingdom'), (None, 'United Kingdom'))
+            self.assertIsNone(tables.lookup('SW1A1AA', 'India'))
+            self.assertEqual(tables.get_country('SW1A-1AA'), 'United Kingdom')
+        
+        PincodeZone.objects.create(pincode='110050', zone=self.north)
+        self.assertEqual(get_shipping_tables().lookup('110050', 'India'), (self.north.id, 'India'))
+        self.assertEqual(quote_shipping(100, 'India', '110050', 1), Decimal('40.00'))
+        self.assertEqual(quote_shipping(100, 'India', '110051', 1), Decimal('60.00'))
+    
+    def test_validation(self):
+        """Test that rules need one form and ranges may not overlap"""
+        with self.assertRaises(ValidationError):
+            PincodeRule(prefix='2', range_start='200000', range_end='200010').full_clean()
+        with self.assertRaises(ValidationError):
+            PincodeRule(range_start='110090', range_end='110100').full_clean()
+        with self.assertRaises(ValidationError):
+            PincodeRule(range_start='1100', range_end='110100').full_clean()
+        PincodeRule(range_start='110090', range_end='110100', country='Nepal').full_clean()
+        PincodeRule(range_start='110097', range_end='110100').full_clean()
+    
+    def test_setup_commands_seed_rules(self):
+        """Test that the setup commands cover every region with a few rules"""
+        call_command('setup_zone_shipping', stdout=StringIO())
+        call_command('setup_international_pincodes', stdout=StringIO())
+        self.assertLess(PincodeRule.objects.count(), 60)
+        self.assertFalse(PincodeZone.objects.exists())
+        tables = get_shipping_tables()
+        self.assertEqual(tables.zones[tables.lookup('600001', 'India')[0]].zone, 'south')
+        self.assertEqual(tables.zones[tables.lookup('248001', 'India')[0]].zone, 'north')
+        self.assertEqual(tables.zones[tables.lookup('226001', 'India')[0]].zone, 'central')
+        self.assertEqual(tables.get_country('606011', 'United States'), 'United States')
+        self.assertEqual(tables.get_country('606011', 'India'), 'India')
+    
+    def test_uttar_pradesh_and_uttarakhand_pincodes(self):
+        """Test that the seeded rules tell Uttar Pradesh from Uttarakhand in the shared districts"""
+        call_command('setup_zone_shipping', stdout=StringIO())
+        tables = get_shipping_tables()
+        zones = {
+            # Uttar Pradesh
+            '243001': 'central',  # Bareilly
+            '244001': 'central',  # Moradabad
+            '246701': 'central',  # Bijnor
+            '247001': 'central',  # Saharanpur
+            '250001': 'central',  # Meerut
+            '261001': 'central',  # Sitapur
+            '262001': 'central',  # Pilibhit
+            '262701': 'central',  # Lakhimpur Kheri
+            # Uttarakhand
+            '246001': 'north',  # Pauri
+            '247667': 'north',  # Roorkee
+            '248001': 'north',  # Dehradun
+            '249201': 'north',  # Rishikesh
+            '262308': 'north',  # Khatima
+            '262501': 'north',  # Pithoragarh
+            '263001': 'north',  # Nainital
+        }
+        for pincode, zone in zones.items():
+            self.assertEqual(tables.zones[tables.lookup(pincode, 'India')[0]].zone, zone, pincode)
+
+
+class ShippingImportTest(TestCase):
+    """Test streaming pincode and rate imports from Excel and CSV"""
+    
+    def setUp(self):
+        cache.clear()
+        self.north = ShippingZone.objects.create(zone='north', cost_per_kg=Decimal('40.00'))
+        self.south = ShippingZone.objects.create(zone='south', cost_per_kg=Decimal('50.00'))
+        PincodeZone.objects.create(pincode='110001', zone=self.south, city='Old')
+        self.tmpdir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    
+    def write_xlsx(self, name, rows):
+        path = os.path.join(self.tmpdir, name)
+        workbook = Workbook()
+        for row in rows:
+            workbook.active.append(row)
+        workbook.save(path)
+        return path
+    
+    def write_csv(self, name, rows):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(rows)
+        return path
+    
+    def test_pincode_upsert_from_excel(self):
+        """Test that pincodes are created or updated in batched upserts"""
+        path = self.write_xlsx('pincodes.xlsx', [
+            ('Pincode', 'Zone', 'City', 'State', 'Country'),
+            (110001, 'North', 'New Delhi', 'Delhi', 'India'),
+            (400001, 'south', 'Mumbai', 'Maharashtra', None),
+            ('110002', 'nowhere', 'Delhi', 'Delhi', 'India'),
+            (None, 'north', 'Delhi', '', ''),
+            ('018956', '', 'Singapore', '', 'Singapore'),
+            ('400001', 'north', 'Mumbai', 'Maharashtra', 'India'),
+        ])
+        version = get_shipping_version()
+        importer = PincodeImporter(batch_size=2)
+        # Zones, then per batch: the stored rows, the upsert and the version bump
+        with self.assertNumQueries(13):
+            stats = importer.run(path)
+        
+        self.assertEqual((stats.rows, stats.created, stats.updated, stats.errors), (6, 2, 2, 2))
+        self.assertEqual([line for line, _ in importer.errors], [4, 5])
+        delhi = PincodeZone.objects.get(pincode='110001')
+        self.assertEqual((delhi.zone, delhi.city), (self.north, 'New Delhi'))
+        self.assertEqual(PincodeZone.objects.get(pincode='400001').zone, self.north)
+        self.assertEqual(PincodeZone.objects.get(pincode='018956').country, 'Singapore')
+        self.assertNotEqual(get_shipping_version(), version)
+        self.assertEqual(quote_shipping(100, 'India', '110001', 1), Decimal('40.00'))
+    
+    def test_rate_upsert_from_csv(self):
+        """Test that rates are matched on name and country"""
+        ShippingRate.objects.create(name='Singapore Standard', country='Singapore', cost=Decimal('100.00'))
+        path = self.write_csv('rates.csv', [
+            ('Name', 'Description', 'Country', 'Cost (₹/kg)', 'Min Ship (₹)', 'Min Order', 'Max Order', 'Free Ship', 'Priority'),
+            ('Singapore Standard', 'Updated', 'Singapore', '290', '180', '0', '', '', '1'),
+            ('Singapore Standard', '', 'Malaysia', '250', '150', '', '', '', ''),
+            ('USA Standard', '', 'United States', 'free', '', '', '', '', ''),
+        ])
+        importer = ShippingRateImporter()
+        stats = importer.run(path)
+        self.assertEqual((stats.created, stats.updated, stats.errors), (1, 1, 1))
+        self.assertEqual(ShippingRate.objects.count(), 2)
+        rate = ShippingRate.objects.get(country='Singapore')
+        self.assertEqual((rate.cost, rate.min_shipping_charge, rate.description), (Decimal('290.00'), Decimal('180.00'), 'Updated'))
+        self.assertEqual(quote_shipping(100, 'Singapore', None, 1), Decimal('290.00'))
+        
+        # Running the same file again only updates
+        stats = ShippingRateImporter(batch_size=1).run(path)
+        self.assertEqual((stats.created, stats.updated), (0, 2))
+        self.assertEqual(ShippingRate.objects.count(), 2)
+    
+    def test_missing_column(self):
+        """Test that a sheet without a required column is rejected up front"""
+        path = self.write_csv('bad.csv', [('Zone', 'City'), ('north', 'Delhi')])
+        with self.assertRaises(ValueError):
+            PincodeImporter().run(path)
+        with self.assertRaises(CommandError):
+            call_command('import_shipping_data', 'pincodes', path, stdout=StringIO())
+    
+    def test_command(self):
+        """Test the import_shipping_data command"""
+        path = self.write_csv('pincodes.csv', [('Pincode', 'Zone'), ('560001', 'south'), ('560002', 'south')])
+        out = StringIO()
+        call_command('import_shipping_data', 'pincodes', path, stdout=out)
+        self.assertIn('Created: 2', out.getvalue())
+        self.assertEqual(PincodeZone.objects.filter(zone=self.south).count(), 3)
+        
+        # Rows identical to the stored ones are read but not written
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_shipping_data', 'pincodes', path, stdout=out)
+        self.assertIn('Unchanged: 2', out.getvalue())
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('INSERT')])
+    
+    def test_admin_import_and_sample(self):
+        """Test the admin upload view and sample download"""
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin_user)
+        
+        response = self.client.get(reverse('admin:import_pincode_excel'))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('admin:export_pincode_sample'))
+        self.assertEqual(response.status_code, 200)
+        sample = os.path.join(self.tmpdir, 'sample.xlsx')
+        with open(sample, 'wb') as f:
+            f.write(response.content)
+        
+        with open(sample, 'rb') as f:
+            upload = SimpleUploadedFile('sample.xlsx', f.read())
+        response = self.client.post(reverse('admin:import_pincode_excel'), {'excel_file': upload})
+        self.assertRedirects(response, reverse('admin:shop_pincodezone_changelist'))
+        self.assertTrue(PincodeZone.objects.filter(pincode='600001', zone=self.south).exists())
+        
+        upload = SimpleUploadedFile('rates.csv', b'Name,Country,Cost\nGermany Standard,Germany,600\n')
+        response = self.client.post(reverse('admin:shippingrate_import_excel'), {'excel_file': upload})
+        self.assertRedirects(response, reverse('admin:shop_shippingrate_changelist'))
+        self.assertTrue(ShippingRate.objects.filter(country='Germany', cost=Decimal('600.00')).exists())
+    
+    def test_admin_import_size_limit(self):
+        """Test that the admin sends files too large to import in a request to the command"""
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        upload = SimpleUploadedFile('pincodes.csv', b'Pincode,Zone\n600001,south\n')
+        with override_settings(SHIPPING_ADMIN_IMPORT_MAX_SIZE=10):
+            response = self.client.post(reverse('admin:import_pincode_excel'), {'excel_file': upload}, follow=True)
+        self.assertContains(response, 'python manage.py import_shipping_data pincodes pincodes.csv')
+        self.assertFalse(PincodeZone.objects.filter(pincode='600001').exists())
+    
+    def test_version_bumped_per_batch(self):
+        """Test that batches written before an import dies are already quoted"""
+        path = self.write_csv('pincodes.csv', [
+            ('Pincode', 'Zone'), ('600001', 'south'), ('600002', 'south'), ('400001', 'north'),
+        ])
+        self.assertIsNone(get_shipping_tables().lookup('600001', 'India'))
+        importer = PincodeImporter(batch_size=2)
+        original = importer.write_batch
+        
+        def fail_second_batch(batch):
+            if PincodeZone.objects.filter(pincode='600001').exists():
+                raise RuntimeError('worker killed')
+            return original(batch)
+        
+        with mock.patch.object(importer, 'write_batch', side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                importer.run(path)
+        self.assertEqual(get_shipping_tables().lookup('600001', 'India'), (self.south.id, 'India'))
+        self.assertIsNone(get_shipping_tables().lookup('400001', 'India'))
+
+
+class CartShippingTest(TestCase):
+    """Test cart weight and shipping quotes from the shipping tables"""
+    
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.ring = Product.objects.create(
+            name='Ring', slug='ring', category=self.category, description='Test product',
+            price=Decimal('400.00'), stock=10, weight_kg=Decimal('0.250')
+        )
+        self.lamp = Product.objects.create(
+            name='Lamp', slug='lamp', category=self.category, description='Test product',
+            price=Decimal('100.00'), stock=10, weight_kg=Decimal('1.500')
+        )
+        south = ShippingZone.objects.create(
+            zone='south', cost_per_kg=Decimal('40.00'), free_shipping_threshold=Decimal('2000.00')
+        )
+        PincodeZone.objects.create(pincode='600001', zone=south)
+        ShippingRate.objects.create(name='India', country='India', cost=Decimal('60.00'))
+        self.user = User.objects.create_user(username='buyer', password='testpass123')
+    
+    def test_weight_and_quotes_without_product_queries(self):
+        """Test that weight comes from the stored lines and quotes are memoized"""
+        for storage in ('shop.cart.SessionCartStorage', 'shop.cart.DatabaseCartStorage'):
+            with self.subTest(storage=storage), override_settings(CART_STORAGE=storage):
+                request = type('Request', (), {'session': self.client.session, 'user': self.user})()
+                cart = Cart(request)
+                cart.clear()
+                cart.add(self.ring, quantity=2)
+                cart.add(self.lamp, quantity=1)
+                
+                cart = Cart(request)
+                get_shipping_tables()
+                with self.assertNumQueries(0):
+                    self.assertEqual(cart.get_total_weight(), Decimal('2.000'))
+                    self.assertEqual(cart.get_shipping_cost('India', '600001'), Decimal('80.00'))
+                    self.assertEqual(cart.get_shipping_cost('India', '600001'), Decimal('80.00'))
+                    self.assertEqual(cart.get_shipping_cost(), Decimal('120.00'))
+                
+                cart.update(self.lamp, 3)
+                self.assertEqual(cart.get_total_weight(), Decimal('5.000'))
+                self.assertEqual(cart.get_shipping_cost('India', '600001'), Decimal('200.00'))
+    
+    @override_settings(CART_STORAGE='shop.cart.SessionCartStorage')
+    def test_lines_without_weight(self):
+        """Test that session lines stored before weights were tracked are looked up once"""
+        session = self.client.session
+        session['cart'] = {str(self.lamp.id): {'quantity': 2, 'price': '100.00'}}
+        session.save()
+        cart = Cart(type('Request', (), {'session': session})())
+        with self.assertNumQueries(1):
+            self.assertEqual(cart.get_total_weight(), Decimal('3.000'))
+            cart.get_total_weight()
+    
+    def test_checkout_uses_destination(self):
+        """Test the shipping AJAX endpoint and order creation price by pincode and weight"""
+        self.client.force_login(self.user)
+        self.client.post(reverse('shop:cart_add', kwargs={'product_id': self.ring.id}), {'quantity': 2})
+        self.client.post(reverse('shop:cart_add', kwargs={'product_id': self.lamp.id}), {'quantity': 1})
+        
+        response = self.client.post(reverse('shop:calculate_shipping_ajax'), {'pincode': '600001', 'country': 'India'})
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual((data['shipping_cost'], data['total_weight_kg']), (80.0, 2.0))
+        
+        self.client.post(reverse('shop:order_create'), {
+            'first_name': 'Test', 'last_name': 'User', 'email': 'test@example.com',
+            'phone': '1234567890', 'address_line_1': '123 Test St', 'city': 'Chennai',
+            'state': 'Tamil Nadu', 'postal_code': '600001', 'country': 'India',
+            'payment_method': 'razorpay',
+        })
+        self.assertEqual(Order.objects.get().shipping_cost, Decimal('80.00'))
+
+
+class CurrencyPriceBookTest(TestCase):
+    """Test currency rates, precomputed product prices and the price tags"""
+    
+    def setUp(self):
+        cache.clear()
+        CurrencyRate.objects.update_or_create(code='USD', defaults={
+            'name': 'US Dollar', 'symbol': '$', 'rate': Decimal('0.012'), 'rounding': 'charm',
+        })
+        CurrencyRate.objects.create(code='JPY', name='Yen', symbol='¥', rate=Decimal('1.8'), decimal_places=0, rounding='charm')
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.product = Product.objects.create(
+            name='Ring', slug='ring', category=self.category, description='Test product',
+            price=Decimal('1000.00'), stock=10
+        )
+    
+    def test_rounding(self):
+        """Test exact, whole and charm rounding"""
+        self.assertEqual(round_price(Decimal('12.345'), 2), Decimal('12.35'))
+        self.assertEqual(round_price(Decimal('12.01'), 2, 'whole'), Decimal('13.00'))
+        self.assertEqual(round_price(Decimal('12.34'), 2, 'charm'), Decimal('12.99'))
+        self.assertEqual(round_price(Decimal('1234'), 0, 'charm'), Decimal('1239'))
+        self.assertEqual(round_price(Decimal('12.00'), 2, 'charm'), Decimal('11.99'))
+    
+    def test_prices_precomputed_on_save(self):
+        """Test that saving a product stores its price in every active currency"""
+        entry = Product.objects.get(pk=self.product.pk).converted_prices
+        self.assertEqual((entry['USD'], entry['JPY'], entry['price']), ('11.99', '1799', '1000.00'))
+        
+        book = get_price_book()
+        with self.assertNumQueries(0):
+            self.assertEqual(book.product_price(self.product, 'USD'), Decimal('11.99'))
+            self.assertEqual(book.product_price(self.product, 'INR'), Decimal('1000.00'))
+            self.assertEqual(book.product_price(self.product, 'XYZ'), Decimal('1000.00'))
+    
+    def test_stale_entries_fall_back(self):
+        """Test that rate changes and bulk price updates never show a stale price"""
+        CurrencyRate.objects.filter(code='USD').update(rate=Decimal('0.02'))
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('2000.00'))
+        product = Product.objects.get(pk=self.product.pk)
+        
+        # update() skips the signals, so nothing has told the price book yet
+        self.assertEqual(get_price_book().product_price(product, 'USD'), Decimal('23.99'))
+        CurrencyRate.objects.get(code='USD').save()
+        self.assertEqual(get_price_book().product_price(product, 'USD'), Decimal('39.99'))
+        
+        self.assertEqual(rebuild_price_book(batch_size=1), 1)
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.converted_prices['USD'], '39.99')
+        self.assertEqual(product.converted_prices['rates'], get_price_book().fingerprint)
+    
+    def test_change_from_another_worker(self):
+        """Test that a rate changed by another process is used once this worker's cached version expires"""
+        # Publish setUp's changes as if they had been committed
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version('currency')
+        self.assertEqual(convert_price(1000, 'INR', 'USD'), Decimal('12.00'))
+        
+        # Another worker edits the rate; only the database counter moves
+        CurrencyRate.objects.filter(code='USD').update(rate=Decimal('0.02'))
+        VersionCounter.objects.filter(name='currency').update(value=F('value') + 1)
+        self.assertEqual(convert_price(1000, 'INR', 'USD'), Decimal('12.00'))
+        cache.delete(version_key('currency'))
+        self.assertEqual(convert_price(1000, 'INR', 'USD'), Decimal('20.00'))
+    
+    def test_inactive_currency(self):
+        """Test that deactivated currencies can't be chosen and show INR"""
+        session = self.client.session
+        request = type('Request', (), {'session': session})()
+        self.assertTrue(set_currency(request, 'jpy'))
+        self.assertEqual(session['currency'], 'JPY')
+        CurrencyRate.objects.filter(code='JPY').update(is_active=False)
+        CurrencyRate.objects.get(code='USD').save()
+        self.assertFalse(set_currency(request, 'JPY'))
+        self.assertEqual(get_price_book().product_price(self.product, 'JPY'), Decimal('1000.00'))
+    
+    def test_convert_price(self):
+        """Test Decimal conversion both ways and between currencies"""
+        self.assertEqual(convert_price(1000, 'INR', 'USD'), Decimal('12.00'))
+        self.assertEqual(convert_price(12, 'USD', 'INR'), Decimal('1000.00'))
+        self.assertEqual(convert_price(12, 'USD', 'JPY'), Decimal('1800'))
+    
+    def test_price_tags(self):
+        """Test the template tags render rounded prices in the session currency"""
+        template = Template('{% load currency_tags %}{% product_price product %}|{% show_price 1000 %}')
+        for currency, expected in (('USD', '$11.99|$12.00'), ('JPY', '¥1,799|¥1,800')):
+            request = type('Request', (), {'session': {'currency': currency}})()
+            self.assertEqual(template.render(Context({'request': request, 'product': self.product})), expected)
+    
+    def test_update_currency_rates_command(self):
+        """Test loading rates from JSON and CSV and repricing products"""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'rates.json')
+        with open(path, 'w') as f:
+            json.dump({'USD': {'rate': '0.02', 'rounding': 'exact'}, 'aed': '0.044'}, f)
+        out = StringIO()
+        call_command('update_currency_rates', path, stdout=out)
+        self.assertIn('Created: 1', out.getvalue())
+        entry = Product.objects.get(pk=self.product.pk).converted_prices
+        self.assertEqual((entry['USD'], entry['AED']), ('20.00', '44.00'))
+        
+        path = os.path.join(tmpdir, 'rates.csv')
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows([('code', 'rate', 'is_active'), ('AED', '0.05', 'no')])
+        call_command('update_currency_rates', path, stdout=StringIO())
+        self.assertNotIn('AED', Product.objects.get(pk=self.product.pk).converted_prices)
+        
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows([('code', 'rate'), ('INR', '1')])
+        with self.assertRaises(CommandError):
+            call_command('update_currency_rates', path, stdout=StringIO())
+
+
+class PriceFormattingTest(TestCase):
+    """Test exact price formatting and the batch price tag"""
+    
+    def setUp(self):
+        cache.clear()
+        CurrencyRate.objects.update_or_create(code='USD', defaults={'symbol': '$', 'rate': Decimal('0.012')})
+        self.category = Category.objects.create(name='Test Category', slug='test-category')
+        self.products = [
+            Product.objects.create(
+                name=f'Ring {i}', slug=f'ring-{i}', category=self.category, description='Test product',
+                price=Decimal('125000.50') * i, stock=10
+            )
+            for i in (1, 2)
+        ]
+    
+    def test_digit_grouping(self):
+        """Test Indian and western grouping"""
+        self.assertEqual(group_digits('100000', 'indian'), '1,00,000')
+        self.assertEqual(group_digits('123456789', 'indian'), '12,34,56,789')
+        self.assertEqual(group_digits('1234567'), '1,234,567')
+        self.assertEqual(group_digits('999', 'indian'), '999')
+    
+    def test_formatter(self):
+        """Test that formatting is exact and remembers results"""
+        rupees = PriceFormatter('₹', grouping='indian')
+        self.assertEqual(rupees(Decimal('100000')), '₹1,00,000.00')
+        self.assertEqual(rupees(Decimal('-1234.565')), '-₹1,234.57')
+        self.assertEqual(rupees('0.1'), '₹0.10')
+        self.assertEqual(PriceFormatter('¥', places=0)(Decimal('1234567.5')), '¥1,234,568')
+        self.assertEqual(rupees(Decimal('99999999999999.99')), '₹9,99,99,99,99,99,999.99')
+        self.assertIn(Decimal('100000'), rupees.memo)
+    
+    def test_currency_resolved_once_per_request(self):
+        """Test that a page of prices reads the session and rates once"""
+        request = type('Request', (), {'session': {'currency': 'USD'}})()
+        template = Template('{% load currency_tags %}{% for p in products %}{% product_price p %}{% show_price p.price %}{% endfor %}')
+        get_price_book()
+        with mock.patch('shop.currency.get_currency', return_value='USD') as get_currency, self.assertNumQueries(0):
+            template.render(Context({'request': request, 'products': self.products * 50}))
+        self.assertEqual(get_currency.call_count, 1)
+    
+    def test_prices_tag(self):
+        """Test that {% prices %} sets display prices on every product"""
+        template = Template(
+            "{% load currency_tags %}{% prices products 'compare_at_price' 'discounted_price' %}"
+            "{% for p in products %}{{ p.display_price }}/{{ p.display_compare_at_price }}/{{ p.display_discounted_price }};{% endfor %}"
+        )
+        self.products[0].compare_at_price = Decimal('150000.00')
+        for currency, expected in (
+            ('INR', '₹1,25,000.50/₹1,50,000.00/;₹2,50,001.00//;'),
+            ('USD', '$1,500.01/$1,800.00/;$3,000.01//;'),
+        ):
+            request = type('Request', (), {'session': {'currency': currency}})()
+            self.assertEqual(template.render(Context({'request': request, 'products': self.products})), expected)
+    
+    def test_category_page_prices(self):
+        """Test that category cards show converted prices and follow rate changes"""
+        url = self.category.get_absolute_url()
+        self.assertContains(self.client.get(url), '₹1,25,000.50')
+        session = self.client.session
+        session['currency'] = 'USD'
+        session.save()
+        self.assertContains(self.client.get(url), '$1,500.01')
+        CurrencyRate.objects.filter(code='USD').update(rate=Decimal('0.02'))
+        CurrencyRate.objects.get(code='USD').save()
+        self.assertContains(self.client.get(url), '$2,500.01')
+
+
+@override_settings(SITEMAP_CHUNK_SIZE=3, SITEMAP_BASE_URL='https://shop.example')
+class SitemapTest(TestCase):
+    """Test the sitemap index and the precompressed product chunks"""
+    
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.directory)
+        self.settings_override.enable()
+        self.category = Category.objects.create(name='Rings', slug='rings')
+        self.products = [
+            Product.objects.create(
+                name=f'Ring {i}', slug=f'ring-{i}', category=self.category, description='Test product',
+                price=Decimal('10.00'), stock=1
+            )
+            for i in range(5)
+        ]
+        self.numbers = sorted({(product.id - 1) // 3 + 1 for product in self.products})
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def chunk_xml(self, number):
+        response = self.client.get(reverse('sitemap_products', kwargs={'number': number}))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        return gzip.decompress(response.content).decode()
+    
+    def test_index_and_chunks(self):
+        """Test that the index lists every chunk and chunks hold every available product"""
+        response = self.client.get('/sitemap.xml')
+        self.assertEqual(response.status_code, 200)
+        index = response.content.decode()
+        self.assertIn('<loc>https://shop.example/sitemap-categories.xml</loc>', index)
+        for number in self.numbers:
+            self.assertIn(f'<loc>https://shop.example/sitemap-products-{number}.xml.gz</loc>', index)
+        
+        urls = ''.join(self.chunk_xml(number) for number in self.numbers)
+        for product in self.products:
+            self.assertIn(f'<loc>https://shop.example{product.get_absolute_url()}</loc>', urls)
+        
+        response = self.client.get(reverse('sitemap_products', kwargs={'number': self.numbers[0]}))
+        response = self.client.get(
+            reverse('sitemap_products', kwargs={'number': self.numbers[0]}),
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(reverse('sitemap_products', kwargs={'number': 9999})).status_code, 404)
+        self.assertContains(self.client.get('/sitemap-categories.xml'), '/category/rings/')
+    
+    def test_incremental_refresh(self):
+        """Test that only chunks whose products changed are rewritten"""
+        self.assertEqual(refresh_sitemaps(), self.numbers)
+        self.assertEqual(refresh_sitemaps(), [])
+        
+        last = self.products[-1]
+        last.name = 'Renamed'
+        last.save()
+        self.assertEqual(refresh_sitemaps(), [self.numbers[-1]])
+        
+        first = self.products[0]
+        first.available = False
+        first.save()
+        self.assertEqual(refresh_sitemaps(), [self.numbers[0]])
+        self.assertNotIn(first.slug, self.chunk_xml(self.numbers[0]))
+        
+        # A chunk whose products are all gone is removed with its file
+        old_file = SitemapChunk.objects.get(number=self.numbers[-1]).file
+        Product.objects.filter(id__gte=(self.numbers[-1] - 1) * 3 + 1).delete()
+        self.assertEqual(refresh_sitemaps(), [])
+        self.assertFalse(SitemapChunk.objects.filter(number=self.numbers[-1]).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.directory, old_file)))
+    
+    def test_index_last_modified_follows_chunk_set(self):
+        """Test that removing a chunk or changing the base URL moves the index's Last-Modified"""
+        modified = self.client.get('/sitemap.xml')['Last-Modified']
+        response = self.client.get('/sitemap.xml', HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)
+        
+        # Only the last chunk goes: no chunk left is rewritten
+        last = self.numbers[-1]
+        Product.objects.filter(id__gte=(last - 1) * 3 + 1).delete()
+        bump_catalog_version()
+        response = self.client.get('/sitemap.xml', HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], modified)
+        self.assertNotIn(f'sitemap-products-{last}.xml.gz', response.content.decode())
+        
+        modified = response['Last-Modified']
+        with override_settings(SITEMAP_BASE_URL='https://other.example'):
+            response = self.client.get('/sitemap.xml', HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], modified)
+        self.assertIn('<loc>https://other.example/sitemap-categories.xml</loc>', response.content.decode())
+    
+    def test_refresh_follows_catalog_version(self):
+        """Test that crawler hits cost no queries until the catalog changes"""
+        ensure_sitemaps()
+        with self.assertNumQueries(0):
+            ensure_sitemaps()
+        self.products[0].save()
+        with mock.patch('shop.sitemaps.refresh_sitemaps') as refresh:
+            ensure_sitemaps()
+        refresh.assert_called_once_with()
+    
+    def test_category_lastmod(self):
+        """Test that a category's lastmod follows its newest available product"""
+        Product.objects.filter(pk=self.products[2].pk).update(updated_at=timezone.now() + timedelta(days=1))
+        category = CategorySitemap().items().get()
+        self.assertEqual(CategorySitemap().lastmod(category), Product.objects.get(pk=self.products[2].pk).updated_at)
+    
+    def test_build_sitemaps_command(self):
+        """Test the management command writes and then force-rewrites chunks"""
+        out = StringIO()
+        call_command('build_sitemaps', stdout=out)
+        self.assertEqual(SitemapChunk.objects.count(), len(self.numbers))
+        out = StringIO()
+        call_command('build_sitemaps', '--force', stdout=out)
+        self.assertIn(f"Rewritten: {', '.join(map(str, self.numbers))}", out.getvalue())
@@ -22,6 +22,8 @@ urlpatterns = [
     path('product/<slug:slug>/', views.ProductDetailView.as_view(), name='product_detail'),
     path('category/<slug:slug>/', views.CategoryDetailView.as_view(), name='category_detail'),
     path('search/', views.ProductSearchView.as_view(), name='product_search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
+    path('search/facets/', views.search_facets, name='search_facets'),
     
     # User profile (keeping these as they're custom)
     path('profile/', views.ProfileView.as_view(), name='profile'),
@@ -51,6 +53,7 @@ urlpatterns = [
     
     # Shipping calculation
     path('ajax/calculate-shipping/', views.calculate_shipping_ajax, name='calculate_shipping_ajax'),
+    path('api/shipping/quotes/', views.shipping_quotes_api, name='shipping_quotes'),
     
     # Wishlist
     path('wishlist/', views.WishlistView.as_view(), name='wishlist'),
@@ -1,11 +1,17 @@
 """
 Utility views for handling special requests
 """
-from django.http import JsonResponse, HttpResponse
+from django.core.files.storage import default_storage
+from django.http import JsonResponse, HttpResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
 
+from .models import SitemapChunk
+from .sitemaps import ensure_sitemaps, get_base_url, get_index_modified, render_index, sitemaps
+
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -102,4 +108,49 @@ def security_txt(request):
         "Preferred-Languages: en",
         "Canonical: https://fashionstore.com/.well-known/security.txt"
     ]
-    return HttpResponse("\n".join(lines), content_type="text/plain")
\ No newline at end of file
+    return HttpResponse("\n".join(lines), content_type="text/plain")
+
+
+def sitemap_response(request, content, content_type, modified):
+    """
+    Respond with content(), or 304 Not Modified if the crawler's copy is current
+    
+    content is only called when the body is actually sent.
+    """
+    timestamp = int(modified.timestamp()) if modified else None
+    response = get_conditional_response(request, last_modified=timestamp)
+    if response is None:
+        response = HttpResponse(content(), content_type=content_type)
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+@require_http_methods(["GET", "HEAD"])
+def sitemap_index(request):
+    """
+    Handle sitemap.xml requests
+    Returns the sitemap index: the static and category sitemaps and every product chunk
+    """
+    ensure_sitemaps()
+    return sitemap_response(
+        request, lambda: render_index(sitemaps, SitemapChunk.objects.all(), get_base_url()),
+        'application/xml', get_index_modified()
+    )
+
+
+@require_http_methods(["GET", "HEAD"])
+def sitemap_products(request, number):
+    """
+    Handle product sitemap chunk requests
+    Serves the precompressed .xml.gz file as stored
+    """
+    ensure_sitemaps()
+    chunk = SitemapChunk.objects.filter(number=number).first()
+    if chunk is None:
+        raise Http404('No such sitemap')
+    
+    def content():
+        with default_storage.open(chunk.file, 'rb') as f:
+            return f.read()
+    return sitemap_response(request, content, 'application/gzip', chunk.generated_at)
@@ -0,0 +1,101 @@
+"""
+Shared change counters for per-process data
+
+The catalog, shipping tables and currency rates are held in memory by
+every worker, each copy tagged with the version it was loaded at. The
+counters live in the database (VersionCounter) and are bumped with an
+atomic UPDATE, so two concurrent writes always get different versions,
+and every worker sees a bump whatever the cache backend: with a
+per-process cache such as LocMemCache a worker that didn't make the
+change picks it up within VERSION_CHECK_INTERVAL seconds.
+
+Reads go through the cache, so checking a version normally costs a cache
+lookup and, per worker, one primary-key query every few seconds.
+
+A bump made inside a transaction is only published once it commits:
+until then other workers keep the old version (a copy they rebuilt now
+would read the pre-commit rows and be tagged with the new version), and
+only the thread that made the change sees the new one.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import VersionCounter
+
+
+# Per thread: name -> (version, publish callback) for bumps not yet committed
+_pending = threading.local()
+
+
+def version_key(name):
+    return f'shop:version:{name}'
+
+
+def get_check_interval():
+    return getattr(settings, 'VERSION_CHECK_INTERVAL', 2)
+
+
+def pending_version(name):
+    """The version this thread bumped name to in a transaction still open, or None"""
+    pending = getattr(_pending, 'versions', {}).get(name)
+    if pending is None:
+        return None
+    version, publish = pending
+    # A rolled back transaction discards its on_commit callbacks
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(entry[1] is publish for entry in connection.run_on_commit):
+        return version
+    del _pending.versions[name]
+    return None
+
+
+def get_version(name):
+    """Return the current value of a counter (0 if it was never bumped)"""
+    version = pending_version(name)
+    if version is not None:
+        return version
+    key = version_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = VersionCounter.objects.filter(name=name).values_list('value', flat=True).first() or 0
+        cache.set(key, version, get_check_interval())
+    return version
+
+
+def bump_version(name):
+    """Record a change and return the counter's new value"""
+    with transaction.atomic():
+        if not VersionCounter.objects.filter(name=name).update(value=F('value') + 1):
+            try:
+                with transaction.atomic():
+                    # Start from the clock so a recreated counter can't reuse
+                    # a version still held by a worker
+                    VersionCounter.objects.create(name=name, value=time.time_ns() // 1000)
+            except IntegrityError:
+                # Created by a concurrent bump
+                VersionCounter.objects.filter(name=name).update(value=F('value') + 1)
+        version = VersionCounter.objects.filter(name=name).values_list('value', flat=True).get()
+
+    if not transaction.get_connection().in_atomic_block:
+        cache.set(version_key(name), version, get_check_interval())
+        return version
+
+    def publish():
+        versions = getattr(_pending, 'versions', {})
+        if versions.get(name, (None, None))[1] is publish:
+            del versions[name]
+        # Dropped rather than set, so transactions committing out of order
+        # can't publish an older version
+        cache.delete(version_key(name))
+
+    if not hasattr(_pending, 'versions'):
+        _pending.versions = {}
+    _pending.versions[name] = (version, publish)
+    transaction.on_commit(publish)
+    return version
@@ -20,12 +20,12 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponseRedirect, HttpResponse
 from django.urls import reverse_lazy, reverse
-from django.db.models import Q, Avg, Count
+from django.db import transaction
+from django.db.models import Count
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
-from django.core.paginator import Paginator
 
 # Import payment libraries
 import razorpay
@@ -39,8 +39,20 @@ from .forms import (
     UserProfileForm, CheckoutForm, 
     CartAddProductForm, ProductReviewForm, ProductSearchForm
 )
-from .cart import Cart
+from .cart import get_cart
+from .catalog import get_categories
+from .home import get_home_snapshot
+from .pagination import KeysetPaginator, KeysetPaginationMixin, paginate_request
+from .inventory import (
+    InsufficientStock, reserve_stock, line_quantities, get_reservation_expiry, confirm_reservation
+)
+from .search import get_search_backend
+from .suggest import suggestion_index
+from .facets import get_facets, add_facet_links
 from .currency import get_currency, set_currency, convert_price, format_price
+from .shipping import (
+    SHIPPING_QUOTE_BATCH_LIMIT, SHIPPING_QUOTE_MAX_CART_TOTAL, SHIPPING_QUOTE_MAX_WEIGHT, get_shipping_tables
+)
 
 
 class DecimalEncoder(json.JSONEncoder):
@@ -56,7 +68,7 @@ def safe_json_response(data, **kwargs):
     return JsonResponse(data, encoder=DecimalEncoder, **kwargs)
 
 
-class ProductListView(ListView):
+class ProductListView(KeysetPaginationMixin, ListView):
     """Display list of all available products with pagination"""
     model = Product
     template_name = 'shop/product_list_enhanced.html'
@@ -69,7 +81,7 @@ class ProductListView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
+        context['categories'] = get_categories()
         context['featured_products'] = Product.objects.filter(
             available=True
         ).order_by('-created_at')[:4]
@@ -82,11 +94,8 @@ class PremiumHomeView(TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['featured_products'] = Product.objects.filter(
-            available=True
-        ).order_by('-created_at')[:6]
-        context['products'] = Product.objects.filter(available=True)
+        # Fixed-size sections from a cached snapshot, independent of catalog size
+        context.update(get_home_snapshot())
         return context
 
 
@@ -96,9 +105,12 @@ class ProductDetailView(DetailView):
     template_name = 'shop/product_detail_luxury.html'
     context_object_name = 'product'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('category')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = self.get_object()
+        product = self.object
         
         # Add to cart form
         context['cart_product_form'] = CartAddProductForm()
@@ -109,22 +121,16 @@ class ProductDetailView(DetailView):
             available=True
         ).exclude(id=product.id)[:4]
         
-        # Product reviews
-        context['reviews'] = Review.objects.filter(product=product).select_related('user')
+        # Product reviews; the average, count and histogram are stored on the product
+        reviews = list(Review.objects.filter(product=product).select_related('user'))
+        context['reviews'] = reviews
         context['review_form'] = ProductReviewForm()
         
-        # Average rating
-        avg_rating = Review.objects.filter(product=product).aggregate(
-            avg_rating=Avg('rating')
-        )['avg_rating']
-        context['avg_rating'] = round(avg_rating, 1) if avg_rating else 0
-        context['review_count'] = Review.objects.filter(product=product).count()
-        
         # Check if user has already reviewed this product
         if self.request.user.is_authenticated:
-            context['user_review'] = Review.objects.filter(
-                product=product, user=self.request.user
-            ).first()
+            context['user_review'] = next(
+                (review for review in reviews if review.user_id == self.request.user.id), None
+            )
             
             # Check if product is in wishlist
             context['in_wishlist'] = Wishlist.objects.filter(
@@ -142,16 +148,12 @@ class CategoryDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        category = self.get_object()
-        
-        # Get products in this category with pagination
-        products = Product.objects.filter(
-            category=category, available=True
-        ).order_by('-created_at')
+        category = self.object
         
-        paginator = Paginator(products, 12)
-        page_number = self.request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        # Get products in this category with keyset pagination
+        products = Product.objects.filter(category=category, available=True)
+        paginator = KeysetPaginator(products, 12, key=f'category:{category.id}')
+        page_obj = paginate_request(self.request, paginator)
         
         context['products'] = page_obj
         context['is_paginated'] = page_obj.has_other_pages()
@@ -160,6 +162,20 @@ class CategoryDetailView(DetailView):
         return context
 
 
+def get_search_params(request):
+    """Return (query, filters) from the search form in request.GET"""
+    form = ProductSearchForm(request.GET)
+    if not form.is_valid():
+        return '', {}
+    
+    data = form.cleaned_data
+    filters = {
+        name: data.get(name)
+        for name in ('category', 'min_price', 'max_price', 'size', 'color', 'brand')
+    }
+    return data.get('query') or '', filters
+
+
 class ProductSearchView(ListView):
     """Search products with filters"""
     model = Product
@@ -169,46 +185,16 @@ class ProductSearchView(ListView):
 
     def get_queryset(self):
         """Filter products based on search criteria"""
-        queryset = Product.objects.filter(available=True)
-        form = ProductSearchForm(self.request.GET)
-        
-        if form.is_valid():
-            query = form.cleaned_data.get('query')
-            category = form.cleaned_data.get('category')
-            min_price = form.cleaned_data.get('min_price')
-            max_price = form.cleaned_data.get('max_price')
-            size = form.cleaned_data.get('size')
-            color = form.cleaned_data.get('color')
-            
-            if query:
-                queryset = queryset.filter(
-                    Q(name__icontains=query) |
-                    Q(description__icontains=query) |
-                    Q(category__name__icontains=query) |
-                    Q(brand__icontains=query)
-                )
-            
-            if category:
-                queryset = queryset.filter(category__slug=category)
-            
-            if min_price:
-                queryset = queryset.filter(price__gte=min_price)
-            
-            if max_price:
-                queryset = queryset.filter(price__lte=max_price)
-            
-            if size:
-                queryset = queryset.filter(size=size)
-            
-            if color:
-                queryset = queryset.filter(color=color)
-        
-        return queryset.select_related('category').order_by('-created_at')
+        query, filters = get_search_params(self.request)
+        return get_search_backend().search(query=query, **filters)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_form'] = ProductSearchForm(self.request.GET)
-        context['categories'] = Category.objects.all()
+        
+        # Facet counts for the sidebar (cached per normalized filter set)
+        query, filters = get_search_params(self.request)
+        context['facets'] = add_facet_links(get_facets(query, **filters), self.request.GET)
         
         # Add search query to context for display
         query = self.request.GET.get('query', '')
@@ -255,7 +241,7 @@ class CartDetailView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart = Cart(self.request)
+        cart = get_cart(self.request)
         context['cart'] = cart
         return context
 
@@ -264,7 +250,7 @@ class CartAddView(View):
     """Add product to cart"""
     
     def post(self, request, product_id):
-        cart = Cart(request)
+        cart = get_cart(request)
         product = get_object_or_404(Product, id=product_id)
         
         # Check if product is available and in stock
@@ -353,7 +339,7 @@ class CartRemoveView(View):
     """Remove product from cart"""
     
     def post(self, request, product_id):
-        cart = Cart(request)
+        cart = get_cart(request)
         product = get_object_or_404(Product, id=product_id)
         cart.remove(product)
         messages.success(request, f'{product.name} removed from cart!')
@@ -372,7 +358,7 @@ class CartUpdateView(View):
     """Update product quantity in cart"""
     
     def post(self, request, product_id):
-        cart = Cart(request)
+        cart = get_cart(request)
         product = get_object_or_404(Product, id=product_id)
         quantity = int(request.POST.get('quantity', 1))
         
@@ -398,7 +384,7 @@ class CartClearView(View):
     """Clear all items from cart"""
     
     def post(self, request):
-        cart = Cart(request)
+        cart = get_cart(request)
         cart.clear()
         messages.success(request, 'Cart cleared!')
         return redirect('shop:cart_detail')
@@ -412,7 +398,7 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart = Cart(self.request)
+        cart = get_cart(self.request)
         
         if cart.is_empty():
             messages.error(self.request, 'Your cart is empty!')
@@ -424,7 +410,7 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
 
     def dispatch(self, request, *args, **kwargs):
         """Check if cart is not empty"""
-        cart = Cart(request)
+        cart = get_cart(request)
         if cart.is_empty():
             messages.error(request, 'Your cart is empty!')
             return redirect('shop:cart_detail')
@@ -435,7 +421,7 @@ class OrderCreateView(LoginRequiredMixin, View):
     """Create a new order"""
     
     def post(self, request):
-        cart = Cart(request)
+        cart = get_cart(request)
         
         if cart.is_empty():
             messages.error(request, 'Your cart is empty!')
@@ -444,27 +430,46 @@ class OrderCreateView(LoginRequiredMixin, View):
         form = CheckoutForm(request.POST, user=request.user)
         
         if form.is_valid():
-            # Check stock availability before creating order
-            for item in cart:
-                product = item['product']
-                if product.stock < item['quantity']:
-                    messages.error(
-                        request, 
-                        f"Sorry, {product.name} only has {product.stock} items in stock. Please update your cart."
-                    )
-                    return redirect('shop:cart_detail')
+            # Products are loaded once; every pass below reuses the same lines
+            lines = cart.get_lines()
             
-            # Create the order
-            order = form.save(commit=False)
-            order.user = request.user
-            order.total_amount = cart.get_total_price()
-            # Calculate shipping based on pincode
-            order.shipping_cost = cart.get_shipping_cost(
-                country=order.country, 
-                pincode=order.postal_code
-            )
-            order.tax_amount = cart.get_tax_amount()
-            order.save()
+            try:
+                with transaction.atomic():
+                    # Take the stock first; nothing is written if any product is short
+                    reserve_stock(line_quantities(lines))
+                    
+                    # Create the order
+                    order = form.save(commit=False)
+                    order.user = request.user
+                    order.total_amount = cart.get_total_price()
+                    # Calculate shipping based on pincode
+                    order.shipping_cost = cart.get_shipping_cost(
+                        country=order.country, 
+                        pincode=order.postal_code
+                    )
+                    order.tax_amount = cart.get_tax_amount()
+                    order.reservation_expires_at = get_reservation_expiry()
+                    order.save()
+                    
+                    # Create order items in a single INSERT
+                    OrderItem.objects.bulk_create([
+                        OrderItem(
+                            order=order,
+                            product=item['product'],
+                            price=item['price'],
+                            quantity=item['quantity']
+                        )
+                        for item in lines
+                    ])
+            except InsufficientStock as e:
+                for item in lines:
+                    product = item['product']
+                    if product.id in e.shortages:
+                        messages.error(
+                            request, 
+                            f"Sorry, {product.name} only has {e.shortages[product.id]} items in stock. Please update your cart."
+                        )
+                return redirect('shop:cart_detail')
             
             # Save address to user profile for future use
             if hasattr(request.user, 'userprofile'):
@@ -478,21 +483,6 @@ class OrderCreateView(LoginRequiredMixin, View):
                 profile.country = order.country
                 profile.save()
             
-            # Create order items
-            for item in cart:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item['product'],
-                    price=item['price'],
-                    quantity=item['quantity']
-                )
-            
-            # Reduce product stock (safe now because we checked availability)
-            for item in cart:
-                product = item['product']
-                product.stock -= item['quantity']
-                product.save()
-            
             # Clear the cart
             cart.clear()
             
@@ -572,6 +562,32 @@ class RazorpayPaymentView(LoginRequiredMixin, TemplateView):
         return context
 
 
+def complete_payment(request, order, success_message, payment_id=None):
+    """
+    Record a successful payment and redirect to the result page
+
+    An order paid after its reservation was released, once the stock
+    was sold elsewhere, is recorded as paid but stays cancelled until it
+    is refunded or backordered, instead of going out for processing.
+    """
+    in_stock = confirm_reservation(order)
+    order.payment_status = 'paid'
+    if payment_id:
+        order.payment_id = payment_id
+    if not in_stock:
+        order.save()
+        messages.error(
+            request,
+            f'Payment received, but some items in order {order.order_number} sold out while it was pending. '
+            'We will contact you about a refund or backorder.'
+        )
+        return redirect('shop:payment_failed')
+    order.status = 'processing'
+    order.save()
+    messages.success(request, success_message)
+    return redirect('shop:payment_success', order_number=order.order_number)
+
+
 @csrf_exempt
 def razorpay_verify(request):
     """Verify Razorpay payment - Function-based view for reliability"""
@@ -606,13 +622,9 @@ def razorpay_verify(request):
             client.utility.verify_payment_signature(params_dict)
             
             # Payment successful
-            order.payment_status = 'paid'
-            order.payment_id = payment_id
-            order.status = 'processing'
-            order.save()
-            
-            messages.success(request, 'Payment successful! Your order is being processed.')
-            return redirect('shop:payment_success', order_number=order.order_number)
+            return complete_payment(
+                request, order, 'Payment successful! Your order is being processed.', payment_id
+            )
             
         except razorpay.errors.SignatureVerificationError:
             # Payment verification failed
@@ -664,13 +676,9 @@ class RazorpayVerifyView(View):
                 client.utility.verify_payment_signature(params_dict)
                 
                 # Payment successful
-                order.payment_status = 'paid'
-                order.payment_id = payment_id
-                order.status = 'processing'
-                order.save()
-                
-                messages.success(request, 'Payment successful! Your order is being processed.')
-                return redirect('shop:payment_success', order_number=order.order_number)
+                return complete_payment(
+                    request, order, 'Payment successful! Your order is being processed.', payment_id
+                )
                 
             except razorpay.errors.SignatureVerificationError:
                 # Payment verification failed
@@ -769,12 +777,7 @@ class PayPalReturnView(LoginRequiredMixin, View):
         
         if payment.execute({"payer_id": payer_id}):
             # Payment successful
-            order.payment_status = 'paid'
-            order.status = 'processing'
-            order.save()
-            
-            messages.success(request, 'PayPal payment successful!')
-            return redirect('shop:payment_success', order_number=order.order_number)
+            return complete_payment(request, order, 'PayPal payment successful!')
         else:
             # Payment failed
             order.payment_status = 'failed'
@@ -917,6 +920,40 @@ class CurrencySwitchView(View):
 
 # AJAX Views
 
+@require_http_methods(["GET"])
+def search_facets(request):
+    """
+    AJAX endpoint for search facet counts
+    Returns: JSON with counts per category, size, color, brand and price bucket
+    """
+    query, filters = get_search_params(request)
+    return safe_json_response({
+        'query': query,
+        'facets': get_facets(query, **filters)
+    })
+
+
+@require_http_methods(["GET"])
+def search_suggest(request):
+    """
+    AJAX endpoint for search box typeahead
+    Returns: JSON list of category, brand and product suggestions
+    
+    Served from the per-worker suggestion index, so it is cheap enough
+    to call on every keystroke.
+    """
+    query = request.GET.get('query', '')[:100]
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), 20)
+    except ValueError:
+        limit = 8
+    
+    return safe_json_response({
+        'query': query,
+        'suggestions': suggestion_index.suggest(query, limit=limit)
+    })
+
+
 @require_http_methods(["POST"])
 def calculate_shipping_ajax(request):
     """
@@ -946,7 +983,7 @@ def calculate_shipping_ajax(request):
             })
         
         # Get cart
-        cart = Cart(request)
+        cart = get_cart(request)
         if cart.is_empty():
             return safe_json_response({
                 'success': False,
@@ -957,26 +994,17 @@ def calculate_shipping_ajax(request):
         cart_total = cart.get_total_price()
         total_weight = cart.get_total_weight()
         
-        # Import here to avoid circular import
-        from .models import PincodeZone, ShippingRate
+        # One in-memory table serves both the postal code check and the quote
+        tables = get_shipping_tables()
         
         # Try to get country from postal code database
         # If not found, use country from form
-        try:
-            pincode_obj = PincodeZone.objects.get(pincode=postal_code)
-            detected_country = pincode_obj.country
-            pincode_found = True
-        except PincodeZone.DoesNotExist:
-            detected_country = form_country
-            pincode_found = False
-        
-        # Calculate shipping
-        shipping_cost = ShippingRate.calculate_shipping_cost(
-            cart_total=cart_total,
-            country=detected_country,
-            pincode=postal_code,
-            total_weight_kg=total_weight
-        )
+        pincode_country = tables.get_country(postal_code, form_country)
+        pincode_found = pincode_country is not None
+        detected_country = pincode_country or form_country
+        
+        # Calculate shipping (memoized on the cart per destination)
+        shipping_cost = cart.get_shipping_cost(country=detected_country, pincode=postal_code)
         
         return safe_json_response({
             'success': True,
@@ -993,4 +1021,88 @@ def calculate_shipping_ajax(request):
         return safe_json_response({
             'success': False,
             'error': str(e)
-        })
\ No newline at end of file
+        })
+
+
+def parse_quote_destination(item):
+    """Return (pincode, country, weight, cart_total) for one requested destination; raises ValueError"""
+    if not isinstance(item, dict):
+        raise ValueError('Each destination must be an object')
+    pincode = str(item.get('pincode') or '').strip()
+    country = str(item.get('country') or '').strip()
+    if not country:
+        raise ValueError('Country is required')
+    try:
+        weight = Decimal(str(item.get('weight_kg', '1.0')))
+        cart_total = Decimal(str(item.get('cart_total', '0')))
+    except ArithmeticError:
+        raise ValueError('weight_kg and cart_total must be numbers')
+    if not (weight.is_finite() and cart_total.is_finite()) or weight <= 0 or cart_total < 0:
+        raise ValueError('weight_kg must be positive and cart_total not negative')
+    if weight > SHIPPING_QUOTE_MAX_WEIGHT or cart_total > SHIPPING_QUOTE_MAX_CART_TOTAL:
+        raise ValueError(
+            f'weight_kg may be at most {SHIPPING_QUOTE_MAX_WEIGHT} and cart_total at most {SHIPPING_QUOTE_MAX_CART_TOTAL}'
+        )
+    return pincode, country, weight, cart_total
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def shipping_quotes_api(request):
+    """
+    Price shipping to many destinations in one request
+    
+    Body: {"destinations": [{"pincode": "110001", "country": "India",
+    "weight_kg": 1.5, "cart_total": 2499}, ...]}
+    Returns: JSON with one quote (or error) per destination, in order
+    
+    Reads no session or cart state, so partners can call it directly. All
+    quotes come from one in-memory snapshot of the shipping tables.
+    """
+    try:
+        destinations = json.loads(request.body)['destinations']
+        if not isinstance(destinations, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return safe_json_response({
+            'success': False,
+            'error': 'Expected a JSON body with a "destinations" list'
+        }, status=400)
+    
+    limit = getattr(settings, 'SHIPPING_QUOTE_BATCH_LIMIT', SHIPPING_QUOTE_BATCH_LIMIT)
+    if len(destinations) > limit:
+        return safe_json_response({
+            'success': False,
+            'error': f'At most {limit} destinations per request'
+        }, status=400)
+    
+    parsed, errors = [], {}
+    for index, item in enumerate(destinations):
+        try:
+            parsed.append(parse_quote_destination(item))
+        except ValueError as e:
+            errors[index] = str(e)
+    
+    quotes = iter(get_shipping_tables().quote_many(parsed))
+    results = []
+    for index in range(len(destinations)):
+        if index in errors:
+            results.append({'success': False, 'error': errors[index]})
+            continue
+        quote = next(quotes)
+        results.append({
+            'success': True,
+            'pincode': quote.pincode,
+            'country': quote.country,
+            'pincode_found': quote.pincode_found,
+            'total_weight_kg': quote.weight,
+            'cart_total': quote.cart_total,
+            'shipping_cost': quote.cost,
+            'formatted_shipping': f'₹{quote.cost:,.2f}',
+        })
+    
+    return safe_json_response({
+        'success': True,
+        'count': len(results),
+        'quotes': results
+    })
@@ -3,6 +3,9 @@
 
 echo "🚀 Starting Fashion Store on Render..."
 
+# Report deployment problems (e.g. a cache that isn't shared between the workers)
+python manage.py check --deploy --settings=fashion_store.production_settings
+
 # Start Gunicorn server
 exec gunicorn fashion_store.wsgi:application \
     --bind 0.0.0.0:$PORT \